@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Optional, Tuple
+from collections import OrderedDict
+
+import app.const as const
+
+
+ReportKey = Tuple[int, str, int]
+
+
+class ReportCache:
+    """LRU cache of rendered report images, bounded by the number of entries
+    and their total size in bytes.
+
+    An entry is keyed by (user_id, month, version). The version is derived
+    from the data the report is rendered from, the daily totals and the
+    norm, so changed data never matches an old key. It doesn't depend on
+    the process which has made the change, and nothing is kept per user
+    besides the entries themselves"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+
+        self._entries: OrderedDict[ReportKey, bytes] = OrderedDict()
+        self._size: int = 0
+
+    def key(
+        self, user_id: int, month: str, data: dict[date, int], norm: int
+    ) -> ReportKey:
+        """Return a cache key for a report of the data"""
+        return user_id, month, hash((norm, tuple(data.items())))
+
+    def get(self, key: ReportKey) -> Optional[bytes]:
+        image: Optional[bytes] = self._entries.get(key)
+
+        if image is not None:
+            self._entries.move_to_end(key)
+
+        return image
+
+    def put(self, key: ReportKey, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+
+        self._drop(key)
+
+        self._entries[key] = image
+        self._size += len(image)
+
+        while len(self._entries) > self.max_entries or (
+            self._size > self.max_bytes
+        ):
+            _, image = self._entries.popitem(last=False)
+            self._size -= len(image)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _drop(self, key: ReportKey) -> None:
+        image: Optional[bytes] = self._entries.pop(key, None)
+
+        if image is not None:
+            self._size -= len(image)
+
+
+reports = ReportCache(const.REPORT_CACHE_ENTRIES, const.REPORT_CACHE_BYTES)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from datetime import date
+from io import BytesIO
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import app.config as conf
+import app.const as const
+
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+async def render_monthly_report_async(
+    aggregated_data: dict[date, int], norm: int
+) -> bytes:
+    """Render a monthly report in a worker process, so the event loop isn't
+    blocked by matplotlib"""
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        _get_executor(), render_monthly_report, aggregated_data, norm
+    )
+
+
+def render_monthly_report(
+    aggregated_data: dict[date, int], norm: int
+) -> bytes:
+    """Render a monthly report plot to PNG bytes.
+
+    Every call draws on its own Figure with the Agg canvas and doesn't touch
+    the global pyplot state, so it's safe to run concurrently"""
+    y_axis: list[int] = []
+    x_axis: list[str] = []
+
+    for drink_date, amount in aggregated_data.items():
+        y_axis.append(amount)
+        x_axis.append(format_date(drink_date))
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    # set a points on a plot
+    colors: list[str] = ["r" if y < norm else "b" for y in y_axis]
+    ax.scatter(range(len(x_axis)), y_axis, color=colors)
+    # draw a line connecting them
+    ax.plot(x_axis, y_axis, "-g", alpha=0.3)
+
+    # add a threshold line and color span
+    ax.axhline(y=norm, color="r", linestyle="--", label="Добова норма")
+    ax.axhspan(0, norm, color="red", alpha=0.1)
+
+    # add labels and plot title
+    ax.set_xlabel("Дата", fontsize=12)
+    ax.set_ylabel("Випито води (мл.)", fontsize=12)
+    ax.set_title("Місячний звіт", fontsize=14)
+
+    # rotate x labels if there a too many of theme to fit the image
+    if len(y_axis) > 6:
+        ax.tick_params(axis="x", labelrotation=len(y_axis) * 2.85)
+
+    figure.tight_layout()  # fitting the x axis labels after steep rotation
+    ax.legend(loc="upper left")  # location of the legend
+    ax.margins(y=0.10)  # y axis margin
+    ax.grid()  # add a grid lines
+
+    buffer = BytesIO()
+    figure.savefig(buffer, format="png")
+
+    return buffer.getvalue()
+
+
+def format_date(drink_date: date) -> str:
+    """Format a date as a day with a Ukrainian month name, e.g. `5 травня`.
+    Doesn't depend on the process locale"""
+    return f"{drink_date.day:2d} {const.MONTHS[drink_date.month - 1]}"
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    if not _executor:
+        workers: int = conf.get_chart_workers()
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Chart rendering pool started with {workers} workers")
+
+    return _executor
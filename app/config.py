@@ -4,7 +4,38 @@ import os
 import logging
 
 from app.exceptions import BotConfigError
-from app.const import BOT_TOKEN, ADMIN_ID, DEBUG_MODE
+from app.const import (
+    BOT_TOKEN,
+    ADMIN_ID,
+    DEBUG_MODE,
+    CHART_WORKERS,
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DEFAULT_CHART_WORKERS,
+    DEFAULT_DATABASE_URL,
+    DEFAULT_DB_POOL_SIZE,
+    BOT_MODE,
+    BOT_MODES,
+    MODE_POLLING,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_CONCURRENCY,
+    DEFAULT_WEBHOOK_HOST,
+    DEFAULT_WEBHOOK_PORT,
+    DB_MAX_OVERFLOW,
+    AUX_DB_POOL_SIZE,
+    BOT_ROLE,
+    BOT_ROLES,
+    ROLE_ALL,
+    WORKER_SHARDS,
+    DEFAULT_WORKER_SHARDS,
+    TELEGRAM_API_URL,
+    METRICS_HOST,
+    METRICS_PORT,
+    DEFAULT_METRICS_HOST,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +52,12 @@ def get_bot_token() -> str:
     return token
 
 
+def get_telegram_api_url() -> str | None:
+    """Return a base URL of the Bot API server, e.g. a local one for load
+    tests. Return None to use the official one"""
+    return os.environ.get(TELEGRAM_API_URL) or None
+
+
 def get_admin_id() -> int:
     """Return an admin user_id. Return -1 if not set to restrict admin commands
     for everyone"""
@@ -44,3 +81,113 @@ def is_debug_enabled() -> bool:
         logger.info("Debug mode is enabled")
 
     return debug
+
+
+def get_chart_workers() -> int:
+    """Return a number of worker processes to render charts"""
+    return _get_positive_int(CHART_WORKERS, DEFAULT_CHART_WORKERS)
+
+
+def get_database_url() -> str:
+    """Return a database URL. It must use an async driver, e.g.
+    `sqlite+aiosqlite:///water.sqlite`"""
+    return os.environ.get(DATABASE_URL) or DEFAULT_DATABASE_URL
+
+
+def get_db_pool_size() -> int:
+    """Return a number of connections kept open in the database pool"""
+    return _get_positive_int(DB_POOL_SIZE, DEFAULT_DB_POOL_SIZE)
+
+
+def get_db_pool_capacity() -> int:
+    """Return the most connections a process opens to the database. The
+    update pool and the standalone transactions pool share them"""
+    return get_db_pool_size() + DB_MAX_OVERFLOW
+
+
+def get_bot_mode() -> str:
+    """Return a way to receive updates: `polling` (default) or `webhook`"""
+    mode: str = os.environ.get(BOT_MODE) or MODE_POLLING
+
+    if mode not in BOT_MODES:
+        raise BotConfigError(f"{BOT_MODE} must be one of {BOT_MODES}!")
+
+    return mode
+
+
+def get_webhook_url() -> str | None:
+    """Return a public URL of the webhook endpoint to register it in
+    Telegram. If not set, the webhook must be registered manually"""
+    return os.environ.get(WEBHOOK_URL) or None
+
+
+def get_webhook_host() -> str:
+    return os.environ.get(WEBHOOK_HOST) or DEFAULT_WEBHOOK_HOST
+
+
+def get_webhook_port() -> int:
+    return _get_positive_int(WEBHOOK_PORT, DEFAULT_WEBHOOK_PORT)
+
+
+def get_webhook_secret() -> str | None:
+    """Return a secret token Telegram sends with every webhook request"""
+    return os.environ.get(WEBHOOK_SECRET) or None
+
+
+def get_webhook_concurrency() -> int:
+    """Return a number of updates processed at the same time in the webhook
+    mode. Defaults to the capacity of the update pool, every update being
+    processed may need a connection. The standalone transactions pool isn't
+    counted, updates only hold its connections for a moment"""
+    capacity: int = get_db_pool_capacity() - AUX_DB_POOL_SIZE
+    concurrency: int = _get_positive_int(WEBHOOK_CONCURRENCY, capacity)
+
+    if concurrency > capacity:
+        logger.warning(
+            f"{WEBHOOK_CONCURRENCY} {concurrency} exceeds the database pool"
+            f" capacity of {capacity} connections, the updates may time out"
+            " waiting for a connection"
+        )
+
+    return concurrency
+
+
+def get_bot_role() -> str:
+    """Return a role of the process: `all` (default), `bot` or `worker`"""
+    role: str = os.environ.get(BOT_ROLE) or ROLE_ALL
+
+    if role not in BOT_ROLES:
+        raise BotConfigError(f"{BOT_ROLE} must be one of {BOT_ROLES}!")
+
+    return role
+
+
+def get_worker_shards() -> int:
+    """Return a number of partitions the users are split into between the
+    worker processes. Must be the same for all the workers"""
+    return _get_positive_int(WORKER_SHARDS, DEFAULT_WORKER_SHARDS)
+
+
+def get_metrics_host() -> str:
+    return os.environ.get(METRICS_HOST) or DEFAULT_METRICS_HOST
+
+
+def get_metrics_port() -> int | None:
+    """Return a port the metrics are served on. Return None if not set to
+    not serve them, every process needs its own port"""
+    if not os.environ.get(METRICS_PORT):
+        return None
+
+    return _get_positive_int(METRICS_PORT, 0)
+
+
+def _get_positive_int(option: str, default: int) -> int:
+    value: str | None = os.environ.get(option)
+
+    if not value:
+        return default
+
+    if not value.isdigit() or not int(value):
+        raise BotConfigError(f"{option} must be a positive integer!")
+
+    return int(value)
@@ -1,6 +1,20 @@
 ADMIN_ID = "ADMIN_ID"
 BOT_TOKEN = "BOT_TOKEN"
 DEBUG_MODE = "DEBUG_MODE"
+CHART_WORKERS = "CHART_WORKERS"
+DATABASE_URL = "DATABASE_URL"
+DB_POOL_SIZE = "DB_POOL_SIZE"
+BOT_MODE = "BOT_MODE"
+WEBHOOK_URL = "WEBHOOK_URL"
+WEBHOOK_HOST = "WEBHOOK_HOST"
+WEBHOOK_PORT = "WEBHOOK_PORT"
+WEBHOOK_SECRET = "WEBHOOK_SECRET"
+WEBHOOK_CONCURRENCY = "WEBHOOK_CONCURRENCY"
+BOT_ROLE = "BOT_ROLE"
+WORKER_SHARDS = "WORKER_SHARDS"
+TELEGRAM_API_URL = "TELEGRAM_API_URL"
+METRICS_HOST = "METRICS_HOST"
+METRICS_PORT = "METRICS_PORT"
 
 ACTIVITIES = [
     "малорухливий",
@@ -25,6 +39,9 @@ CLIMATE_MAP = {
     "холодний": 0.9,
 }
 
+# ml of water per kg of body weight a day
+NORM_ML_PER_KG = 35
+
 HOUR = 3600
 MINUTE = 60
 NOON = 12
@@ -34,3 +51,98 @@ NOTIFY_FREQUENCY_MIN = 5
 NOTIFY_FREQUENCY_MAX = 60
 
 DEFAULT_TZ = "Europe/Kiev"
+
+# city name to timezone lookups made over the network
+GEOCODING_CACHE_PATH = "geocoding_cache.json"
+GEOCODING_CONCURRENCY = 2
+GEOCODING_TIMEOUT = 3  # seconds
+
+SEND_CONCURRENCY = 30
+SEND_ATTEMPTS = 3
+SEND_RETRY_DELAY = 1  # seconds after a network error
+
+NOTIFY_START_TIME = 480
+NOTIFY_END_TIME = 1320
+NOTIFY_FREQUENCY = 15
+
+SQL_CHUNK_SIZE = 500
+
+WRITE_BATCH_SIZE = 200
+WRITE_MAX_DELAY = 0.05  # seconds
+# a batch is retried when the database is locked by another process
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.1  # seconds, grows with every attempt
+# a failed write is queued again if the failure can pass, up to the times
+WRITE_REQUEUES = 3
+# the dropped writes kept for inspection
+WRITE_DEAD_LETTERS = 1000
+
+DEFAULT_CHART_WORKERS = 2
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///water.sqlite"
+DEFAULT_DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 30
+# connections of the standalone transactions pool, taken out of the overflow
+AUX_DB_POOL_SIZE = 2
+
+MODE_POLLING = "polling"
+MODE_WEBHOOK = "webhook"
+BOT_MODES = [MODE_POLLING, MODE_WEBHOOK]
+
+WEBHOOK_PATH = "/webhook"
+DEFAULT_WEBHOOK_HOST = "0.0.0.0"
+DEFAULT_WEBHOOK_PORT = 8080
+# received updates waiting for a worker, Telegram has to wait beyond it
+WEBHOOK_QUEUE_SIZE = 1000
+
+# `all` handles updates and runs the jobs over all users, `bot` only handles
+# updates, `worker` only runs the jobs over the users of its shards
+ROLE_ALL = "all"
+ROLE_BOT = "bot"
+ROLE_WORKER = "worker"
+BOT_ROLES = [ROLE_ALL, ROLE_BOT, ROLE_WORKER]
+
+DEFAULT_WORKER_SHARDS = 1
+LEASE_TTL = 30  # seconds
+# how often the leases are renewed, a lease is trusted for the rest of TTL
+LEASE_RENEW_INTERVAL = LEASE_TTL / 3
+
+DEFAULT_METRICS_HOST = "0.0.0.0"
+# how often the event loop lag is measured, seconds
+LOOP_LAG_INTERVAL = 1
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers don't block behind writers
+    "synchronous": "NORMAL",  # no fsync per commit, durable on checkpoint
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # in KiB when negative
+    "busy_timeout": 5000,  # ms to wait for a lock instead of failing
+}
+
+REPORT_CACHE_ENTRIES = 512
+REPORT_CACHE_BYTES = 32 * 1024 * 1024
+
+# conversations idle for longer are forgotten
+FSM_STATE_TTL = HOUR * 24
+
+# how long and how many unregistered senders are remembered. Short, since
+# other processes don't learn about a registration until it expires
+MEMBERSHIP_MISS_TTL = 10  # seconds
+MEMBERSHIP_MISS_ENTRIES = 10000
+
+# month names in the genitive case, as used in dates
+MONTHS = [
+    "січня",
+    "лютого",
+    "березня",
+    "квітня",
+    "травня",
+    "червня",
+    "липня",
+    "серпня",
+    "вересня",
+    "жовтня",
+    "листопада",
+    "грудня",
+]
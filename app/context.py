@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from contextvars import ContextVar, Token
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from app.model import User, NotificationSettings
+    from app.types import FSMRecord
+
+
+class UpdateContext:
+    """Unit of work of a single update.
+
+    Keeps the sender objects and the conversation states loaded once for
+    the whole update, the changed conversations, and counts the database
+    queries made while the update is processed"""
+
+    def __init__(self):
+        self.user: Optional[User] = None
+        self.settings: Optional[NotificationSettings] = None
+        self.fsm_records: dict[tuple[int, int], FSMRecord] = {}
+        self.fsm_changed: set[tuple[int, int]] = set()
+        self.queries: int = 0
+
+
+_current: ContextVar[Optional[UpdateContext]] = ContextVar(
+    "update_context", default=None
+)
+
+
+def begin() -> Token[Optional[UpdateContext]]:
+    """Start a new context for the current task"""
+    return _current.set(UpdateContext())
+
+
+def end(token: Token[Optional[UpdateContext]]) -> None:
+    _current.reset(token)
+
+
+def get() -> Optional[UpdateContext]:
+    return _current.get()
+
+
+def count_query(*args: Any) -> None:
+    """Count a query in the current context. Used as an engine event
+    listener"""
+    context: Optional[UpdateContext] = _current.get()
+
+    if context:
+        context.queries += 1
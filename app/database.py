@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+import app.config as conf
+import app.const as const
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_engine(aux: bool = False) -> AsyncEngine:
+    """Create a database engine from the config.
+
+    SQLite connections are tuned with pragmas on connect: WAL journal, so
+    readers don't wait for writers, relaxed fsync, memory mapping, a bigger
+    page cache and a busy timeout instead of immediate lock errors"""
+    url: URL = make_url(conf.get_database_url())
+    engine: AsyncEngine = create_async_engine(
+        url, **_get_pool_options(url, aux)
+    )
+
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+    logger.info(f"Database engine created for {url.render_as_string()}")
+
+    return engine
+
+
+def create_aux_engine(engine: AsyncEngine) -> AsyncEngine:
+    """Create an engine with its own pool for short standalone transactions,
+    which are made while a connection of the `engine` is already held.
+    The pool is small and fixed, its connections are taken out of the
+    overflow of the `engine` pool, see `conf.get_db_pool_capacity`.
+
+    An in-memory database is only visible to its own engine, so it's shared
+    instead, its pool never waits anyway"""
+    if is_memory_db(engine.url):
+        return engine
+
+    return create_engine(aux=True)
+
+
+def is_memory_db(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def _get_pool_options(url: URL, aux: bool) -> dict[str, Any]:
+    if is_memory_db(url):
+        # every connection to an in-memory database is a new database
+        return {"poolclass": StaticPool}
+
+    if aux:
+        return {
+            "pool_size": const.AUX_DB_POOL_SIZE,
+            "max_overflow": 0,
+            "pool_timeout": const.DB_POOL_TIMEOUT,
+        }
+
+    return {
+        "pool_size": conf.get_db_pool_size(),
+        "max_overflow": const.DB_MAX_OVERFLOW - const.AUX_DB_POOL_SIZE,
+        "pool_timeout": const.DB_POOL_TIMEOUT,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any):
+    cursor: Any = dbapi_connection.cursor()
+
+    for pragma, value in const.SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+
+    cursor.close()
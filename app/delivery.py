@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Iterable, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiogram.utils import exceptions
+
+import app.config as conf
+import app.const as const
+import app.metrics as metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryClient:
+    """Deliver messages to users through a shared aiogram Bot session.
+
+    The Bot keeps a single keep-alive aiohttp session, so every message
+    reuses pooled connections instead of opening a new TLS connection.
+    Fan-out is bounded by a semaphore, so a broadcast never runs more
+    requests at once than the connection pool can serve."""
+
+    def __init__(self, concurrency: int = const.SEND_CONCURRENCY):
+        self._concurrency: int = concurrency
+        self._bot: Optional[Bot] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def setup(self, bot: Bot) -> None:
+        """Reuse an existing bot (and its HTTP session) for delivery"""
+        self._bot = bot
+
+    @property
+    def bot(self) -> Bot:
+        if not self._bot:
+            self._bot = Bot(
+                token=conf.get_bot_token(),
+                connections_limit=self._concurrency,
+            )
+
+        return self._bot
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        """Send a message to a chat. Return True if it has been delivered"""
+        if not self._semaphore:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        async with self._semaphore:
+            return await self._send(chat_id, text)
+
+    async def broadcast(
+        self, messages: Iterable[tuple[int, str]]
+    ) -> list[int]:
+        """Send a batch of (chat_id, text) messages concurrently.
+        Return the chats the messages have been delivered to"""
+        chat_ids: list[int] = []
+        sends: list[Awaitable[bool]] = []
+
+        for chat_id, text in messages:
+            chat_ids.append(chat_id)
+            sends.append(self.send(chat_id, text))
+
+        results: list[bool | BaseException] = await asyncio.gather(
+            *sends,
+            # a failed message mustn't abort the rest of the batch
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Notification failed: {result!r}")
+                metrics.notifications.inc(result="failed")
+
+        return [
+            chat_id
+            for chat_id, result in zip(chat_ids, results)
+            if result is True
+        ]
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        for _ in range(const.SEND_ATTEMPTS):
+            try:
+                await self.bot.send_message(chat_id, text)
+            except exceptions.RetryAfter as e:
+                logger.warning(
+                    f"Flood limit exceeded for user {chat_id}. Retry in"
+                    f" {e.timeout} seconds."
+                )
+                await asyncio.sleep(e.timeout)
+                continue
+            except (
+                exceptions.NetworkError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as e:
+                logger.warning(
+                    f"Notification to user {chat_id} failed on the network:"
+                    f" {e!r}. Retrying."
+                )
+                await asyncio.sleep(const.SEND_RETRY_DELAY)
+                continue
+            except exceptions.TelegramAPIError as e:
+                logger.error(f"Notification to user {chat_id} failed: {e}")
+                metrics.notifications.inc(result="failed")
+                return False
+
+            logger.info(f"Notification to user {chat_id} has been sent")
+            metrics.notifications.inc(result="sent")
+            return True
+
+        metrics.notifications.inc(result="failed")
+        return False
+
+
+client = DeliveryClient()
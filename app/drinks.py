@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import logging
+from typing import Iterable, Optional
+
+from app.types import DrinkTypeInfo
+
+
+logger = logging.getLogger(__name__)
+
+
+class DrinkCatalog:
+    """Drink types kept in memory, so the drink flow doesn't query the
+    reference data.
+
+    The catalog is loaded from the `drink_type` table whenever it changes.
+    The version is bumped on every change of the content, so anything built
+    from the catalog, e.g. a keyboard, can be cached by it"""
+
+    def __init__(self):
+        self.version: int = 0
+        self._types: dict[str, DrinkTypeInfo] = {}
+
+    def load(self, drink_types: Iterable[DrinkTypeInfo]) -> None:
+        types: dict[str, DrinkTypeInfo] = {
+            drink_type["label"]: DrinkTypeInfo(
+                id=drink_type["id"],
+                label=drink_type["label"],
+                coefficient=drink_type["coefficient"],
+            )
+            for drink_type in drink_types
+        }
+
+        if types == self._types:
+            return
+
+        self._types = types
+        self.version += 1
+
+        logger.info(f"{len(types)} drink types have been loaded")
+
+    def get(self, label: str) -> Optional[DrinkTypeInfo]:
+        return self._types.get(label)
+
+    def labels(self) -> list[str]:
+        return list(self._types)
+
+
+catalog = DrinkCatalog()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+import json
+import logging
+from typing import Optional
+
+from app.types import Fact
+
+
+logger = logging.getLogger(__name__)
+
+
+class FactCatalog:
+    """Water facts kept in memory. The file is parsed once and loaded again
+    only if its modification time has changed.
+
+    The user progress is a bitset of used fact ids, so picking the next
+    fact is a couple of integer operations instead of a scan."""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._mtime: Optional[float] = None
+        self._facts: dict[int, str] = {}
+        self._ids_mask: int = 0
+
+    def refresh(self) -> None:
+        """Load the facts file if it has been modified since the last load"""
+        mtime: float = os.stat(self.path).st_mtime
+
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, "r") as f:
+            facts_json: list[Fact] = json.load(f)
+
+        self._facts = {fact["id"]: fact["text"] for fact in facts_json}
+        self._ids_mask = 0
+
+        for fact_id in self._facts:
+            self._ids_mask |= 1 << fact_id
+
+        self._mtime = mtime
+
+        logger.info(f"{len(self._facts)} water facts have been loaded")
+
+    def next_fact(self, used: int) -> Optional[tuple[int, str]]:
+        """Return the unused fact with the lowest id for the bitset of used
+        facts. Return None if the user has seen all of them"""
+        self.refresh()
+
+        available: int = self._ids_mask & ~used
+
+        if not available:
+            return
+
+        fact_id: int = (available & -available).bit_length() - 1
+
+        return fact_id, self._facts[fact_id]
+
+    def pick_fact(self, used: int) -> Optional[tuple[str, int]]:
+        """Return the next fact for the bitset of used facts along with the
+        bitset that has it marked. Start over once every fact has been
+        seen"""
+        fact: Optional[tuple[int, str]] = self.next_fact(used)
+
+        if not fact and used:
+            used = 0
+            fact = self.next_fact(used)
+
+        if not fact:
+            return
+
+        fact_id, text = fact
+
+        return text, used | 1 << fact_id
+
+
+def decode_used_facts(used_facts: Optional[bytes]) -> int:
+    """Decode a stored bitset of used facts"""
+    return int.from_bytes(used_facts or b"", "little")
+
+
+def encode_used_facts(used: int) -> bytes:
+    """Encode a bitset of used facts to store it as a compact blob"""
+    return used.to_bytes((used.bit_length() + 7) // 8, "little")
+
+
+catalog = FactCatalog(
+    os.path.join(os.path.dirname(__file__), "data", "water_facts.json")
+)
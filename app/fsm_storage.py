@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import copy
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from aiogram.dispatcher.storage import BaseStorage
+from sqlalchemy import delete, event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.const as const
+import app.model as model
+import app.writer as writer
+import app.context as context
+from app.types import FSMRecord
+
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[int, int]
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM storage persisted in the database, so conversations survive
+    restarts and can be shared by several bot processes.
+
+    A conversation is read from the database once per update and kept in
+    the update context, so the state filters of the handlers don't query it
+    again. The changes made while an update is processed are written once,
+    by `commit` at the end of the update, through the write-behind queue.
+    Outside of an update every change is queued right away. Until a queued
+    change is committed, it's served from memory instead of the database.
+
+    There is deliberately no cache across updates: another process may
+    change the conversation at any time, so every update reads it again.
+
+    Every write bumps the stored version and applies only if the version
+    is still the one the change is based on. When two updates of the same
+    conversation race, the later write is dropped instead of overwriting
+    the newer state.
+
+    Another process sees a change once the queue commits it, within
+    `WRITE_MAX_DELAY` seconds. Conversations idle for more than `ttl`
+    seconds are treated as finished and removed by `evict_expired`"""
+
+    def __init__(self, ttl: float):
+        self.ttl: float = ttl
+
+        self._pending: dict[Address, FSMRecord] = {}
+
+    async def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        default: Optional[str] = None,
+    ) -> Optional[str]:
+        record: FSMRecord = await self._load(chat, user)
+        return record["state"] or self.resolve_state(default)
+
+    async def get_data(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        default: Optional[dict[str, Any]] = None,
+    ) -> dict[str, Any]:
+        record: FSMRecord = await self._load(chat, user)
+        return copy.deepcopy(record["data"] or default or {})
+
+    async def set_state(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        state: Optional[str] = None,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        await self._save(
+            chat, user, {**record, "state": self.resolve_state(state)}
+        )
+
+    async def set_data(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        data: Optional[dict[str, Any]] = None,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        await self._save(
+            chat, user, {**record, "data": copy.deepcopy(data or {})}
+        )
+
+    async def update_data(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        data: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        new_data: dict[str, Any] = copy.deepcopy(record["data"])
+        new_data.update(data or {}, **kwargs)
+
+        await self._save(chat, user, {**record, "data": new_data})
+
+    async def reset_state(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        with_data: Optional[bool] = True,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        await self._save(
+            chat,
+            user,
+            {
+                **record,
+                "state": None,
+                "data": {} if with_data else record["data"],
+            },
+        )
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        default: Optional[dict[str, Any]] = None,
+    ) -> dict[str, Any]:
+        record: FSMRecord = await self._load(chat, user)
+        return copy.deepcopy(record["bucket"] or default or {})
+
+    async def set_bucket(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        bucket: Optional[dict[str, Any]] = None,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        await self._save(
+            chat, user, {**record, "bucket": copy.deepcopy(bucket or {})}
+        )
+
+    async def update_bucket(
+        self,
+        *,
+        chat: str | int | None = None,
+        user: str | int | None = None,
+        bucket: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        record: FSMRecord = await self._load(chat, user)
+        new_bucket: dict[str, Any] = copy.deepcopy(record["bucket"])
+        new_bucket.update(bucket or {}, **kwargs)
+
+        await self._save(chat, user, {**record, "bucket": new_bucket})
+
+    async def evict_expired(self) -> None:
+        """Remove conversations that have been idle for too long"""
+        expired_at: datetime = datetime.utcnow() - timedelta(seconds=self.ttl)
+        await writer.queue.flush()
+
+        async with model.aux_session_factory() as session:
+            result: Any = await session.execute(
+                delete(model.FSMState).filter(
+                    model.FSMState.updated_at < expired_at
+                )
+            )
+            await session.commit()
+
+        logger.info(f"{result.rowcount} idle conversations have been removed")
+
+    async def commit(self) -> None:
+        """Queue the writes of the conversations changed by the current
+        update, one per conversation"""
+        update_context: Optional[context.UpdateContext] = context.get()
+
+        if not update_context:
+            return
+
+        for address in update_context.fsm_changed:
+            await self._enqueue(address, update_context.fsm_records[address])
+
+        update_context.fsm_changed.clear()
+
+    async def _load(
+        self, chat: str | int | None, user: str | int | None
+    ) -> FSMRecord:
+        address: Address = self._resolve_address(chat, user)
+        update_context: Optional[context.UpdateContext] = context.get()
+
+        if update_context and address in update_context.fsm_records:
+            return update_context.fsm_records[address]
+
+        if address in self._pending:
+            record: FSMRecord = self._pending[address]
+        else:
+            record = await self._read(address)
+
+        if update_context:
+            update_context.fsm_records[address] = record
+
+        return record
+
+    async def _read(self, address: Address) -> FSMRecord:
+        async with model.aux_session_factory() as session:
+            row: Optional[model.FSMState] = await session.get(
+                model.FSMState, address
+            )
+
+        expired_at: datetime = datetime.utcnow() - timedelta(seconds=self.ttl)
+
+        if not row:
+            return FSMRecord(state=None, data={}, bucket={}, version=0)
+
+        if row.updated_at < expired_at:
+            # not removed yet, a write must be based on its version still
+            return FSMRecord(
+                state=None, data={}, bucket={}, version=row.version
+            )
+
+        return FSMRecord(
+            state=row.state,
+            data=row.data,
+            bucket=row.bucket,
+            version=row.version,
+        )
+
+    async def _save(
+        self, chat: str | int | None, user: str | int | None, record: Any
+    ) -> None:
+        address: Address = self._resolve_address(chat, user)
+        update_context: Optional[context.UpdateContext] = context.get()
+
+        if not update_context:
+            await self._enqueue(address, record)
+            return
+
+        update_context.fsm_records[address] = record
+        update_context.fsm_changed.add(address)
+
+    async def _enqueue(self, address: Address, record: FSMRecord) -> None:
+        """Queue a write of a conversation state"""
+        updated_at: datetime = datetime.utcnow()
+        based_on: int = record["version"]
+        record = {**record, "version": based_on + 1}
+        self._pending[address] = record
+
+        def forget(*args: Any) -> None:
+            # a newer change might have been queued in the meantime
+            if self._pending.get(address) is record:
+                del self._pending[address]
+
+        async def operation(session: AsyncSession) -> None:
+            result: Any
+            written: bool
+
+            if not (record["state"] or record["data"] or record["bucket"]):
+                # a finished conversation leaves nothing behind
+                result = await session.execute(
+                    delete(model.FSMState).filter(
+                        model.FSMState.chat == address[0],
+                        model.FSMState.user == address[1],
+                        model.FSMState.version == based_on,
+                    )
+                )
+                # there might have been nothing to delete
+                written = bool(result.rowcount) or not based_on
+            else:
+                result = await _upsert(
+                    session, based_on, address, record, updated_at
+                )
+                written = bool(result.rowcount)
+
+            if not written:
+                logger.warning(
+                    f"Conversation {address} has been changed by another"
+                    " update, the change is dropped"
+                )
+
+            event.listen(
+                session.sync_session, "after_commit", forget, once=True
+            )
+
+        # the reads wait for nothing, the pending changes are served instead
+        await writer.queue.enqueue(None, operation)
+
+    def _resolve_address(
+        self, chat: str | int | None, user: str | int | None
+    ) -> Address:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)  # type: ignore
+
+
+async def _upsert(
+    session: AsyncSession,
+    based_on: int,
+    address: Address,
+    record: FSMRecord,
+    updated_at: datetime,
+) -> Any:
+    """Insert or replace a conversation state with a single statement, unless
+    the stored version has changed since `based_on`"""
+    query: Any = model.insert(model.FSMState).values(
+        chat=address[0],
+        user=address[1],
+        state=record["state"],
+        data=record["data"],
+        bucket=record["bucket"],
+        updated_at=updated_at,
+        version=record["version"],
+    )
+
+    return await session.execute(
+        query.on_conflict_do_update(
+            index_elements=["chat", "user"],
+            set_={
+                key: query.excluded[key]
+                for key in ("state", "data", "bucket", "updated_at", "version")
+            },
+            where=model.FSMState.version == based_on,
+        )
+    )
+
+
+storage = DatabaseStorage(const.FSM_STATE_TTL)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import asyncio
+import logging
+import threading
+from typing import Any, Optional
+
+from geopy.exc import GeopyError
+from geopy.geocoders import Nominatim
+from geopy.location import Location
+from timezonefinder import TimezoneFinder
+
+import app.const as const
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimezoneResolver:
+    """Resolve a city name to a timezone name.
+
+    A name is looked up in the bundled gazetteer of common cities first,
+    then in the on-disk cache of previous lookups. Only unknown cities are
+    geocoded over the network, and the result is added to the cache. The
+    timezone polygons are loaded once, on the first network lookup.
+
+    Network lookups run in threads, at most `concurrency` at a time, so the
+    cache is guarded by a lock"""
+
+    def __init__(
+        self, gazetteer_path: str, cache_path: str, concurrency: int = 1
+    ):
+        self.gazetteer_path: str = gazetteer_path
+        self.cache_path: str = cache_path
+        self.concurrency: int = concurrency
+
+        self._gazetteer: Optional[dict[str, str]] = None
+        self._cache: Optional[dict[str, str]] = None
+        self._finder: Optional[TimezoneFinder] = None
+        self._geolocator: Optional[Nominatim] = None
+        self._lock: threading.Lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: dict[str, asyncio.Future[str]] = {}
+
+    def load(self) -> None:
+        """Load the gazetteer and the cache, so offline lookups don't touch
+        the disk"""
+        with self._lock:
+            self._get_gazetteer()
+            self._get_cache()
+
+    def resolve(self, city: str) -> str:
+        """Return a timezone of the city, or the default one if it's unknown.
+        May block on the network for the cities seen for the first time"""
+        name: str = normalize_city(city)
+
+        if not name:
+            return const.DEFAULT_TZ
+
+        timezone: Optional[str] = self.lookup(city)
+
+        if timezone:
+            return timezone
+
+        try:
+            timezone = self._geocode(city)
+        except GeopyError as e:
+            # don't cache it, the service might be back the next time
+            logger.warning(f"Failed to geocode a city {city}: {e}")
+            return const.DEFAULT_TZ
+
+        timezone = timezone or const.DEFAULT_TZ
+        self._remember(name, timezone)
+
+        return timezone
+
+    def resolve_in_background(self, city: str) -> asyncio.Future[str]:
+        """Resolve a city without blocking the event loop. Return a future
+        of the timezone. Concurrent lookups of the same city are shared"""
+        name: str = normalize_city(city)
+        timezone: Optional[str] = (
+            self.lookup(city) if name else const.DEFAULT_TZ
+        )
+
+        if timezone:
+            future: asyncio.Future[str] = (
+                asyncio.get_running_loop().create_future()
+            )
+            future.set_result(timezone)
+
+            return future
+
+        if name not in self._pending:
+            self._pending[name] = asyncio.ensure_future(
+                self._resolve_in_executor(city)
+            )
+            self._pending[name].add_done_callback(
+                lambda _: self._pending.pop(name, None)
+            )
+
+        return self._pending[name]
+
+    def lookup(self, city: str) -> Optional[str]:
+        """Find a city without going to the network"""
+        name: str = normalize_city(city)
+
+        with self._lock:
+            timezone: Optional[str] = self._get_gazetteer().get(name)
+
+            if timezone:
+                return timezone
+
+            return self._get_cache().get(name)
+
+    async def _resolve_in_executor(self, city: str) -> str:
+        if not self._semaphore:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.resolve, city
+            )
+
+    def _geocode(self, city: str) -> Optional[str]:
+        if not self._geolocator:
+            self._geolocator = Nominatim(user_agent="watermelon-tg-bot")
+
+        location: Optional[Location] = self._geolocator.geocode(city)
+
+        if not location:
+            return
+
+        with self._lock:
+            if not self._finder:
+                self._finder = TimezoneFinder()
+
+            return self._finder.timezone_at(
+                lng=location.longitude, lat=location.latitude
+            )
+
+    def _remember(self, name: str, timezone: str) -> None:
+        with self._lock:
+            cache: dict[str, str] = self._get_cache()
+            cache[name] = timezone
+
+            # write a new file and swap it, so it's never read half-written
+            tmp_path: str = f"{self.cache_path}.tmp"
+
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(cache, f, ensure_ascii=False)
+
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                logger.warning(f"Failed to save the geocoding cache: {e}")
+
+    def _get_gazetteer(self) -> dict[str, str]:
+        if self._gazetteer is None:
+            with open(self.gazetteer_path, "r") as f:
+                cities: dict[str, list[str]] = json.load(f)
+
+            self._gazetteer = {
+                normalize_city(name): timezone
+                for timezone, names in cities.items()
+                for name in names
+            }
+
+            logger.info(f"{len(self._gazetteer)} city names have been loaded")
+
+        return self._gazetteer
+
+    def _get_cache(self) -> dict[str, str]:
+        if self._cache is None:
+            self._cache = {}
+
+            try:
+                with open(self.cache_path, "r") as f:
+                    data: Any = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to load the geocoding cache: {e}")
+                data = {}
+
+            if isinstance(data, dict):
+                self._cache.update(data)
+
+        return self._cache
+
+
+def normalize_city(city: str) -> str:
+    """Normalize a city name for lookups: case, apostrophes, dashes and
+    whitespaces don't matter. Return an empty string if there are no letters
+    in the name at all"""
+    name: str = city.casefold().replace("ё", "е")
+    name = re.sub(r"[’ʼ`‘]", "'", name)
+    name = re.sub(r"[\s\-–—_.,]+", " ", name).strip()
+
+    if not any(char.isalpha() for char in name):
+        return ""
+
+    return name
+
+
+resolver = TimezoneResolver(
+    os.path.join(os.path.dirname(__file__), "data", "cities.json"),
+    const.GEOCODING_CACHE_PATH,
+    const.GEOCODING_CONCURRENCY,
+)
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-from typing import Any
+import functools
+from typing import Any, Optional
 
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
+import app.model as model
 import app.utils as utils
+import app.drinks as drinks
+from app.types import DrinkTypeInfo
 
 AMOUNTS = [
     ["250", "330"],
@@ -23,7 +27,7 @@ class Drink(StatesGroup):
     confirmation = State()
 
 
-async def get_drink_amount_kb() -> types.ReplyKeyboardMarkup:
+def build_drink_amount_kb() -> types.ReplyKeyboardMarkup:
     kb = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)  # type: ignore
 
     for row in AMOUNTS:
@@ -32,7 +36,19 @@ async def get_drink_amount_kb() -> types.ReplyKeyboardMarkup:
     return kb
 
 
-async def get_drink_types_kb() -> types.ReplyKeyboardMarkup:
+def build_confirmation_kb() -> types.ReplyKeyboardMarkup:
+    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)  # type: ignore
+
+    for answer in (YES, NO):
+        kb.add(answer)
+
+    return kb
+
+
+@functools.lru_cache(maxsize=1)
+def build_drink_types_kb(version: int) -> types.ReplyKeyboardMarkup:
+    """Build a keyboard of the drink types catalog. It's cached by the
+    catalog version, so it's rebuilt only when the drink types change"""
     kb = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)  # type: ignore
     type_labels = utils.get_drink_types()
 
@@ -45,10 +61,19 @@ async def get_drink_types_kb() -> types.ReplyKeyboardMarkup:
     return kb
 
 
+def get_drink_types_kb() -> types.ReplyKeyboardMarkup:
+    return build_drink_types_kb(drinks.catalog.version)
+
+
+# the keyboards don't change, so they're built once and reused
+DRINK_AMOUNT_KB = build_drink_amount_kb()
+CONFIRMATION_KB = build_confirmation_kb()
+
+
 async def drink_something(message: types.Message, state: FSMContext):
     await message.answer(
         "Скільки ви випили?",
-        reply_markup=await get_drink_amount_kb(),
+        reply_markup=DRINK_AMOUNT_KB,
     )
     await state.set_state(Drink.drink.state)
 
@@ -60,7 +85,7 @@ async def user_drinked(message: types.Message, state: FSMContext):
         await message.answer(
             "Будь ласка, оберіть обсяг випитого за допомогою клавіатури"
             " нижче.",
-            reply_markup=await get_drink_amount_kb(),
+            reply_markup=DRINK_AMOUNT_KB,
         )
         return
 
@@ -69,52 +94,51 @@ async def user_drinked(message: types.Message, state: FSMContext):
     if drink_int < 100:
         await message.answer(
             "Будь ласка, введіть число більше за 100мл.",
-            reply_markup=await get_drink_amount_kb(),
+            reply_markup=DRINK_AMOUNT_KB,
         )
         return
 
     await state.update_data(amount=drink_int)
 
     await message.answer(
-        f"Що саме ви пили?", reply_markup=await get_drink_types_kb()
+        f"Що саме ви пили?", reply_markup=get_drink_types_kb()
     )
     await state.set_state(Drink.drink_type.state)
 
 
 async def set_drink_type(message: types.Message, state: FSMContext):
     drink_type: str = message.text
-    drink_type_obj = utils.get_drink_type_by_label(drink_type)
+    drink_type_obj: Optional[DrinkTypeInfo] = utils.get_drink_type_by_label(
+        drink_type
+    )
 
     if not drink_type_obj:
         await message.answer(
             "Будь ласка, оберіть що саме ви випили за допомогою клавіатури"
             " нижче",
-            reply_markup=await get_drink_types_kb(),
+            reply_markup=get_drink_types_kb(),
         )
         return
 
     data: dict[str, Any] = await state.get_data("amount")
     amount = data["amount"]
-    coef = drink_type_obj.coefficient
+    coef = drink_type_obj["coefficient"]
     useful_amount = int(amount * (coef / 100))
 
     await state.update_data(amount=useful_amount)
 
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)  # type: ignore
-
-    for answer in (YES, NO):
-        keyboard.add(answer)
-
     await message.answer(
-        f"Ви випили: {drink_type_obj.label} - `{amount}`мл, коефіціент гідратації - `{coef}%`. "
+        f"Ви випили: {drink_type_obj['label']} - `{amount}`мл, коефіціент гідратації - `{coef}%`. "
         f"Це дорівнює `{useful_amount}`мл води. Все правильно?",
-        reply_markup=keyboard,
+        reply_markup=CONFIRMATION_KB,
         parse_mode=types.ParseMode.MARKDOWN
     )
     await state.set_state(Drink.confirmation.state)
 
 
-async def confirmation(message: types.Message, state: FSMContext):
+async def confirmation(
+    message: types.Message, state: FSMContext, user: model.User
+):
     if message.text.lower() == NO:
         await message.answer(f"Почнімо з початку...")
         await state.finish()
@@ -122,11 +146,10 @@ async def confirmation(message: types.Message, state: FSMContext):
         return
 
     data: dict[str, Any] = await state.get_data()
-    user: types.User = message.from_user
 
-    utils.update_drink_consumption(user.id, data["amount"])
-    today_total: int = sum(d.amount for d in utils.get_today_drinks(user.id))
-    norm: int = utils.calculate_user_norm(user.id)
+    await utils.update_drink_consumption(user, data["amount"])
+    today_total: int = await utils.get_today_total(user)
+    norm: int = utils.calculate_user_norm(user)
 
     await message.answer(
         f"Обсяг випитої рідини внесено - `{data['amount']}`мл. Сьогодні ви"
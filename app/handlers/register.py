@@ -30,7 +30,7 @@ class Registration(StatesGroup):
 
 
 async def register_start(message: types.Message, state: FSMContext):
-    if utils.get_user(message.from_user.id):
+    if await utils.is_registered(message.from_user.id):
         return await message.answer("Ви вже зарєстровані.")
 
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -103,8 +103,10 @@ async def timezone_provided(message: types.Message, state: FSMContext):
         return
 
     data: dict[str, Any] = await state.get_data()
-    tz: str = utils.get_timezone_by_city(message.text)
-    await state.update_data(timezone=tz)
+    tz: str = await utils.get_timezone_by_city_async(
+        message.from_user.id, message.text
+    )
+    await state.update_data(timezone=tz, city=message.text)
 
     await message.answer(
         "Ви вказали наступні дані. "
@@ -129,6 +131,13 @@ async def need_confirm(message: types.Message, state: FSMContext):
 
     data: dict[str, Any] = await state.get_data()
     user: types.User = message.from_user
+    city: str | None = data.pop("city", None)
+
+    if city and data["timezone"] == const.DEFAULT_TZ:
+        # the lookup might have finished after the timeout
+        data["timezone"] = (
+            utils.get_known_timezone_by_city(city) or data["timezone"]
+        )
 
     data.update(
         id=user.id,
@@ -136,7 +145,7 @@ async def need_confirm(message: types.Message, state: FSMContext):
         fullname=f"{user.first_name or ''} {user.last_name or ''}",
     )
 
-    utils.create_user(data)
+    await utils.create_user(data)
 
     await message.answer(
         f"Користувач успішно створений!",
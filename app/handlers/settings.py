@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import cast
+from typing import Optional
 from datetime import time, datetime
 
 from aiogram import Dispatcher, types
@@ -54,18 +54,15 @@ def register_handlers_settings(dp: Dispatcher):
     )
 
 
-async def cmd_settings(message: types.Message):
-    user: model.User = cast(model.User, model.User.get(message.from_user.id))
-
+async def cmd_settings(message: types.Message, user: model.User):
     await message.answer(
         "Налаштування",
         reply_markup=_get_settigns_kb(user),
     )
 
 
-async def cb_notifications(query: types.CallbackQuery):
-    user: model.User = cast(model.User, model.User.get(query.from_user.id))
-    user.toggle_notifications()
+async def cb_notifications(query: types.CallbackQuery, user: model.User):
+    await user.toggle_notifications()
 
     await query.bot.edit_message_reply_markup(
         chat_id=query.message.chat.id,
@@ -122,9 +119,10 @@ async def cb_close(query: types.CallbackQuery):
     )
 
 
-async def cb_user_update(query: types.CallbackQuery, state: FSMContext):
-    user: model.User = cast(model.User, model.User.get(query.from_user.id))
-    user.drop()
+async def cb_user_update(
+    query: types.CallbackQuery, state: FSMContext, user: model.User
+):
+    await user.drop()
 
     await query.bot.edit_message_reply_markup(
         chat_id=query.message.chat.id,
@@ -134,16 +132,18 @@ async def cb_user_update(query: types.CallbackQuery, state: FSMContext):
     await register_start(query.message, state)
 
 
-async def cb_daily_norm(query: types.CallbackQuery):
+async def cb_daily_norm(query: types.CallbackQuery, user: model.User):
     """Set a custom daily norm for a user"""
-    current_norm: int = utils.calculate_user_norm(query.message.chat.id)
+    current_norm: int = utils.calculate_user_norm(user)
 
     await query.message.answer(f"Ваша поточна добова норма - {current_norm}")
     await query.message.answer("Введіть нову норму (ціле число)")
     await query.answer(await DailyNorm.wait_for_input.set())
 
 
-async def confirm_norm(message: types.Message, state: FSMContext):
+async def confirm_norm(
+    message: types.Message, state: FSMContext, user: model.User
+):
     new_norm: str = message.text
 
     if not new_norm.isdigit():
@@ -152,18 +152,23 @@ async def confirm_norm(message: types.Message, state: FSMContext):
         )
         return await DailyNorm.wait_for_input.set()
 
-    user: model.User = cast(model.User, model.User.get(message.from_user.id))
-    user.set_norm(int(new_norm))
+    await user.set_norm(int(new_norm))
 
     await state.finish()
 
     await message.answer(f"Нова норма встановлена - {new_norm}!")
 
 
-async def cb_n_time(query: types.CallbackQuery, state: FSMContext):
+async def cb_n_time(
+    query: types.CallbackQuery,
+    state: FSMContext,
+    settings: Optional[model.NotificationSettings],
+):
     """Set a notification time range"""
-    settings: model.NotificationSettings = (
-        utils.get_or_create_user_notification_settings(query.message.chat.id)
+    settings = settings or (
+        await utils.get_or_create_user_notification_settings(
+            query.message.chat.id
+        )
     )
 
     await query.message.answer(
@@ -176,7 +181,11 @@ async def cb_n_time(query: types.CallbackQuery, state: FSMContext):
     await query.answer(await NotificationRange.wait_for_input.set())
 
 
-async def confirm_n_time(message: types.Message, state: FSMContext):
+async def confirm_n_time(
+    message: types.Message,
+    state: FSMContext,
+    settings: Optional[model.NotificationSettings],
+):
     new_range: str = message.text
 
     try:
@@ -209,11 +218,13 @@ async def confirm_n_time(message: types.Message, state: FSMContext):
     start_minutes = _calc_minutes(start_time)
     end_minutes = _calc_minutes(end_time)
 
-    settings: model.NotificationSettings = (
-        utils.get_or_create_user_notification_settings(message.from_user.id)
+    settings = settings or (
+        await utils.get_or_create_user_notification_settings(
+            message.from_user.id
+        )
     )
 
-    settings.update_range(start_minutes, end_minutes)
+    await settings.update_range(start_minutes, end_minutes)
 
     await state.finish()
 
@@ -240,10 +251,16 @@ def _calc_minutes(time: time) -> int:
     return time.hour * 60 + time.minute
 
 
-async def cb_n_frequency(query: types.CallbackQuery, state: FSMContext):
+async def cb_n_frequency(
+    query: types.CallbackQuery,
+    state: FSMContext,
+    settings: Optional[model.NotificationSettings],
+):
     """Set a notification frequency for a user"""
-    settings: model.NotificationSettings = (
-        utils.get_or_create_user_notification_settings(query.message.chat.id)
+    settings = settings or (
+        await utils.get_or_create_user_notification_settings(
+            query.message.chat.id
+        )
     )
 
     await query.message.answer(
@@ -256,7 +273,11 @@ async def cb_n_frequency(query: types.CallbackQuery, state: FSMContext):
     await query.answer(await NotificationFrequency.wait_for_input.set())
 
 
-async def confirm_n_frequency(message: types.Message, state: FSMContext):
+async def confirm_n_frequency(
+    message: types.Message,
+    state: FSMContext,
+    settings: Optional[model.NotificationSettings],
+):
     new_frequency: str = message.text
 
     if (
@@ -270,11 +291,13 @@ async def confirm_n_frequency(message: types.Message, state: FSMContext):
         )
         return await NotificationFrequency.wait_for_input.set()
 
-    settings: model.NotificationSettings = (
-        utils.get_or_create_user_notification_settings(message.from_user.id)
+    settings = settings or (
+        await utils.get_or_create_user_notification_settings(
+            message.from_user.id
+        )
     )
 
-    settings.update_frequency(int(new_frequency))
+    await settings.update_frequency(int(new_frequency))
 
     await state.finish()
 
@@ -1,6 +1,7 @@
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 
+import app.model as model
 import app.utils as utils
 
 
@@ -41,13 +42,15 @@ async def cmd_stats(message: types.Message):
     )
 
 
-async def cb_today(query: types.CallbackQuery, state: FSMContext):
-    await query.answer(await cmd_today(query.message))
+async def cb_today(
+    query: types.CallbackQuery, state: FSMContext, user: model.User
+):
+    await query.answer(await cmd_today(query.message, user))
 
 
-async def cmd_today(message: types.Message):
-    amount: int = sum(d.amount for d in utils.get_today_drinks(message.chat.id))
-    norm: int = utils.calculate_user_norm(message.chat.id)
+async def cmd_today(message: types.Message, user: model.User):
+    amount: int = await utils.get_today_total(user)
+    norm: int = utils.calculate_user_norm(user)
 
     await message.answer(
         f"Сьогодні ви випили {amount}/{norm} мл.",
@@ -55,12 +58,14 @@ async def cmd_today(message: types.Message):
     )
 
 
-async def cb_graph(query: types.CallbackQuery, state: FSMContext):
-    await query.answer(await cmd_graph(query.message))
+async def cb_graph(
+    query: types.CallbackQuery, state: FSMContext, user: model.User
+):
+    await query.answer(await cmd_graph(query.message, user))
 
 
-async def cmd_graph(message: types.Message):
-    await message.answer_photo(utils.monthly_report_plot(message.chat.id))
+async def cmd_graph(message: types.Message, user: model.User):
+    await message.answer_photo(await utils.monthly_report_plot(user))
 
 
 async def cb_close(query: types.CallbackQuery):
@@ -7,152 +7,202 @@ from typing import Optional
 import app.utils as utils
 import app.model as model
 import app.const as const
+import app.delivery as delivery
+import app.facts as facts
+import app.metrics as metrics
+import app.timezones as timezones
+import app.worker as worker
+from app.types import NotifyCandidate
 
 
 logger = logging.getLogger(__name__)
 
 
-async def water_facts():
-    users: list[model.User] = model.User.all()
+async def water_facts(partition: Optional[worker.Partition] = None):
+    try:
+        with metrics.job_duration.time(job="water_facts"):
+            await _water_facts(partition)
+    finally:
+        await model.Session.remove()
 
-    for user in users:
-        if not user.notify:
-            logger.info(
-                f"User {user.id} {user.name} has turned off his notifications."
-                " Skipping."
-            )
-            continue
 
-        n_settings: model.NotificationSettings = (
-            utils.get_or_create_user_notification_settings(user.id)
-        )
+async def notify_job(partition: Optional[worker.Partition] = None):
+    """Notify user if he didn't drink for N hours. Only the users of the
+    `partition` are notified, if it's set"""
+    try:
+        with metrics.job_duration.time(job="notify_job"):
+            await _notify_job(partition)
+    finally:
+        await model.Session.remove()
+
+
+async def _water_facts(partition: Optional[worker.Partition]):
+    candidates: list[NotifyCandidate] = (
+        await utils.get_notification_candidates(partition=partition)
+    )
+    noon_ids: list[int] = []
+    metrics.job_users_scanned.inc(len(candidates), job="water_facts")
 
-        if _is_in_notification_range(user, n_settings):
+    for candidate in candidates:
+        if _is_in_notification_range(candidate):
             logger.info(
                 "User doesn't want to accept any notifications now. Skipping."
-                f" {user.id} {user.name}"
+                f" {candidate['id']} {candidate['name']}"
             )
             continue
 
-        local_time: datetime = utils.get_local_time(user)
+        if candidate["local_minute"] // const.MINUTE == const.NOON:
+            noon_ids.append(candidate["id"])
 
-        if local_time.hour != const.NOON:
-            continue
+    used_facts: dict[int, int] = await utils.get_used_facts(noon_ids)
+    # don't hold a connection while the messages are sent
+    await model.release_connection()
+
+    messages: list[tuple[int, str]] = []
+    progress: dict[int, int] = {}
 
-        facts_state: model.WaterFacts = utils.get_water_facts_state(user.id)
-        fact: Optional[str] = facts_state.get_fact()
+    for user_id in noon_ids:
+        fact: Optional[tuple[str, int]] = facts.catalog.pick_fact(
+            used_facts.get(user_id, 0)
+        )
 
         if not fact:
             continue
 
-        await utils.send_notification(
-            f"Цікавий факт: {fact}",
-            user.id,
+        messages.append((user_id, f"Цікавий факт: {fact[0]}"))
+        progress[user_id] = fact[1]
+
+    if not _is_still_held(partition):
+        return
+
+    metrics.job_users_notified.inc(len(messages), job="water_facts")
+    delivered: list[int] = await delivery.client.broadcast(messages)
+
+    # only the facts that have reached the users are marked as seen
+    await utils.mark_facts_used(
+        {user_id: progress[user_id] for user_id in delivered}
+    )
+
+
+async def _notify_job(partition: Optional[worker.Partition]):
+    clock: timezones.Clock = timezones.service.clock()
+    now: datetime = clock.utcnow
+    candidates: list[NotifyCandidate] = (
+        await utils.get_notification_candidates(
+            due_at=now, clock=clock, partition=partition
         )
+    )
 
+    notified: list[NotifyCandidate] = []
+    messages: list[tuple[int, str]] = []
+    schedule: dict[int, datetime] = {}
+    metrics.job_users_scanned.inc(len(candidates), job="notify_job")
 
-async def notify_job():
-    """Notify user if he didn't drink for N hours"""
+    for candidate in candidates:
+        message: Optional[str] = _check_candidate(candidate, now)
 
-    users: list[model.User] = model.User.all()
+        if message:
+            notified.append(candidate)
+            messages.append((candidate["id"], message))
+            candidate["notified_at"] = now
 
-    for user in users:
-        if not user.notify:
-            logger.info(
-                f"User {user.id} {user.name} has turned off his notifications."
-                " Skipping."
-            )
-            continue
+        schedule[candidate["id"]] = utils.calculate_next_due_at(
+            candidate, clock
+        )
 
-        n_settings: model.NotificationSettings = (
-            utils.get_or_create_user_notification_settings(user.id)
+    # the shards might have been taken over while the job was running
+    if not _is_still_held(partition):
+        return
+
+    if notified:
+        await utils.mark_notified(notified, now)
+
+    await utils.schedule_notifications(candidates, schedule)
+
+    metrics.job_users_notified.inc(len(notified), job="notify_job")
+    await delivery.client.broadcast(messages)
+
+
+def _is_still_held(partition: Optional[worker.Partition]) -> bool:
+    if partition and not partition.is_held():
+        logger.warning(
+            f"Lost the lease of shards {sorted(partition.shards)}. Skipping"
+            " the notifications, another worker will send them"
         )
+        return False
 
-        if _is_in_notification_range(user, n_settings):
-            logger.info(
-                "User doesn't want to accept any notifications now. Skipping."
-                f" {user.id} {user.name}"
-            )
-            continue
+    return True
 
-        if not _is_time_to_notify(n_settings):
-            logger.info(
-                f"Not enough time has passed to notify user {user.id}."
-                f" Skipping. {user.id} {user.name}"
-            )
-            continue
 
-        await _notify_user(user, n_settings)
+def _check_candidate(
+    candidate: NotifyCandidate, now: datetime
+) -> Optional[str]:
+    """Apply the reminder rules to a user. Return a reminder if he has to be
+    notified"""
+    if _is_in_notification_range(candidate):
+        logger.info(
+            "User doesn't want to accept any notifications now. Skipping."
+            f" {candidate['id']} {candidate['name']}"
+        )
+        return
+
+    if not _is_time_to_notify(candidate, now):
+        logger.info(
+            f"Not enough time has passed to notify user {candidate['id']}."
+            f" Skipping. {candidate['id']} {candidate['name']}"
+        )
+        return
 
+    return _get_reminder(candidate, now)
 
-def _is_time_to_notify(
-    n_settings: model.NotificationSettings,
-) -> bool:
+
+def _is_time_to_notify(candidate: NotifyCandidate, now: datetime) -> bool:
     """Check if enough time has passed from the previous notification"""
-    if not n_settings.notified_at:
+    if not candidate["notified_at"]:
         return True
 
-    frequency: int = n_settings.frequency
+    frequency: int = candidate["frequency"]
 
     minutes_passed: float = (
-        datetime.utcnow() - n_settings.notified_at
+        now - candidate["notified_at"]
     ).total_seconds() // const.MINUTE
 
     return minutes_passed > frequency
 
 
-async def _notify_user(
-    user: model.User, n_settings: model.NotificationSettings
-):
-    """Notify a user if didn't drink properly
+def _get_reminder(candidate: NotifyCandidate, now: datetime) -> Optional[str]:
+    """Return a reminder for a user if didn't drink properly
 
     - If he didn't drink today
     - If more than 2 hours have passed since the previous time
 
     Args:
-        user (model.User): User object
+        candidate (NotifyCandidate): User data for the reminder rules
+        now (datetime): Current UTC time
     """
-    user_drinks: list[model.Drinks] = utils.get_today_drinks(user.id)
-    last: model.Drinks | None = user_drinks[-1] if user_drinks else None
+    last: Optional[datetime] = candidate["last_drink_at"]
 
     if not last:
-        n_settings.update_notified_at()
-
-        return await utils.send_notification(
-            f"Ви сьогодні ще не пили. Зробіть це зараз /drink", user.id
-        )
+        return f"Ви сьогодні ще не пили. Зробіть це зараз /drink"
 
-    if _get_today_total(user) >= utils.calculate_user_norm(user.id):
+    if candidate["today_total"] >= candidate["norm"]:
         return
 
-    time_passed: float = (datetime.utcnow() - last.timestamp).total_seconds()
+    time_passed: float = (now - last).total_seconds()
 
     if abs(time_passed) >= const.NOTIFY_THRESHOLD:
-        n_settings.update_notified_at()
-
-        await utils.send_notification(
-            (
-                f"Ви не пили вже {int(time_passed//const.HOUR)} годин(и)."
-                " Зробіть це зараз /drink"
-            ),
-            user.id,
+        return (
+            f"Ви не пили вже {int(time_passed//const.HOUR)} годин(и)."
+            " Зробіть це зараз /drink"
         )
 
 
-def _get_today_total(user: model.User) -> int:
-    """Get the number of how much the user drank today"""
-    return sum(d.amount for d in utils.get_today_drinks(user.id))
-
-
-def _is_in_notification_range(
-    user: model.User, n_settings: model.NotificationSettings
-) -> bool:
+def _is_in_notification_range(candidate: NotifyCandidate) -> bool:
     """Check if it's too late to send notifications for a specific user
     according to his timezone"""
-    local_time: datetime = utils.get_local_time(user)
-    minutes_passed: int = local_time.hour * const.MINUTE + local_time.minute
+    minutes_passed: int = candidate["local_minute"]
 
     return (
-        minutes_passed >= n_settings.end_time
-        or minutes_passed < n_settings.start_time
+        minutes_passed >= candidate["end_time"]
+        or minutes_passed < candidate["start_time"]
     )
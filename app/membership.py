@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import time
+import logging
+from typing import Iterable, Optional
+from collections import OrderedDict
+
+import app.const as const
+
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipIndex:
+    """In-memory index of registered user ids.
+
+    Registered users are loaded once at startup and kept up to date on
+    registration and removal. Senders known to be unregistered are cached
+    for `miss_ttl` seconds, so repeated messages from them don't hit the
+    database either. The negative cache is bounded by `max_misses`.
+
+    The index is local to the process. With several bot processes, a user
+    registered through one of them is treated as unregistered by the others
+    until the cached miss expires, hence a TTL of seconds. A user removed
+    through one process stays registered for the others until restart, the
+    handlers still find no such user in the database then"""
+
+    def __init__(self, miss_ttl: float, max_misses: int):
+        self.miss_ttl: float = miss_ttl
+        self.max_misses: int = max_misses
+
+        self._members: set[int] = set()
+        self._misses: OrderedDict[int, float] = OrderedDict()
+
+    def load(self, user_ids: Iterable[int]) -> None:
+        self._members = set(user_ids)
+        self._misses.clear()
+
+        logger.info(f"Membership index loaded with {len(self._members)} users")
+
+    def lookup(self, user_id: int) -> Optional[bool]:
+        """Return whether the user is registered, or None if it's unknown and
+        the database must be checked"""
+        if user_id in self._members:
+            return True
+
+        expires_at: Optional[float] = self._misses.get(user_id)
+
+        if expires_at is None:
+            return None
+
+        if expires_at < time.monotonic():
+            del self._misses[user_id]
+            return None
+
+        return False
+
+    def remember(self, user_id: int, registered: bool) -> None:
+        """Store the result of a database check"""
+        if registered:
+            self.add(user_id)
+            return
+
+        self._misses[user_id] = time.monotonic() + self.miss_ttl
+        self._misses.move_to_end(user_id)
+
+        while len(self._misses) > self.max_misses:
+            self._misses.popitem(last=False)
+
+    def add(self, user_id: int) -> None:
+        self._members.add(user_id)
+        self._misses.pop(user_id, None)
+
+    def discard(self, user_id: int) -> None:
+        self._members.discard(user_id)
+        self.remember(user_id, False)
+
+
+index = MembershipIndex(
+    const.MEMBERSHIP_MISS_TTL, const.MEMBERSHIP_MISS_ENTRIES
+)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import abc
+import time
+import bisect
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+# the text exposition format is announced by its version
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric(abc.ABC):
+    """A named metric with a set of labels, rendered in the Prometheus text
+    format"""
+
+    type: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labels: LabelValues = labels
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self._render_samples(),
+        ]
+
+    def _label_values(self, labels: dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labels}"
+            )
+
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(
+        self, values: LabelValues, extra: Optional[dict[str, str]] = None
+    ) -> str:
+        pairs: list[tuple[str, str]] = list(zip(self.labels, values))
+        pairs.extend((extra or {}).items())
+
+        if not pairs:
+            return ""
+
+        return "{%s}" % ",".join(
+            f'{label}="{_escape(value)}"' for label, value in pairs
+        )
+
+    @abc.abstractmethod
+    def _render_samples(self) -> list[str]:
+        pass
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. a number of sent notifications"""
+
+    type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labels: LabelValues = ()
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key: LabelValues = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{self._format_labels(key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. durations, over cumulative
+    buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: LabelValues = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+        # per labels: counts per bucket plus +Inf, sum
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key: LabelValues = self._label_values(labels)
+
+        if key not in self._values:
+            self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = self._values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of a block of code in seconds"""
+        started_at: float = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _render_samples(self) -> list[str]:
+        samples: list[str] = []
+
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative: int = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le: dict[str, str] = {"le": _format_value(bound)}
+                samples.append(
+                    f"{self.name}_bucket{self._format_labels(key, le)}"
+                    f" {cumulative}"
+                )
+
+            labels: str = self._format_labels(key)
+            samples += [
+                f"{self.name}_sum{labels} {_format_value(total[0])}",
+                f"{self.name}_count{labels} {cumulative}",
+            ]
+
+        return samples
+
+
+class Registry:
+    """Metrics exposed together"""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return (
+            "\n".join(
+                line
+                for metric in self._metrics.values()
+                for line in metric.render()
+            )
+            + "\n"
+        )
+
+
+class MetricsServer:
+    """Serve the metrics over HTTP in the Prometheus text format"""
+
+    def __init__(self, registry: Registry):
+        self.registry: Registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        logger.info(f"Metrics are served on {host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+
+async def monitor_loop_lag(interval: float) -> None:
+    """Measure how late the event loop wakes up a sleeping task. A lag means
+    that something blocks the loop or it's overloaded"""
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+    while True:
+        started_at: float = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(loop.time() - started_at - interval, 0))
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+registry = Registry()
+
+handler_duration: Histogram = registry.register(
+    Histogram(
+        "bot_handler_duration_seconds",
+        "Time spent in an update handler",
+        ("handler",),
+    )
+)
+update_queries: Histogram = registry.register(
+    Histogram(
+        "bot_update_db_queries",
+        "Database queries made while processing an update",
+        buckets=QUERY_BUCKETS,
+    )
+)
+job_duration: Histogram = registry.register(
+    Histogram(
+        "bot_job_duration_seconds",
+        "Time spent in a run of a scheduled job",
+        ("job",),
+        buckets=DEFAULT_BUCKETS + (30, 60, 120),
+    )
+)
+job_users_scanned: Counter = registry.register(
+    Counter(
+        "bot_job_users_scanned_total",
+        "Users checked by the scheduled jobs",
+        ("job",),
+    )
+)
+job_users_notified: Counter = registry.register(
+    Counter(
+        "bot_job_users_notified_total",
+        "Users the scheduled jobs have sent a message to",
+        ("job",),
+    )
+)
+notifications: Counter = registry.register(
+    Counter(
+        "bot_notifications_total",
+        "Notifications by the delivery result, `sent` or `failed`",
+        ("result",),
+    )
+)
+writes_dropped: Counter = registry.register(
+    Counter(
+        "bot_writes_dropped_total",
+        "Queued writes dropped after a failure that can't pass",
+    )
+)
+loop_lag: Histogram = registry.register(
+    Histogram(
+        "bot_event_loop_lag_seconds",
+        "Delay of the event loop in waking up a sleeping task",
+        buckets=LAG_BUCKETS,
+    )
+)
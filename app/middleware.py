@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import time
 import logging
 from typing import Any
 
 from aiogram import types
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.handler import CancelHandler, current_handler
 
+import app.model as model
 import app.utils as utils
+import app.context as context
+import app.metrics as metrics
+import app.fsm_storage as fsm_storage
+import app.membership as membership
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +30,7 @@ class RegisterMiddleware(BaseMiddleware):
 
         user: types.User = message.from_user
 
-        if not utils.get_user(user.id):
+        if not await utils.is_registered(user.id):
             logger.info(
                 f"User {user.id} {user.username or ''} isn't registered"
             )
@@ -33,3 +39,111 @@ class RegisterMiddleware(BaseMiddleware):
                 reply_markup=types.ReplyKeyboardRemove(),
             )
             raise CancelHandler()
+
+
+class SessionMiddleware(BaseMiddleware):
+    """Manage a unit of work of an update.
+
+    The sender and their notification settings are loaded once and passed
+    to handlers as `user` and `settings` arguments. Once the update has
+    been processed, the changed conversation states are written and the
+    database session is closed"""
+
+    async def on_pre_process_update(
+        self, update: types.Update, data: dict[str, Any]
+    ):
+        data["context_token"] = context.begin()
+
+    async def on_pre_process_message(
+        self, message: types.Message, data: dict[str, Any]
+    ):
+        await self._load(message.from_user.id, data)
+
+    async def on_pre_process_callback_query(
+        self, query: types.CallbackQuery, data: dict[str, Any]
+    ):
+        await self._load(query.from_user.id, data)
+
+    async def on_post_process_update(
+        self, update: types.Update, results: list[Any], data: dict[str, Any]
+    ):
+        update_context: context.UpdateContext | None = context.get()
+
+        if update_context:
+            logger.debug(
+                f"Update {update.update_id} made"
+                f" {update_context.queries} queries"
+            )
+            metrics.update_queries.observe(update_context.queries)
+
+        await fsm_storage.storage.commit()
+
+        if "context_token" in data:
+            context.end(data["context_token"])
+
+        await model.Session.remove()
+
+    async def _load(self, user_id: int, data: dict[str, Any]):
+        update_context: context.UpdateContext | None = context.get()
+
+        if update_context and update_context.user:
+            user, settings = update_context.user, update_context.settings
+        elif membership.index.lookup(user_id) is False:
+            # don't query anything for the known unregistered senders
+            user, settings = None, None
+        else:
+            user, settings = await model.User.get_with_settings(user_id)
+            membership.index.remember(user_id, user is not None)
+            # don't hold a connection while the handler talks to Telegram
+            await model.release_connection()
+
+            if update_context:
+                update_context.user = user
+                update_context.settings = settings
+
+        data["user"] = user
+        data["settings"] = settings
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Measure the time spent in message and callback query handlers. Set it
+    up after the middlewares that can cancel a handler, so only the handlers
+    that run are measured"""
+
+    async def on_process_message(
+        self, message: types.Message, data: dict[str, Any]
+    ):
+        self._start(data)
+
+    async def on_process_callback_query(
+        self, query: types.CallbackQuery, data: dict[str, Any]
+    ):
+        self._start(data)
+
+    async def on_post_process_message(
+        self, message: types.Message, results: list[Any], data: dict[str, Any]
+    ):
+        self._observe(data)
+
+    async def on_post_process_callback_query(
+        self,
+        query: types.CallbackQuery,
+        results: list[Any],
+        data: dict[str, Any],
+    ):
+        self._observe(data)
+
+    def _start(self, data: dict[str, Any]):
+        # the handler is only known while it's being processed
+        handler: Any = current_handler.get(None)
+        data["metrics_handler"] = getattr(handler, "__name__", "unknown")
+        data["metrics_started_at"] = time.perf_counter()
+
+    def _observe(self, data: dict[str, Any]):
+        if "metrics_started_at" not in data:
+            return
+
+        metrics.handler_duration.observe(
+            time.perf_counter() - data["metrics_started_at"],
+            handler=data["metrics_handler"],
+        )
@@ -1,39 +1,84 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-import os
-import json
-import pickle
-from typing import Optional, Any, cast
-from datetime import datetime
+from typing import Any, Optional, cast
+from datetime import datetime, date
 from uuid import uuid4
 
-from sqlalchemy import ForeignKey, create_engine
+from sqlalchemy import ForeignKey, Index, Update, event, select, update
 from sqlalchemy import types
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
     mapped_column,
-    sessionmaker,
-    scoped_session,
     relationship,
 )
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, async_scoped_session
 from typing_extensions import Self
 
+import app.const as const
+import app.drinks as drinks
+import app.database as database
+import app.writer as writer
+import app.context as context
+import app.membership as membership
+import app.norms as norms
 from app.config import is_debug_enabled
-from app.types import Fact
+from app.types import DrinkTypeInfo
 
 logger = logging.getLogger(__name__)
-engine = create_engine("sqlite:///water.sqlite")
-Session = scoped_session(
-    sessionmaker(
-        bind=engine,
-        autoflush=False,
-        autocommit=False,
-        expire_on_commit=False,
-    )
+engine = database.create_engine()
+session_factory = async_sessionmaker(
+    bind=engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# a session per asyncio task, i.e. per processed update or job run. The
+# session must be removed with `await Session.remove()` when the task is done
+Session = async_scoped_session(session_factory, scopefunc=asyncio.current_task)
+
+
+async def release_connection() -> None:
+    """End the transaction of the task session, so its connection goes back
+    to the pool while the task waits for the network. The loaded objects
+    stay usable, they aren't expired on commit"""
+    await Session.commit()
+
+
+def insert(entity: Any) -> Any:
+    """Build an INSERT that supports `on_conflict_do_*` clauses of the
+    database in use"""
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(entity)
+
+    return sqlite.insert(entity)
+
+
+# A session of an update holds a connection until the update is processed,
+# and the FSM storage and the write batches need one more in the middle of
+# it. They get connections from another pool, otherwise the updates could
+# take all the connections of one pool and wait for each other forever
+aux_engine = database.create_aux_engine(engine)
+aux_session_factory = async_sessionmaker(
+    bind=aux_engine,
+    autoflush=False,
+    expire_on_commit=False,
 )
 
+# small writes are committed in batches by the write-behind queue
+writer.queue.setup(aux_session_factory)
+
+# count the queries made while processing an update
+event.listen(engine.sync_engine, "before_cursor_execute", context.count_query)
+
+if aux_engine is not engine:
+    event.listen(
+        aux_engine.sync_engine, "before_cursor_execute", context.count_query
+    )
+
 
 class Base(DeclarativeBase):
     pass
@@ -55,45 +100,146 @@ class User(Base):
         types.String, server_default="Europe/Kiev"
     )
     norm: Mapped[int] = mapped_column(types.Integer, nullable=True)
+    # the effective norm, either the custom one or derived from the profile
+    daily_norm: Mapped[int] = mapped_column(types.Integer, nullable=True)
+    next_due_at: Mapped[Optional[datetime]] = mapped_column(
+        types.DateTime, nullable=True, index=True
+    )
 
     def __repr__(self) -> str:
         return f"User(id={self.id}, name={self.name})"
 
     @classmethod
-    def get(cls, user_reference: Optional[int]) -> Optional[Self]:
-        query = Session.query(cls).autoflush(False)
-        query = query.filter(cls.id == user_reference)
-        return query.first()
+    async def get(cls, user_reference: Optional[int]) -> Optional[Self]:
+        await writer.queue.sync(user_reference)
+
+        query = select(cls).filter(cls.id == user_reference)
+        return (await Session.scalars(query)).first()
+
+    @classmethod
+    async def get_with_settings(
+        cls, user_reference: Optional[int]
+    ) -> tuple[Optional[Self], Optional[NotificationSettings]]:
+        """Load a user along with the notification settings in one query"""
+        await writer.queue.sync(user_reference)
+
+        query = (
+            select(cls, NotificationSettings)
+            .outerjoin(
+                NotificationSettings, NotificationSettings.user_id == cls.id
+            )
+            .filter(cls.id == user_reference)
+        )
+        row: Any = (await Session.execute(query)).first()
+
+        return (row[0], row[1]) if row else (None, None)
+
+    @classmethod
+    async def all(cls) -> list[Self]:
+        return list(await Session.scalars(select(cls)))
+
+    @classmethod
+    async def all_ids(cls) -> list[int]:
+        return list(await Session.scalars(select(cls.id)))
 
     @classmethod
-    def all(cls) -> list[Self]:
-        return Session.query(cls).all()
+    async def exists(cls, user_reference: int) -> bool:
+        query = select(cls.id).filter(cls.id == user_reference)
+        return (await Session.scalars(query)).first() is not None
 
-    def toggle_notifications(self) -> bool:
+    @classmethod
+    def reset_schedule_query(cls, user_reference: int) -> Update:
+        """Build a query that drops the precomputed reminder time, so the next
+        notification tick evaluates the user again"""
+        return (
+            update(cls)
+            .filter(cls.id == user_reference)
+            .values(next_due_at=None)
+        )
+
+    async def toggle_notifications(self) -> bool:
         self.notify = not self.notify
+        self.next_due_at = None
         logger.info(f"Toggle notifications for user {self.id}: {self.notify}.")
 
-        Session.commit()
+        await self._save(notify=self.notify, next_due_at=None)
 
         return self.notify
 
-    def drop(self) -> None:
-        Session.delete(self)
+    async def drop(self) -> None:
+        await Session.delete(self)
+        membership.index.discard(self.id)
         logger.info(f"User {self.id} has been deleted")
 
-        Session.commit()
+        await Session.commit()
 
-    def set_norm(self, norm: int) -> int:
+    async def set_norm(self, norm: int) -> int:
         self.norm = norm
+        self.next_due_at = None
+        self.update_daily_norm()
         logger.info(f"Setting custom daily norm for user {self.id}")
 
-        Session.commit()
+        await self._save(
+            norm=norm, daily_norm=self.daily_norm, next_due_at=None
+        )
 
         return self.norm
 
+    @classmethod
+    async def correct_timezone(
+        cls, user_reference: int, timezone: str, fallback: str
+    ) -> None:
+        """Replace the fallback timezone, picked when the real one wasn't
+        known in time, unless the user has changed it since then"""
+        await writer.queue.enqueue(
+            user_reference,
+            writer.execute(
+                update(cls)
+                .filter(cls.id == user_reference, cls.timezone == fallback)
+                .values(timezone=timezone, next_due_at=None)
+            ),
+        )
+
+    def update_daily_norm(self) -> None:
+        """Recompute the effective daily norm after a profile change"""
+        self.daily_norm = norms.calculate_norm(
+            self.weight, self.climate, self.activity, self.norm
+        )
+
+    @classmethod
+    async def recompute_daily_norms(cls) -> int:
+        """Recompute the effective daily norm of all users with a single
+        query, e.g. after the formula or its constants have been changed.
+        Only outdated rows are written. Return the number of updated users"""
+        daily_norm: Any = norms.norm_expression(
+            cls.weight, cls.climate, cls.activity, cls.norm
+        )
+        result: Any = await Session.execute(
+            update(cls)
+            .filter(cls.daily_norm.is_distinct_from(daily_norm))
+            .values(daily_norm=daily_norm)
+            .execution_options(synchronize_session=False)
+        )
+        await Session.commit()
+
+        return result.rowcount
+
+    async def _save(self, **values: Any) -> None:
+        """Queue an update of the user columns to the write-behind queue"""
+        await writer.queue.enqueue(
+            self.id,
+            writer.execute(
+                update(User).filter(User.id == self.id).values(**values)
+            ),
+        )
+
 
 class Drinks(Base):
     __tablename__ = "drinks"
+    __table_args__ = (
+        # covers the per-user range scans by timestamp, including the amount
+        Index("ix_drinks_user_id_timestamp", "user_id", "timestamp", "amount"),
+    )
 
     id: Mapped[str] = mapped_column(
         types.Text(length=36), primary_key=True, default=lambda: str(uuid4())
@@ -111,42 +257,59 @@ class Drinks(Base):
         )
 
 
-class WaterFacts(Base):
-    __tablename__ = "water_facts"
+class DailyTotal(Base):
+    """Per-user rollup of drinks, keyed by the user local date"""
 
-    id: Mapped[str] = mapped_column(
-        types.Text(length=36), primary_key=True, default=lambda: str(uuid4())
-    )
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
-    used_facts: Mapped[bytes] = mapped_column(types.LargeBinary)
+    __tablename__ = "daily_totals"
 
-    @classmethod
-    def get(cls, user_reference: Optional[int]) -> Optional[Self]:
-        query: Any = Session.query(cls).autoflush(False)
-        query: Any = query.filter(cls.user_id == user_reference)
-        return query.one_or_none()
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id"), primary_key=True
+    )
+    local_date: Mapped[date] = mapped_column(types.Date, primary_key=True)
+    total_ml: Mapped[int] = mapped_column(
+        types.Integer, nullable=False, default=0
+    )
+    last_drink_at: Mapped[datetime] = mapped_column(
+        types.DateTime, nullable=False
+    )
+    count: Mapped[int] = mapped_column(
+        types.Integer, nullable=False, default=0
+    )
 
-    def get_fact(self) -> Optional[str]:
-        module_dir = os.path.dirname(__file__)
-        file_path = os.path.join(module_dir, "data", "water_facts.json")
+    def __repr__(self) -> str:
+        return (
+            f"DailyTotal(user_id={self.user_id}, date={self.local_date},"
+            f" total={self.total_ml})"
+        )
 
-        with open(file_path, "r") as f:
-            facts_json: list[Fact] = json.load(f)
+    @classmethod
+    async def get(
+        cls, user_reference: Optional[int], local_date: date
+    ) -> Optional[Self]:
+        await writer.queue.sync(user_reference)
 
-        used_facts: list[int] = (
-            pickle.loads(self.used_facts) if self.used_facts else []
+        return await Session.get(
+            cls, (user_reference, local_date), populate_existing=True
         )
 
-        for fact in facts_json:
-            if fact["id"] in used_facts:
-                continue
 
-            used_facts.append(fact["id"])
-            self.used_facts = pickle.dumps(used_facts)
+class WaterFacts(Base):
+    __tablename__ = "water_facts"
+
+    id: Mapped[str] = mapped_column(
+        types.Text(length=36), primary_key=True, default=lambda: str(uuid4())
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id"), nullable=False, unique=True, index=True
+    )
+    used_facts: Mapped[bytes] = mapped_column(types.LargeBinary, default=b"")
 
-            Session.commit()
+    @classmethod
+    async def get(cls, user_reference: Optional[int]) -> Optional[Self]:
+        await writer.queue.sync(user_reference)
 
-            return fact["text"]
+        query = select(cls).filter(cls.user_id == user_reference)
+        return (await Session.scalars(query)).one_or_none()
 
 
 class NotificationSettings(Base):
@@ -155,15 +318,17 @@ class NotificationSettings(Base):
     id: Mapped[str] = mapped_column(
         types.Text(length=36), primary_key=True, default=lambda: str(uuid4())
     )
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id"), nullable=False, unique=True, index=True
+    )
     start_time: Mapped[int] = mapped_column(
-        types.Integer, nullable=False, default=480
+        types.Integer, nullable=False, default=const.NOTIFY_START_TIME
     )
     end_time: Mapped[int] = mapped_column(
-        types.Integer, nullable=False, default=1320
+        types.Integer, nullable=False, default=const.NOTIFY_END_TIME
     )
     frequency: Mapped[int] = mapped_column(
-        types.Integer, nullable=False, default=15
+        types.Integer, nullable=False, default=const.NOTIFY_FREQUENCY
     )
     notified_at: Mapped[datetime] = mapped_column(
         types.DateTime, nullable=True
@@ -172,12 +337,13 @@ class NotificationSettings(Base):
     user = relationship(User)
 
     @classmethod
-    def get(cls, user_reference: Optional[int]) -> Optional[Self]:
-        query = Session.query(cls).autoflush(False)
-        query = query.filter(cls.user_id == user_reference)
-        return query.one_or_none()
+    async def get(cls, user_reference: Optional[int]) -> Optional[Self]:
+        await writer.queue.sync(user_reference)
+
+        query = select(cls).filter(cls.user_id == user_reference)
+        return (await Session.scalars(query)).one_or_none()
 
-    def update_range(self, start: int, end: int) -> None:
+    async def update_range(self, start: int, end: int) -> None:
         self.start_time = start
         self.end_time = end
 
@@ -186,7 +352,7 @@ class NotificationSettings(Base):
             f" {start} to {end}."
         )
 
-        Session.commit()
+        await self._save(start_time=start, end_time=end)
 
     def get_humanized_n_range(self) -> str:
         hours_start: int = self.start_time // 60
@@ -205,11 +371,11 @@ class NotificationSettings(Base):
 
         return f"{string_start}-{string_end}"
 
-    def update_notified_at(self) -> None:
+    async def update_notified_at(self) -> None:
         self.notified_at = datetime.utcnow()
-        Session.commit()
+        await self._save(notified_at=self.notified_at)
 
-    def update_frequency(self, frequency: int) -> None:
+    async def update_frequency(self, frequency: int) -> None:
         old_frequency: int = self.frequency
         self.frequency = frequency
 
@@ -218,7 +384,69 @@ class NotificationSettings(Base):
             f"From {old_frequency} to {self.frequency}."
         )
 
-        Session.commit()
+        await self._save(frequency=frequency)
+
+    async def _save(self, **values: Any) -> None:
+        """Queue an update of the settings columns to the write-behind queue.
+        Any change in settings makes the next reminder time outdated"""
+        await writer.queue.enqueue(
+            self.user_id,
+            writer.execute(
+                update(NotificationSettings)
+                .filter(NotificationSettings.id == self.id)
+                .values(**values)
+            ),
+        )
+
+        if "notified_at" not in values:
+            await writer.queue.enqueue(
+                self.user_id,
+                writer.execute(User.reset_schedule_query(self.user_id)),
+            )
+
+
+class FSMState(Base):
+    """Conversation state of a user in a chat, see `app.fsm_storage`"""
+
+    __tablename__ = "fsm_state"
+
+    chat: Mapped[int] = mapped_column(types.BigInteger, primary_key=True)
+    user: Mapped[int] = mapped_column(types.BigInteger, primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(types.String, nullable=True)
+    data: Mapped[dict[str, Any]] = mapped_column(types.JSON, nullable=False)
+    bucket: Mapped[dict[str, Any]] = mapped_column(
+        types.JSON, nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        types.DateTime, nullable=False, index=True
+    )
+    # bumped by every write, so a write based on an outdated read fails
+    version: Mapped[int] = mapped_column(
+        types.Integer, nullable=False, default=0, server_default="0"
+    )
+
+
+class JobLease(Base):
+    """A lease of a users shard held by a job worker, see `app.worker`"""
+
+    __tablename__ = "job_lease"
+
+    shard: Mapped[int] = mapped_column(types.Integer, primary_key=True)
+    owner: Mapped[Optional[str]] = mapped_column(types.String, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(
+        types.DateTime, nullable=False
+    )
+
+
+class JobWorker(Base):
+    """A heartbeat of a running job worker"""
+
+    __tablename__ = "job_worker"
+
+    owner: Mapped[str] = mapped_column(types.String, primary_key=True)
+    seen_at: Mapped[datetime] = mapped_column(
+        types.DateTime, nullable=False, index=True
+    )
 
 
 class DrinkType(Base):
@@ -231,23 +459,16 @@ class DrinkType(Base):
     coefficient: Mapped[int] = mapped_column(types.Integer, nullable=False)
 
     @classmethod
-    def get(cls, type_id: str) -> Optional[Self]:
-        query: Any = Session.query(cls).autoflush(False)
-        query: Any = query.filter(cls.id == type_id)
-        return query.one_or_none()
-
-    @classmethod
-    def get_by_label(cls, type_label: str) -> Optional[Self]:
-        query: Any = Session.query(cls).autoflush(False)
-        query: Any = query.filter(cls.label == type_label)
-        return query.one_or_none()
+    async def get(cls, type_id: str) -> Optional[Self]:
+        query = select(cls).filter(cls.id == type_id)
+        return (await Session.scalars(query)).one_or_none()
 
     @classmethod
-    def all(cls) -> list[Self]:
-        return Session.query(cls).all()
+    async def all(cls) -> list[Self]:
+        return list(await Session.scalars(select(cls)))
 
     @classmethod
-    def populate_defaults(cls) -> None:
+    async def populate_defaults(cls) -> None:
         """Populate default values if they do not exists"""
         DEFAULTS: list[dict[str, str | int]] = [
             {"id": "water", "label": "Вода", "coefficient": 100},
@@ -259,20 +480,40 @@ class DrinkType(Base):
         ]
 
         for drink_type in DEFAULTS:
-            if not cls.get(cast(str, drink_type["id"])):
+            if not await cls.get(cast(str, drink_type["id"])):
                 Session.add(cls(**drink_type))
 
-        Session.commit()
+        await Session.commit()
+        await cls.load_catalog()
+
+    @classmethod
+    async def load_catalog(cls) -> None:
+        """Load the drink types into the in-memory catalog. Must be called
+        whenever the table changes"""
+        drinks.catalog.load(
+            DrinkTypeInfo(
+                id=drink_type.id,
+                label=drink_type.label,
+                coefficient=drink_type.coefficient,
+            )
+            for drink_type in await cls.all()
+        )
 
 
-def init_db():
+async def init_db():
     """Initialize DB tables"""
-    if is_debug_enabled():
-        logging.info("Database has been cleared")
-        Base.metadata.drop_all(engine)
+    async with engine.begin() as conn:
+        if is_debug_enabled():
+            logging.info("Database has been cleared")
+            await conn.run_sync(Base.metadata.drop_all)
+
+        await conn.run_sync(Base.metadata.create_all)
+
+    await DrinkType.populate_defaults()
 
-    Base.metadata.create_all(engine)
+    updated: int = await User.recompute_daily_norms()
 
-    DrinkType.populate_defaults()
+    if updated:
+        logging.info(f"Daily norm has been recomputed for {updated} users")
 
     logging.info("Database has been initialized")
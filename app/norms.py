@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from sqlalchemy import and_, case, cast, types
+
+import app.const as const
+
+
+def calculate_norm(
+    weight: int, climate: str, activity: str, norm: Optional[int] = None
+) -> int:
+    """Calculate a daily water consumption from the user profile values.
+    Use custom daily norm if the user has set it and do not calculate anything.
+
+    Water consumption = N kg x 35 ml/kg/day x climate x activity
+
+    30-40 ml per kilo is a default norm for a regular person
+    """
+    if norm:
+        return norm
+
+    activity_value = const.ACTIVITY_MAP[activity]
+    climate_value = const.CLIMATE_MAP[climate]
+
+    return int(weight * const.NORM_ML_PER_KG * climate_value * activity_value)
+
+
+def norm_expression(
+    weight: Any, climate: Any, activity: Any, norm: Any
+) -> Any:
+    """Build an SQL expression of `calculate_norm` over the table columns.
+    Must be kept in sync with `calculate_norm`"""
+    return case(
+        (and_(norm.is_not(None), norm != 0), norm),
+        else_=cast(
+            weight
+            * const.NORM_ML_PER_KG
+            * case(const.CLIMATE_MAP, value=climate)
+            * case(const.ACTIVITY_MAP, value=activity),
+            types.Integer,
+        ),
+    )
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+
+import pytz
+
+import app.const as const
+
+
+class Clock:
+    """Local time of a single moment, e.g. a job tick, in any timezone.
+
+    The local time is computed once per distinct timezone and shared by all
+    the users in it, so the cost of a tick depends on the number of
+    timezones rather than the number of users"""
+
+    def __init__(self, service: TimezoneService, utcnow: datetime):
+        self.utcnow: datetime = utcnow
+
+        self._service: TimezoneService = service
+        self._local: dict[str, datetime] = {}
+        self._bounds: dict[str, tuple[datetime, datetime]] = {}
+
+    def local_time(self, timezone_name: str) -> datetime:
+        local_time: Optional[datetime] = self._local.get(timezone_name)
+
+        if local_time is None:
+            local_time = self._local[timezone_name] = pytz.utc.localize(
+                self.utcnow
+            ).astimezone(self._service.get(timezone_name))
+
+        return local_time
+
+    def local_date(self, timezone_name: str) -> date:
+        return self.local_time(timezone_name).date()
+
+    def minute_of_day(self, timezone_name: str) -> int:
+        local_time: datetime = self.local_time(timezone_name)
+        return local_time.hour * const.MINUTE + local_time.minute
+
+    def day_bounds(self, timezone_name: str) -> tuple[datetime, datetime]:
+        """Return naive UTC bounds [start, end) of the local day"""
+        bounds: Optional[tuple[datetime, datetime]] = self._bounds.get(
+            timezone_name
+        )
+
+        if bounds is None:
+            bounds = self._bounds[timezone_name] = self._service.day_bounds(
+                timezone_name, self.local_date(timezone_name)
+            )
+
+        return bounds
+
+
+class TimezoneService:
+    """Cache of timezone objects by name"""
+
+    def __init__(self):
+        self._zones: dict[str, Any] = {}
+
+    def get(self, timezone_name: str) -> Any:
+        timezone: Any = self._zones.get(timezone_name)
+
+        if timezone is None:
+            timezone = self._zones[timezone_name] = pytz.timezone(
+                timezone_name
+            )
+
+        return timezone
+
+    def now(self, timezone_name: str) -> datetime:
+        return datetime.now(self.get(timezone_name))
+
+    def clock(self, utcnow: Optional[datetime] = None) -> Clock:
+        """Freeze the current moment to evaluate local time in bulk"""
+        return Clock(self, utcnow or datetime.utcnow())
+
+    def day_bounds(
+        self, timezone_name: str, local_date: date
+    ) -> tuple[datetime, datetime]:
+        """Return naive UTC bounds [start, end) of a local date, to compare
+        them with stored timestamps. DST shifts are taken into account"""
+        timezone: Any = self.get(timezone_name)
+
+        midnight: datetime = datetime.combine(local_date, datetime.min.time())
+        start: datetime = timezone.localize(midnight)
+        end: datetime = timezone.localize(midnight + timedelta(days=1))
+
+        return (
+            start.astimezone(pytz.utc).replace(tzinfo=None),
+            end.astimezone(pytz.utc).replace(tzinfo=None),
+        )
+
+
+service = TimezoneService()
@@ -1,6 +1,48 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
 from typing_extensions import TypedDict
 
 
 class Fact(TypedDict):
     id: int
     text: str
+
+
+class NotifyCandidate(TypedDict):
+    """Everything the reminder rules need to know about a single user"""
+
+    id: int
+    name: str
+    timezone: str
+    norm: int
+    has_settings: bool
+    start_time: int
+    end_time: int
+    frequency: int
+    notified_at: Optional[datetime]
+    today_total: int
+    last_drink_at: Optional[datetime]
+    # minutes passed since the local midnight at the time of the scan
+    local_minute: int
+    # the stored reminder time at the time of the scan
+    next_due_at: Optional[datetime]
+
+
+class FSMRecord(TypedDict):
+    """Conversation state of a user in a chat"""
+
+    state: Optional[str]
+    data: dict[str, Any]
+    bucket: dict[str, Any]
+    # the stored version the record is based on
+    version: int
+
+
+class DrinkTypeInfo(TypedDict):
+    id: str
+    label: str
+    # a percent of the amount that counts as water
+    coefficient: int
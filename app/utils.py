@@ -1,179 +1,334 @@
 from __future__ import annotations
 
-import locale
+import asyncio
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Any, Optional
 from io import BytesIO
+from uuid import uuid4
 
-import requests
 import pytz
-import matplotlib.pyplot as plt
 from aiogram import types
-from geopy.geocoders import Nominatim
-from geopy.location import Location
-from timezonefinder import TimezoneFinder
+from sqlalchemy import and_, bindparam, case, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.model as model
-import app.config as conf
 import app.const as const
+import app.delivery as delivery
+import app.charts as charts
+import app.cache as cache
+import app.writer as writer
+import app.membership as membership
+import app.timezones as timezones
+import app.geocoding as geocoding
+import app.worker as worker
+import app.drinks as drinks
+import app.facts as facts
 from app.model import (
     Session,
     User,
     Drinks,
     NotificationSettings,
     WaterFacts,
-    DrinkType,
+    DailyTotal,
 )
+from app.types import DrinkTypeInfo, NotifyCandidate
+from app.cache import ReportKey
 
 
 logger = logging.getLogger(__name__)
 
+# the loop keeps only weak references to the tasks
+_corrections: set[asyncio.Task[None]] = set()
 
-def create_user(user_data: dict[str, Any]) -> User:
+
+async def create_user(user_data: dict[str, Any]) -> User:
     """Create a user withing database"""
     user: User = User(**user_data)
+    user.update_daily_norm()
     Session.add(user)
-    Session.commit()
+    await Session.commit()
+    membership.index.add(user.id)
 
     logger.info(f"{user} has been created")
     return user
 
 
-def get_user(user_id: int) -> User | None:
+async def get_user(user_id: int) -> User | None:
     """Get a user from database. Return None if not exists"""
-    return User.get(user_id)
+    return await User.get(user_id)
+
+
+async def is_registered(user_id: int) -> bool:
+    """Check if the user is registered. The database is queried only if the
+    user is unknown to the membership index"""
+    registered: bool | None = membership.index.lookup(user_id)
+
+    if registered is None:
+        registered = await User.exists(user_id)
+        membership.index.remember(user_id, registered)
+        await model.release_connection()
+
+    return registered
 
 
-def update_drink_consumption(user_id: int, amount: int) -> None:
-    drink: Drinks = Drinks(user_id=user_id, amount=amount)
+async def update_drink_consumption(user: User, amount: int) -> None:
+    user_id: int = user.id
+    now: datetime = datetime.utcnow()
+    local_date: date = get_local_date(user)
+
     logger.info(
         f"User {user_id} has updated water consumption for {amount} ml"
     )
 
-    Session.add(drink)
-    Session.commit()
-
+    async def operation(session: AsyncSession) -> None:
+        session.add(Drinks(user_id=user_id, amount=amount, timestamp=now))
 
-def get_today_drinks(user_id: int) -> list[Drinks]:
-    user: model.User = User.get(user_id)  # type: ignore
-    today: date = get_local_date(user)
+        # keep today rollup in the same transaction with the drink itself
+        total: DailyTotal | None = await session.get(
+            DailyTotal, (user_id, local_date)
+        )
 
-    drinks: list[Drinks] = (
-        Session.query(Drinks)
-        .filter(Drinks.user_id == user_id)
-        .filter(
-            Drinks.timestamp.between(
-                datetime.combine(today, datetime.min.time()),
-                datetime.combine(today, datetime.max.time()),
+        if not total:
+            total = DailyTotal(
+                user_id=user_id, local_date=local_date, total_ml=0, count=0
+            )
+            session.add(total)
+
+        total.total_ml += amount
+        total.count += 1
+        total.last_drink_at = now
+
+        # a fresh drink can only postpone the next reminder
+        due_at: datetime = now + timedelta(seconds=const.NOTIFY_THRESHOLD)
+        await session.execute(
+            update(User)
+            .filter(User.id == user_id)
+            .values(
+                next_due_at=case(
+                    (User.next_due_at > due_at, User.next_due_at),
+                    else_=due_at,
+                )
             )
         )
-        .order_by(Drinks.timestamp)
-        .all()
+
+    await writer.queue.enqueue(user_id, operation)
+
+
+async def get_today_total(user: User) -> int:
+    """Get the number of how much the user drank today"""
+    total: DailyTotal | None = await DailyTotal.get(
+        user.id, get_local_date(user)
     )
+    await model.release_connection()
 
-    return drinks
+    return total.total_ml if total else 0
 
 
-def monthly_report_plot(user_id: int) -> BytesIO:
-    """Build a monthly report plot"""
-    norm: int = calculate_user_norm(user_id)
-    drink_history: list[Drinks] = get_drink_history(user_id)
-    aggregated_data = aggregate_monthly_data(drink_history)
+async def get_today_drinks(user: User) -> list[Drinks]:
+    day_start, day_end = get_local_day_bounds(user.timezone)
 
-    y_axis: list[int] = []
-    x_axis: list[str] = []
+    drinks: list[Drinks] = list(
+        await Session.scalars(
+            select(Drinks)
+            .filter(Drinks.user_id == user.id)
+            .filter(Drinks.timestamp >= day_start, Drinks.timestamp < day_end)
+            .order_by(Drinks.timestamp)
+        )
+    )
 
-    locale.setlocale(locale.LC_ALL, "uk_UA.utf8")
+    return drinks
 
-    for drink_date, amount in aggregated_data.items():
-        y_axis.append(amount)
-        x_axis.append(drink_date.strftime("%e %B"))
 
-    # clear the previous data
-    plt.clf()
+async def get_notification_candidates(
+    due_at: Optional[datetime] = None,
+    clock: Optional[timezones.Clock] = None,
+    partition: Optional[worker.Partition] = None,
+) -> list[NotifyCandidate]:
+    """Return users with enabled notifications along with their notification
+    settings and today drinks rollup.
 
-    # set a points on a plot
-    colors: list[str] = ["r" if y < norm else "b" for y in y_axis]
-    plt.scatter(range(len(x_axis)), y_axis, color=colors)
-    # draw a line connecting them
-    plt.plot(x_axis, y_axis, "-g", alpha=0.3)
+    The whole set is fetched with one query, no matter how many users there
+    are. Today is a local date for each user, so the rollup is joined by the
+    local date, picked by the user timezone.
 
-    # add a threshold line and color span
-    plt.axhline(y=norm, color="r", linestyle="--", label="Добова норма")
-    plt.axhspan(0, norm, color="red", alpha=0.1)
+    If `due_at` is set, only users with the next reminder time before it
+    (or without one) are returned, using the `user.next_due_at` index.
 
-    # add labels and plot title
-    plt.xlabel("Дата", fontsize=12)
-    plt.ylabel("Випито води (мл.)", fontsize=12)
-    plt.title("Місячний звіт", fontsize=14)
+    The local time of each user is evaluated with the `clock`, once per
+    timezone.
 
-    # rotate x labels if there a too many of theme to fit the image
-    if len(y_axis) > 6:
-        plt.xticks(rotation=len(y_axis) * 2.85)
+    If `partition` is set, only users of its shards are returned."""
+    clock = clock or timezones.service.clock()
 
-    plt.tight_layout()  # fitting the x axis labels after steep rotation
-    plt.legend(loc="upper left")  # location of the legend
-    plt.margins(y=0.10)  # y axis margin
-    plt.grid()  # add a grid lines
+    # the batch scan must see all the writes made so far
+    await writer.queue.flush()
 
-    buffer = BytesIO()
-    plt.savefig(buffer, format="png")
-    buffer.seek(0)
+    timezone_names: list[str] = list(
+        await Session.scalars(select(User.timezone).distinct())
+    )
 
-    return buffer
+    if not timezone_names:
+        return []
 
+    today: Any = case(
+        {tz: clock.local_date(tz) for tz in timezone_names},
+        value=User.timezone,
+    )
 
-def get_drink_history(user_id: int) -> list[Drinks]:
-    drinks: list[Drinks] = (
-        Session.query(Drinks)
-        .filter(Drinks.user_id == user_id)
-        .order_by(Drinks.timestamp)
-        .all()
+    query: Any = (
+        select(
+            User.id,
+            User.name,
+            User.timezone,
+            User.daily_norm,
+            User.next_due_at,
+            NotificationSettings.id.label("settings_id"),
+            NotificationSettings.start_time,
+            NotificationSettings.end_time,
+            NotificationSettings.frequency,
+            NotificationSettings.notified_at,
+            DailyTotal.total_ml,
+            DailyTotal.last_drink_at,
+        )
+        .outerjoin(
+            NotificationSettings, NotificationSettings.user_id == User.id
+        )
+        .outerjoin(
+            DailyTotal,
+            and_(
+                DailyTotal.user_id == User.id, DailyTotal.local_date == today
+            ),
+        )
+        .filter(User.notify.is_(True))
     )
 
-    return drinks
+    if due_at:
+        query = query.filter(
+            or_(User.next_due_at.is_(None), User.next_due_at <= due_at)
+        )
 
+    if partition:
+        query = query.filter(partition.filter(User.id))
+
+    rows: Any = (await Session.execute(query)).all()
+
+    return [
+        NotifyCandidate(
+            id=row.id,
+            name=row.name,
+            timezone=row.timezone,
+            norm=row.daily_norm,
+            has_settings=row.settings_id is not None,
+            start_time=(
+                const.NOTIFY_START_TIME
+                if row.start_time is None
+                else row.start_time
+            ),
+            end_time=(
+                const.NOTIFY_END_TIME if row.end_time is None else row.end_time
+            ),
+            frequency=(
+                const.NOTIFY_FREQUENCY
+                if row.frequency is None
+                else row.frequency
+            ),
+            notified_at=row.notified_at,
+            today_total=row.total_ml or 0,
+            last_drink_at=row.last_drink_at,
+            local_minute=clock.minute_of_day(row.timezone),
+            next_due_at=row.next_due_at,
+        )
+        for row in rows
+    ]
+
+
+async def mark_notified(
+    candidates: list[NotifyCandidate], notified_at: datetime
+) -> None:
+    """Update the notification time for a batch of users at once. Initialize
+    notification settings for those users who don't have them yet"""
+    user_ids: list[int] = [c["id"] for c in candidates if c["has_settings"]]
+
+    for i in range(0, len(user_ids), const.SQL_CHUNK_SIZE):
+        await Session.execute(
+            update(NotificationSettings)
+            .filter(
+                NotificationSettings.user_id.in_(
+                    user_ids[i : i + const.SQL_CHUNK_SIZE]
+                )
+            )
+            .values(notified_at=notified_at)
+        )
 
-def aggregate_monthly_data(drink_list: list[Drinks]) -> dict[date, int]:
-    aggregated_data: dict[date, int] = {}
+    new_settings: list[dict[str, Any]] = [
+        {"id": str(uuid4()), "user_id": c["id"], "notified_at": notified_at}
+        for c in candidates
+        if not c["has_settings"]
+    ]
+
+    if new_settings:
+        query: Any = model.insert(NotificationSettings)
+
+        # another process might have initialized them in the meantime
+        await Session.execute(
+            query.on_conflict_do_update(
+                index_elements=[NotificationSettings.user_id],
+                set_={"notified_at": query.excluded.notified_at},
+            ),
+            new_settings,
+        )
 
-    for drink in drink_list:
-        drink_date: date = drink.timestamp.date()
-        aggregated_data.setdefault(drink_date, 0)
-        aggregated_data[drink_date] += drink.amount
+    await Session.commit()
 
-    this_month: int = datetime.now().date().month
 
-    return {
-        _date: amount
-        for _date, amount in aggregated_data.items()
-        if _date.month == this_month
-    }
+async def monthly_report_plot(user: User) -> BytesIO:
+    """Build a monthly report plot. Serve it from the cache if the user data
+    hasn't changed since the last time. Only the rendering is cached, the
+    data is read every time to tell if it has changed"""
+    norm: int = calculate_user_norm(user)
+    aggregated_data: dict[date, int] = await aggregate_monthly_data(user)
+    key: ReportKey = cache.reports.key(
+        user.id,
+        get_local_date(user).strftime("%Y-%m"),
+        aggregated_data,
+        norm,
+    )
+    image: bytes | None = cache.reports.get(key)
 
+    if image is None:
+        image = await charts.render_monthly_report_async(aggregated_data, norm)
+        cache.reports.put(key, image)
 
-def calculate_user_norm(user_id: int) -> int:
-    """Calculate a daily water consumption for a user
-    Use custom daily norm if the user has set it and do not calculate anything.
+    return BytesIO(image)
 
-    Water consumption = N kg x 35 ml/kg/day x climate x activity
 
-    30-40 ml per kilo is a default norm for a regular person
-    """
+async def aggregate_monthly_data(user: User) -> dict[date, int]:
+    """Return how much the user drank per local day of the current month.
 
-    user: User | None = User.get(user_id)
+    The rollup already holds a row per local day, so at most 31 rows of
+    the month are fetched as they are"""
+    today: date = get_local_date(user)
+    await writer.queue.sync(user.id)
 
-    if not user:
-        return 0
+    rows: Any = await Session.execute(
+        select(DailyTotal.local_date, DailyTotal.total_ml)
+        .filter(DailyTotal.user_id == user.id)
+        .filter(DailyTotal.local_date.between(today.replace(day=1), today))
+        .order_by(DailyTotal.local_date)
+    )
+    await model.release_connection()
+
+    return {drink_date: amount for drink_date, amount in rows}
 
-    if user.norm:
-        return user.norm
 
-    weight: int = user.weight
-    activity_value = const.ACTIVITY_MAP[user.activity]
-    climate_value = const.CLIMATE_MAP[user.climate]
+def calculate_user_norm(user: Optional[User]) -> int:
+    """Return a daily water consumption for a user. The norm is precomputed
+    and stored on the user, see `User.update_daily_norm`"""
+    if not user:
+        return 0
 
-    return int(weight * 35 * climate_value * activity_value)
+    return user.daily_norm
 
 
 def get_user_appeal(user: types.User) -> str:
@@ -188,88 +343,230 @@ def get_user_appeal(user: types.User) -> str:
     return user_appeal
 
 
-async def send_notification(message: str, chat_id: int) -> None:
+async def send_notification(message: str, chat_id: int) -> bool:
     """
     Sends notification to users with a specific message
     """
+    return await delivery.client.send(chat_id, message)
 
-    url: str = (
-        f"https://api.telegram.org/bot{conf.get_bot_token()}/sendMessage"
+
+def get_local_date(user: model.User) -> date:
+    return timezones.service.now(user.timezone).date()
+
+
+async def schedule_notifications(
+    candidates: list[NotifyCandidate], schedule: dict[int, datetime]
+) -> None:
+    """Store the next reminder time for a batch of users at once.
+
+    The time is computed from the candidates as they have been read. A user
+    is skipped if the stored time has changed since then, e.g. it's been
+    reset by a settings change, so the next tick evaluates them again"""
+    if not schedule:
+        return
+
+    user: Any = User.__table__
+
+    await Session.execute(
+        update(user)
+        .filter(
+            user.c.id == bindparam("user_id"),
+            user.c.next_due_at.is_not_distinct_from(bindparam("seen_at")),
+        )
+        .values(next_due_at=bindparam("due_at")),
+        [
+            {
+                "user_id": candidate["id"],
+                "seen_at": candidate["next_due_at"],
+                "due_at": schedule[candidate["id"]],
+            }
+            for candidate in candidates
+            if candidate["id"] in schedule
+        ],
     )
+    await Session.commit()
 
-    requests.post(url, json={"chat_id": chat_id, "text": message})
 
-    logger.info(f"Notification to user {chat_id} has been sent")
+def calculate_next_due_at(
+    candidate: NotifyCandidate, clock: timezones.Clock
+) -> datetime:
+    """Calculate the earliest UTC time when the user might need a reminder.
 
+    It's a lower bound: the notification job evaluates the reminder rules
+    again once the time has come. The notification range is localized for
+    the actual local date, so DST shifts are taken into account."""
+    due_at: datetime = clock.utcnow
 
-def get_local_time(user: model.User) -> datetime:
-    timezone: Any = pytz.timezone(user.timezone)
-    return datetime.now(timezone)
+    if candidate["notified_at"]:
+        due_at = max(
+            due_at,
+            candidate["notified_at"]
+            + timedelta(minutes=candidate["frequency"] + 1),
+        )
 
+    if candidate["last_drink_at"]:
+        if candidate["today_total"] >= candidate["norm"]:
+            _, day_end = clock.day_bounds(candidate["timezone"])
+            due_at = max(due_at, day_end)
+        else:
+            due_at = max(
+                due_at,
+                candidate["last_drink_at"]
+                + timedelta(seconds=const.NOTIFY_THRESHOLD),
+            )
 
-def get_local_date(user: model.User) -> date:
-    timezone: Any = pytz.timezone(user.timezone)
-    return datetime.now(timezone).date()
+    return _fit_notification_range(due_at, candidate)
 
 
-def get_timezone_by_city(city: str) -> str:
-    geolocator = Nominatim(user_agent="watermelon-tg-bot")
+def _fit_notification_range(
+    due_at: datetime, candidate: NotifyCandidate
+) -> datetime:
+    """Move the UTC time to the start of the user notification range if it
+    doesn't fit in"""
+    timezone: Any = timezones.service.get(candidate["timezone"])
+    local_time: datetime = pytz.utc.localize(due_at).astimezone(timezone)
+    minutes: int = local_time.hour * const.MINUTE + local_time.minute
+    local_date: date = local_time.date()
+
+    if candidate["start_time"] <= minutes < candidate["end_time"]:
+        return due_at
+
+    if minutes >= candidate["start_time"]:
+        local_date += timedelta(days=1)
+
+    start: datetime = timezone.localize(
+        datetime.combine(local_date, datetime.min.time())
+        + timedelta(minutes=candidate["start_time"])
+    )
+
+    return start.astimezone(pytz.utc).replace(tzinfo=None)
+
 
-    location: Location | None = geolocator.geocode(city)  # type: ignore
+def get_local_day_bounds(timezone_name: str) -> tuple[datetime, datetime]:
+    """Return naive UTC bounds [start, end) of the current local day in a
+    specific timezone, to compare them with stored drink timestamps"""
+    today: date = timezones.service.now(timezone_name).date()
+    return timezones.service.day_bounds(timezone_name, today)
 
-    if not location:
-        return const.DEFAULT_TZ
 
-    tz_finder: TimezoneFinder = TimezoneFinder()
+def get_timezone_by_city(city: str) -> str:
+    """Return a timezone of the city. Common and already seen cities are
+    resolved offline"""
+    return geocoding.resolver.resolve(city)
+
+
+async def get_timezone_by_city_async(user_id: int, city: str) -> str:
+    """Return a timezone of the city without blocking the event loop.
 
-    timezone: str | None = tz_finder.timezone_at(
-        lng=location.longitude, lat=location.latitude
+    If the network lookup doesn't finish in time, the default timezone is
+    returned, and the user timezone is corrected in the background once
+    the lookup has finished"""
+    lookup: asyncio.Future[str] = geocoding.resolver.resolve_in_background(
+        city
     )
 
-    return const.DEFAULT_TZ if not timezone else timezone
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(lookup), const.GEOCODING_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Timezone lookup for user {user_id} has timed out. Using the"
+            " default one for now"
+        )
+
+    def on_lookup_done(lookup: asyncio.Future[str]) -> None:
+        if lookup.cancelled() or lookup.exception():
+            return
+
+        if lookup.result() != const.DEFAULT_TZ:
+            correction: asyncio.Task[None] = asyncio.create_task(
+                User.correct_timezone(
+                    user_id, lookup.result(), const.DEFAULT_TZ
+                )
+            )
+            _corrections.add(correction)
+            correction.add_done_callback(_corrections.discard)
+
+    lookup.add_done_callback(on_lookup_done)
+
+    return const.DEFAULT_TZ
 
 
-def get_or_create_user_notification_settings(
+def get_known_timezone_by_city(city: str) -> str | None:
+    """Return a timezone of the city if it can be resolved offline"""
+    return geocoding.resolver.lookup(city)
+
+
+async def get_or_create_user_notification_settings(
     user_id: int,
 ) -> NotificationSettings:
-    settings: Optional[NotificationSettings] = NotificationSettings.get(
+    settings: Optional[NotificationSettings] = await NotificationSettings.get(
         user_id
     )
 
     if settings:
+        await model.release_connection()
         return settings
 
     init_settings: NotificationSettings = NotificationSettings(user_id=user_id)
 
     model.Session.add(init_settings)
-    model.Session.commit()
+    await model.Session.commit()
 
     logger.info(f"Settings for user {user_id} has been initialized.")
     return init_settings
 
 
-def get_water_facts_state(user_id: int) -> WaterFacts:
-    facts_state: Optional[WaterFacts] = WaterFacts.get(user_id)
-
-    if facts_state:
-        return facts_state
+async def get_used_facts(user_ids: list[int]) -> dict[int, int]:
+    """Return the bitsets of used water facts for a batch of users at once.
+    The users who haven't seen any fact are omitted"""
+    used_facts: dict[int, int] = {}
 
-    init_state: WaterFacts = WaterFacts(user_id=user_id)
-
-    model.Session.add(init_state)
-    model.Session.commit()
+    for i in range(0, len(user_ids), const.SQL_CHUNK_SIZE):
+        rows: Any = await Session.execute(
+            select(WaterFacts.user_id, WaterFacts.used_facts).filter(
+                WaterFacts.user_id.in_(user_ids[i : i + const.SQL_CHUNK_SIZE])
+            )
+        )
+        used_facts.update(
+            (user_id, facts.decode_used_facts(used))
+            for user_id, used in rows
+        )
 
-    logger.info(f"Water facts for user {user_id} has been initialized.")
-    return init_state
+    return used_facts
+
+
+async def mark_facts_used(used_facts: dict[int, int]) -> None:
+    """Store the bitsets of used water facts for a batch of users at once.
+    The state is initialized for those users who don't have it yet"""
+    if not used_facts:
+        return
+
+    query: Any = model.insert(WaterFacts)
+
+    await Session.execute(
+        query.on_conflict_do_update(
+            index_elements=[WaterFacts.user_id],
+            set_={"used_facts": query.excluded.used_facts},
+        ),
+        [
+            {
+                "id": str(uuid4()),
+                "user_id": user_id,
+                "used_facts": facts.encode_used_facts(used),
+            }
+            for user_id, used in used_facts.items()
+        ],
+    )
+    await Session.commit()
 
 
 def get_drink_types() -> list[str]:
     """Return a list of drink type labels"""
-    dts = DrinkType.all()
-
-    return [dt.label for dt in dts]
+    return drinks.catalog.labels()
 
 
-def get_drink_type_by_label(label: str) -> DrinkType | None:
+def get_drink_type_by_label(label: str) -> Optional[DrinkTypeInfo]:
     """Return a drink type by label"""
-    return DrinkType.get_by_label(label)
+    return drinks.catalog.get(label)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+from typing import Any, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+import app.const as const
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receive updates from Telegram over HTTP.
+
+    An update is acknowledged as soon as it's queued, and processed by
+    `concurrency` workers, each update in its own task. Telegram is only
+    kept waiting if the queue is full.
+
+    Updates can be POSTed to the endpoint by hand, e.g. to replay recorded
+    ones locally"""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        concurrency: int,
+        secret: Optional[str] = None,
+        queue_size: int = const.WEBHOOK_QUEUE_SIZE,
+    ):
+        self.dispatcher: Dispatcher = dispatcher
+        self.concurrency: int = concurrency
+        self.secret: Optional[str] = secret
+        self.queue_size: int = queue_size
+
+        self._queue: Optional[asyncio.Queue[types.Update]] = None
+        self._workers: list[asyncio.Task[None]] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(const.WEBHOOK_PATH, self._handle)
+        app.on_startup.append(self._start_workers)
+        app.on_cleanup.append(self._stop_workers)
+
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        logger.info(f"Webhook server is listening on {host}:{port}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def join(self) -> None:
+        """Wait until all the received updates have been processed"""
+        if self._queue:
+            await self._queue.join()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret
+        ):
+            return web.Response(status=403)
+
+        try:
+            update: types.Update = types.Update(**await request.json())
+        except (ValueError, TypeError):
+            return web.Response(status=400)
+
+        if not self._queue:
+            return web.Response(status=503)
+
+        await self._queue.put(update)
+
+        return web.Response()
+
+    async def _start_workers(self, app: web.Application) -> None:
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+
+        self._queue = asyncio.Queue(self.queue_size)
+        self._workers = [
+            asyncio.ensure_future(self._work())
+            for _ in range(self.concurrency)
+        ]
+
+    async def _stop_workers(self, app: web.Application) -> None:
+        # let the acknowledged updates finish, Telegram won't resend them
+        await self.join()
+
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self) -> None:
+        queue: Any = self._queue
+
+        while True:
+            update: types.Update = await queue.get()
+
+            try:
+                # a task per update, so it gets its own database session
+                await asyncio.ensure_future(self._process(update))
+            except Exception:
+                logger.exception(f"Failed to process update {update}")
+            finally:
+                queue.task_done()
+
+    async def _process(self, update: types.Update) -> None:
+        await self.dispatcher.updates_handler.notify(update)
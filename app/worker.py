@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+import math
+import time
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+import app.model as model
+from app.model import JobLease, JobWorker
+
+
+logger = logging.getLogger(__name__)
+
+
+class Partition:
+    """Shards of users a job runs over. A user belongs to the shard
+    `user_id % count`"""
+
+    def __init__(self, worker: ShardWorker, shards: frozenset[int]):
+        self.shards: frozenset[int] = shards
+        self.count: int = worker.shards
+
+        self._worker: ShardWorker = worker
+
+    def filter(self, user_id: Any) -> Any:
+        """Build a filter of the users in the partition"""
+        return (user_id % self.count).in_(sorted(self.shards))
+
+    def is_held(self) -> bool:
+        """Check if the worker still holds the leases of the partition, so
+        nobody else works on these users"""
+        return self._worker.holds(self.shards)
+
+
+Job = Callable[[Partition], Awaitable[None]]
+
+
+class ShardWorker:
+    """Run jobs over a part of the users, so the jobs scale across several
+    processes without duplicate notifications.
+
+    Users are split into `shards` partitions. Each shard is claimed by one
+    worker through a lease row in the database. Leases are renewed every
+    `renew_interval` seconds and expire after `lease_ttl` seconds, so the
+    shards of a dead worker are taken over by the others.
+
+    Workers report their heartbeats, and each of them holds its fair share
+    of shards: it claims free and expired shards up to the share and gives
+    away the extra ones when more workers join"""
+
+    def __init__(self, shards: int, lease_ttl: float, renew_interval: float):
+        self.shards: int = shards
+        self.lease_ttl: float = lease_ttl
+        self.renew_interval: float = renew_interval
+        self.owner: str = (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        )
+
+        self._held: frozenset[int] = frozenset()
+        # the leases are trusted until then, by the monotonic clock
+        self._held_until: float = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def run(self) -> None:
+        """Maintain the leases until cancelled"""
+        await self._create_leases()
+
+        try:
+            while True:
+                try:
+                    await self.maintain()
+                except Exception:
+                    logger.exception("Failed to maintain the job leases")
+
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            await self.release()
+
+    async def run_job(self, job: Job) -> None:
+        """Run a job over the shards held by the worker"""
+        async with self._get_lock():
+            partition: Optional[Partition] = self.partition()
+
+            if not partition:
+                logger.info(f"Worker {self.owner} holds no shards. Skipping")
+                return
+
+            await job(partition)
+
+    def partition(self) -> Optional[Partition]:
+        if not self._held or not self.holds(self._held):
+            return
+
+        return Partition(self, self._held)
+
+    def holds(self, shards: frozenset[int]) -> bool:
+        return shards <= self._held and time.monotonic() < self._held_until
+
+    async def maintain(self) -> None:
+        """Renew the held leases and claim or give away shards to hold a
+        fair share of them"""
+        started_at: float = time.monotonic()
+        now: datetime = datetime.utcnow()
+        expires_at: datetime = now + timedelta(seconds=self.lease_ttl)
+        is_free: Any = or_(JobLease.owner.is_(None), JobLease.expires_at < now)
+
+        async with model.session_factory() as session:
+            await session.execute(
+                delete(JobWorker).filter(
+                    JobWorker.seen_at < now - timedelta(seconds=self.lease_ttl)
+                )
+            )
+            await session.merge(JobWorker(owner=self.owner, seen_at=now))
+            workers: int = await session.scalar(
+                select(func.count()).select_from(JobWorker)
+            )
+            share: int = math.ceil(self.shards / max(workers, 1))
+
+            await session.execute(
+                update(JobLease)
+                .filter(JobLease.owner == self.owner)
+                .values(expires_at=expires_at)
+            )
+            held: list[int] = list(
+                await session.scalars(
+                    select(JobLease.shard)
+                    .filter(JobLease.owner == self.owner)
+                    .filter(JobLease.shard < self.shards)
+                    .order_by(JobLease.shard)
+                )
+            )
+
+            # a running job must keep its shards
+            if len(held) > share and not self._get_lock().locked():
+                extra: list[int] = held[share:]
+                held = held[:share]
+
+                await session.execute(
+                    update(JobLease)
+                    .filter(JobLease.shard.in_(extra))
+                    .filter(JobLease.owner == self.owner)
+                    .values(owner=None, expires_at=now)
+                )
+                logger.info(f"Worker {self.owner} gave away shards {extra}")
+
+            if len(held) < share:
+                free: list[int] = list(
+                    await session.scalars(
+                        select(JobLease.shard)
+                        .filter(JobLease.shard < self.shards)
+                        .filter(is_free)
+                        .order_by(JobLease.shard)
+                    )
+                )
+
+                for shard in free[: share - len(held)]:
+                    result: Any = await session.execute(
+                        update(JobLease)
+                        .filter(JobLease.shard == shard)
+                        .filter(is_free)
+                        .values(owner=self.owner, expires_at=expires_at)
+                    )
+
+                    if result.rowcount:
+                        held.append(shard)
+                        logger.info(
+                            f"Worker {self.owner} claimed shard {shard}"
+                        )
+
+            await session.commit()
+
+        self._held = frozenset(held)
+        # keep a margin for the clock drift and a slow renewal
+        self._held_until = started_at + self.lease_ttl - self.renew_interval
+
+    async def release(self) -> None:
+        """Give away all the shards, so other workers don't have to wait for
+        the leases to expire"""
+        self._held, self._held_until = frozenset(), 0
+
+        async with model.session_factory() as session:
+            await session.execute(
+                update(JobLease)
+                .filter(JobLease.owner == self.owner)
+                .values(owner=None, expires_at=datetime.utcnow())
+            )
+            await session.execute(
+                delete(JobWorker).filter(JobWorker.owner == self.owner)
+            )
+            await session.commit()
+
+    async def _create_leases(self) -> None:
+        async with model.session_factory() as session:
+            existing: set[int] = set(
+                await session.scalars(select(JobLease.shard))
+            )
+            session.add_all(
+                JobLease(shard=shard, expires_at=datetime.utcnow())
+                for shard in range(self.shards)
+                if shard not in existing
+            )
+
+            try:
+                await session.commit()
+            except IntegrityError:
+                # another worker has just created them
+                await session.rollback()
+
+    def _get_lock(self) -> asyncio.Lock:
+        if not self._lock:
+            self._lock = asyncio.Lock()
+
+        return self._lock
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from contextvars import Context
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import app.const as const
+import app.metrics as metrics
+
+
+logger = logging.getLogger(__name__)
+
+Operation = Callable[[AsyncSession], Awaitable[None]]
+SessionFactory = async_sessionmaker[AsyncSession]
+# an operation, the user it's made for and the number of its failures
+Write = Tuple[Operation, Optional[int], int]
+
+
+class WriteBehindQueue:
+    """Coalesce small writes into batched transactions.
+
+    Operations are queued and applied together in a single transaction once
+    the batch is full or the oldest operation has waited for `max_delay`
+    seconds, so a commit (and its fsync) is shared by the whole batch.
+
+    Reads see their own writes: `sync` flushes the queue before a read if
+    there are queued or in-flight operations for the same user.
+
+    An operation is applied in a transaction as a whole. If it fails for a
+    reason that can pass, e.g. a locked or an unreachable database, it's
+    queued again, up to `const.WRITE_REQUEUES` times. Otherwise it's
+    dropped to `dead_letters` and counted by the `writes_dropped`
+    metric."""
+
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch: int = max_batch
+        self.max_delay: float = max_delay
+
+        self.dead_letters: deque[Write] = deque(
+            maxlen=const.WRITE_DEAD_LETTERS
+        )
+
+        self._session_factory: Optional[SessionFactory] = None
+        self._writes: list[Write] = []
+        self._queued: set[int] = set()
+        self._in_flight: set[int] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task[None]] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def setup(self, session_factory: SessionFactory) -> None:
+        """Set a session factory for the batch transactions"""
+        self._session_factory = session_factory
+
+    async def enqueue(
+        self, user_id: Optional[int], operation: Operation
+    ) -> None:
+        """Queue a write operation made on behalf of a user. The reads of
+        the user wait for it, unless `user_id` is None"""
+        self._writes.append((operation, user_id, 0))
+
+        if user_id is not None:
+            self._queued.add(user_id)
+
+        if len(self._writes) >= self.max_batch:
+            await self.flush()
+        else:
+            self._flush_later()
+
+    async def sync(self, user_id: Optional[int]) -> None:
+        """Make sure all the writes of the user have been committed"""
+        if user_id in self._queued or user_id in self._in_flight:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Commit all the queued operations in a single transaction"""
+        if not self._lock:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._writes:
+                return
+
+            writes: list[Write] = self._writes
+            self._in_flight = self._queued
+            self._writes, self._queued = [], set()
+
+            try:
+                await self._commit(writes)
+            finally:
+                self._in_flight = set()
+
+    async def close(self) -> None:
+        """Commit the pending writes on shutdown"""
+        if self._flush_task:
+            await self._flush_task
+
+        # the requeued writes are retried right away, every write is either
+        # committed or dropped after a few failures
+        while self._writes:
+            await self.flush()
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _commit(self, writes: list[Write]) -> None:
+        operations: list[Operation] = [write[0] for write in writes]
+
+        try:
+            await self._apply(operations)
+        except Exception:
+            logger.exception(
+                f"Batch of {len(operations)} writes failed. Retrying them"
+                " one by one."
+            )
+        else:
+            logger.debug(f"Batch of {len(operations)} writes committed")
+            return
+
+        # don't let a single broken operation drop the rest of the batch
+        failed: list[Write] = []
+
+        for operation, user_id, failures in writes:
+            try:
+                await self._apply([operation])
+            except Exception as e:
+                if _is_retriable(e) and failures < const.WRITE_REQUEUES:
+                    logger.warning(f"Write operation failed, requeued: {e}")
+                    failed.append((operation, user_id, failures + 1))
+                else:
+                    logger.exception("Write operation failed, dropped")
+                    self.dead_letters.append(
+                        (operation, user_id, failures + 1)
+                    )
+                    metrics.writes_dropped.inc()
+
+        if failed:
+            # the failed writes go before the newer ones of the same users
+            self._writes[:0] = failed
+            self._queued.update(
+                user_id for _, user_id, _ in failed if user_id is not None
+            )
+            self._flush_later()
+
+    async def _apply(self, operations: list[Operation]) -> None:
+        for attempt in range(1, const.WRITE_ATTEMPTS + 1):
+            try:
+                await self._apply_once(operations)
+                return
+            except OperationalError as e:
+                if attempt == const.WRITE_ATTEMPTS or not _is_locked(e):
+                    raise
+
+                logger.warning(
+                    f"Database is locked, retrying a batch of"
+                    f" {len(operations)} writes"
+                )
+                await asyncio.sleep(const.WRITE_RETRY_DELAY * attempt)
+
+    async def _apply_once(self, operations: list[Operation]) -> None:
+        if not self._session_factory:
+            raise RuntimeError("Write-behind queue isn't set up")
+
+        async with self._session_factory() as session:
+            for operation in operations:
+                await operation(session)
+                # let the next operations in the batch see this one
+                await session.flush()
+
+            await session.commit()
+
+    def _flush_later(self) -> None:
+        if not self._timer:
+            # the delayed flush doesn't belong to the update that started it
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._start_flush, context=Context()
+            )
+
+    def _start_flush(self) -> None:
+        self._timer = None
+
+        if not self._flush_task:
+            self._flush_task = asyncio.create_task(self.flush())
+            self._flush_task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task[None]) -> None:
+        self._flush_task = None
+
+        if not task.cancelled() and task.exception():
+            logger.error("Delayed flush failed", exc_info=task.exception())
+
+
+def _is_locked(error: OperationalError) -> bool:
+    """Check if SQLite has given up waiting for a lock held by another
+    connection, the transaction can be retried then"""
+    return "database is locked" in str(error.orig)
+
+
+def _is_retriable(error: Exception) -> bool:
+    """Check if a failed operation may succeed later as it is: the database
+    has been locked, unreachable or out of connections"""
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or (
+            isinstance(error, OperationalError) and _is_locked(error)
+        )
+
+    return isinstance(
+        error, (exc.TimeoutError, ConnectionError, asyncio.TimeoutError)
+    )
+
+
+def execute(statement: Any) -> Operation:
+    """Wrap a SQL statement into a write operation"""
+
+    async def operation(session: AsyncSession) -> None:
+        await session.execute(statement)
+
+    return operation
+
+
+queue = WriteBehindQueue(const.WRITE_BATCH_SIZE, const.WRITE_MAX_DELAY)
@@ -0,0 +1,6 @@
+"""Synthetic-load benchmarks of the jobs, handlers and reports.
+
+    python -m benchmarks --users 10000 --days 90 --output results.json
+
+The database is seeded on the first run and reused by the next runs with
+the same parameters. See `python -m benchmarks --help`"""
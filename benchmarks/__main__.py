@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Any
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the bot against a synthetic database",
+    )
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--drinks-per-day", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="runs of each job"
+    )
+    parser.add_argument(
+        "--sample", type=int, default=100, help="users per per-user call"
+    )
+    parser.add_argument(
+        "--database",
+        help="SQLite file, by default a temporary one per users/days/seed",
+    )
+    parser.add_argument(
+        "--reseed", action="store_true", help="seed the database again"
+    )
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args: argparse.Namespace = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+
+    database: str = args.database or os.path.join(
+        tempfile.gettempdir(),
+        f"watermelon-benchmark-{args.users}-{args.days}-{args.seed}.sqlite",
+    )
+    is_seeded: bool = os.path.exists(database) and not args.reseed
+
+    if args.reseed and os.path.exists(database):
+        os.remove(database)
+
+    # the engine is created from the environment when the app is imported
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{database}"
+    os.environ.pop("DEBUG_MODE", None)
+
+    from benchmarks import report, seed, suite
+
+    async def run() -> dict[str, Any]:
+        if not is_seeded:
+            print(f"Seeding {database}...", file=sys.stderr)
+            await seed.seed(
+                args.users, args.days, args.drinks_per_day, args.seed
+            )
+
+        return await suite.run(args.repeat, args.sample, args.seed)
+
+    report.write(
+        report.create(
+            {
+                "users": args.users,
+                "days": args.days,
+                "drinks_per_day": args.drinks_per_day,
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "sample": args.sample,
+            },
+            **asyncio.run(run()),
+        ),
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
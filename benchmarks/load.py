@@ -0,0 +1,263 @@
+"""End-to-end load test of the bot against a fake Telegram Bot API server.
+
+    python -m benchmarks.load --users 1000 --rounds 3 --output load.json
+
+The bot is started as a separate process and talks to the fake server over
+HTTP, exactly as it does to Telegram. Every simulated user registers and
+then goes through the `/drink`, `/today`, `/graph` and `/stats`
+conversations `rounds` times. The latency of a step is the time from an
+update being available to the bot until its last expected reply."""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Any, Optional, Tuple
+
+from benchmarks import report
+from benchmarks.telegram import FakeTelegramServer, Reply
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_USER_ID = 200000000
+BOT_TOKEN = "123456:fake-token"
+
+# (message, number of expected replies)
+Step = Tuple[str, int]
+
+SCENARIOS: dict[str, list[Step]] = {
+    "register": [
+        ("/register", 2),
+        ("малорухливий", 1),
+        ("помірний", 1),
+        ("70", 1),
+        ("Київ", 2),
+        ("так", 1),
+    ],
+    "drink": [("/drink", 1), ("250", 1), ("Вода", 1), ("так", 1)],
+    "today": [("/today", 1)],
+    "graph": [("/graph", 1)],
+    # the inline keyboard is closed with a callback
+    "stats": [("/stats", 1), ("callback:close", 1)],
+}
+
+
+class LoadGenerator:
+    """Drive scripted conversations of simulated users through the fake
+    server and collect the step latencies"""
+
+    def __init__(self, server: FakeTelegramServer, timeout: float):
+        self.server: FakeTelegramServer = server
+        self.timeout: float = timeout
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: defaultdict[str, int] = defaultdict(int)
+        self.updates: int = 0
+
+    async def run_user(self, user_id: int, rounds: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+        scenarios: list[str] = ["register"] + [
+            scenario
+            for _ in range(rounds)
+            for scenario in ("drink", "today", "graph", "stats")
+        ]
+
+        for scenario in scenarios:
+            if not await self.run_scenario(user_id, scenario):
+                # the conversation state is unknown, give up on the user
+                return
+
+    async def run_scenario(self, user_id: int, scenario: str) -> bool:
+        last_reply: Optional[Reply] = None
+
+        for text, replies in SCENARIOS[scenario]:
+            started_at: float = time.perf_counter()
+
+            if text.startswith("callback:") and last_reply:
+                await self.server.push_callback(
+                    user_id, last_reply.message_id, text.split(":", 1)[1]
+                )
+            else:
+                await self.server.push_message(user_id, text)
+
+            self.updates += 1
+
+            try:
+                for _ in range(replies):
+                    last_reply = await self.server.wait_reply(
+                        user_id, self.timeout
+                    )
+            except asyncio.TimeoutError:
+                self.errors[scenario] += 1
+                return False
+
+            self.latencies[scenario].append(
+                last_reply.received_at - started_at  # type: ignore
+            )
+
+        return True
+
+    def summary(self) -> dict[str, Any]:
+        latencies: list[float] = [
+            latency
+            for scenario_latencies in self.latencies.values()
+            for latency in scenario_latencies
+        ]
+
+        return {
+            "all": _summarize(latencies),
+            **{
+                scenario: _summarize(scenario_latencies)
+                for scenario, scenario_latencies in self.latencies.items()
+            },
+        }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    server = FakeTelegramServer(
+        args.latency, args.rate_limit, args.retry_after, args.seed
+    )
+    port: int = await server.start("127.0.0.1")
+    workdir: str = tempfile.mkdtemp(prefix="watermelon-load-")
+    log_path: str = os.path.join(workdir, "bot.log")
+
+    env: dict[str, str] = {
+        **os.environ,
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "DATABASE_URL": (
+            f"sqlite+aiosqlite:///{os.path.join(workdir, 'load.sqlite')}"
+        ),
+        "BOT_MODE": "polling",
+        "BOT_ROLE": "all",
+    }
+    env.pop("DEBUG_MODE", None)
+
+    with open(log_path, "w") as log:
+        process: subprocess.Popen[bytes] = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "bot.py")],
+            cwd=workdir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+    try:
+        await _wait_ready(server, process, args.startup_timeout)
+
+        generator = LoadGenerator(server, args.timeout)
+        rng = random.Random(args.seed)
+        started_at: float = time.perf_counter()
+
+        await asyncio.gather(
+            *(
+                generator.run_user(
+                    user_id, args.rounds, rng.uniform(0, args.ramp_up)
+                )
+                for user_id in range(
+                    FIRST_USER_ID, FIRST_USER_ID + args.users
+                )
+            )
+        )
+
+        duration: float = time.perf_counter() - started_at
+    finally:
+        process.terminate()
+        process.wait()
+        await server.stop()
+
+    return {
+        "duration": duration,
+        "updates": generator.updates,
+        "throughput": generator.updates / duration,
+        "latency": generator.summary(),
+        "errors": dict(generator.errors),
+        "rate_limited": server.rate_limited,
+        "calls": dict(server.calls),
+        "bot_log": log_path,
+    }
+
+
+async def _wait_ready(
+    server: FakeTelegramServer,
+    process: subprocess.Popen[bytes],
+    timeout: float,
+) -> None:
+    """Wait until the bot has set its commands, i.e. it's about to poll"""
+    deadline: float = time.monotonic() + timeout
+
+    while not server.ready.is_set():
+        if process.poll() is not None:
+            raise RuntimeError("The bot has exited, see its log")
+
+        if time.monotonic() > deadline:
+            raise RuntimeError("The bot hasn't started in time")
+
+        await asyncio.sleep(0.1)
+
+
+def _summarize(latencies: list[float]) -> dict[str, Any]:
+    if not latencies:
+        return {"steps": 0}
+
+    return {
+        "steps": len(latencies),
+        "p50": report.percentile(latencies, 50),
+        "p99": report.percentile(latencies, 99),
+        "max": max(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load",
+        description="Load the bot with simulated users end-to-end",
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--rounds", type=int, default=3, help="conversations per user"
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=10,
+        help="seconds over which the users join",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Bot API latency, seconds"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0,
+        help="share of the sends rejected with 429",
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="seconds to wait a reply"
+    )
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args: argparse.Namespace = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    parameters: dict[str, Any] = {
+        key: value for key, value in vars(args).items() if key != "output"
+    }
+    results: dict[str, Any] = asyncio.run(run(args))
+    report.write(report.create(parameters, **results), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import sys
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime
+from typing import Any, Optional
+
+
+def create(parameters: dict[str, Any], **results: Any) -> dict[str, Any]:
+    """Build a report of a benchmark run with the environment it ran in"""
+    return {
+        "commit": get_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "parameters": parameters,
+        **results,
+    }
+
+
+def write(report: dict[str, Any], output: Optional[str]) -> None:
+    """Write a report as JSON to a file, or to stdout if it's not set"""
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Return the nearest-rank percentile of the values"""
+    ordered: list[float] = sorted(values)
+    rank: int = max(math.ceil(percent / 100 * len(ordered)), 1)
+
+    return ordered[rank - 1]
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import uuid
+import random
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Iterator
+
+import pytz
+from sqlalchemy import insert
+
+import app.const as const
+import app.model as model
+import app.norms as norms
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+FIRST_USER_ID = 100000000
+
+
+async def seed(
+    users: int, days: int, drinks_per_day: int, seed: int = 0
+) -> None:
+    """Fill an empty database with `users` users spread across all the
+    common timezones, each with `days` days of drinks history up to now and
+    the matching daily totals.
+
+    The data is generated from the `seed`, so the same parameters always
+    produce the same database"""
+    rng = random.Random(seed)
+    now: datetime = datetime.utcnow()
+    timezone_names: list[str] = list(pytz.common_timezones)
+
+    await model.init_db()
+
+    user_rows: list[dict[str, Any]] = []
+    settings_rows: list[dict[str, Any]] = []
+
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+        weight: int = rng.randint(45, 120)
+        climate: str = rng.choice(const.CLIMATES)
+        activity: str = rng.choice(const.ACTIVITIES)
+
+        user_rows.append(
+            {
+                "id": user_id,
+                "name": f"user{user_id}",
+                "weight": weight,
+                "climate": climate,
+                "activity": activity,
+                "notify": rng.random() < 0.9,
+                "timezone": rng.choice(timezone_names),
+                "daily_norm": norms.calculate_norm(weight, climate, activity),
+            }
+        )
+
+        if rng.random() < 0.3:
+            start_time: int = rng.randint(6, 10) * const.MINUTE
+            end_time: int = start_time + rng.randint(10, 14) * const.MINUTE
+            settings_rows.append(
+                {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "user_id": user_id,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "frequency": rng.choice([60, 90, 120, 180]),
+                }
+            )
+
+    await _insert(model.User, user_rows)
+    await _insert(model.NotificationSettings, settings_rows)
+
+    drinks: int = 0
+    drink_rows: list[dict[str, Any]] = []
+    total_rows: list[dict[str, Any]] = []
+
+    for user in user_rows:
+        for drink_row, total_row in _generate_history(
+            rng, user, now, days, drinks_per_day
+        ):
+            drink_rows.extend(drink_row)
+            total_rows.append(total_row)
+
+        if len(drink_rows) >= BATCH_SIZE:
+            drinks += len(drink_rows)
+            await _insert(model.Drinks, drink_rows)
+            await _insert(model.DailyTotal, total_rows)
+            drink_rows, total_rows = [], []
+
+    drinks += len(drink_rows)
+    await _insert(model.Drinks, drink_rows)
+    await _insert(model.DailyTotal, total_rows)
+
+    logger.info(f"{users} users and {drinks} drinks have been seeded")
+
+
+def _generate_history(
+    rng: random.Random,
+    user: dict[str, Any],
+    now: datetime,
+    days: int,
+    drinks_per_day: int,
+) -> Iterator[tuple[list[dict[str, Any]], dict[str, Any]]]:
+    """Generate the drinks of each local day with their daily total"""
+    # a fixed offset is close enough for synthetic data, DST is ignored
+    offset: Any = pytz.timezone(user["timezone"]).utcoffset(now)
+    today: date = (now + offset).date()
+
+    for day in range(days):
+        local_date: date = today - timedelta(days=day)
+        midnight: datetime = (
+            datetime.combine(local_date, datetime.min.time()) - offset
+        )
+        drinks: list[dict[str, Any]] = []
+
+        for _ in range(rng.randint(0, drinks_per_day * 2)):
+            timestamp: datetime = midnight + timedelta(
+                seconds=rng.randint(7, 22) * const.HOUR
+                + rng.randrange(const.HOUR)
+            )
+
+            if timestamp > now:
+                continue
+
+            drinks.append(
+                {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "user_id": user["id"],
+                    "amount": rng.choice([150, 250, 330, 500, 750]),
+                    "timestamp": timestamp,
+                }
+            )
+
+        if not drinks:
+            continue
+
+        yield drinks, {
+            "user_id": user["id"],
+            "local_date": local_date,
+            "total_ml": sum(drink["amount"] for drink in drinks),
+            "last_drink_at": max(drink["timestamp"] for drink in drinks),
+            "count": len(drinks),
+        }
+
+
+async def _insert(table: Any, rows: list[dict[str, Any]]) -> None:
+    async with model.session_factory() as session:
+        for i in range(0, len(rows), BATCH_SIZE):
+            await session.execute(insert(table), rows[i : i + BATCH_SIZE])
+
+        await session.commit()
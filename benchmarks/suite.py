@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import time
+import random
+import statistics
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import func, select, update
+
+import app.jobs as jobs
+import app.cache as cache
+import app.model as model
+import app.utils as utils
+import app.delivery as delivery
+from app.model import User
+
+
+class Benchmark:
+    """Timings of a single benchmark, in seconds, and the number of messages
+    sent by the last run"""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.timings: list[float] = []
+        self.sent: int = 0
+
+    async def measure(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        started: float = time.perf_counter()
+        result: Any = await call()
+        self.timings.append(time.perf_counter() - started)
+
+        return result
+
+    def summary(self) -> dict[str, Any]:
+        summary: dict[str, Any] = {
+            "runs": len(self.timings),
+            "min": min(self.timings),
+            "median": statistics.median(self.timings),
+            "mean": statistics.mean(self.timings),
+            "max": max(self.timings),
+        }
+
+        if self.sent:
+            summary["sent"] = self.sent
+
+        return summary
+
+
+class StubDelivery:
+    """Count the messages instead of sending them to Telegram"""
+
+    def __init__(self):
+        self.sent: int = 0
+
+    async def __call__(self, chat_id: int, text: str) -> bool:
+        self.sent += 1
+        return True
+
+
+async def run(repeat: int, sample: int, seed: int = 0) -> dict[str, Any]:
+    """Run all the benchmarks against the seeded database. The jobs run
+    `repeat` times, the per-user calls run once for each of the `sample`
+    random users"""
+    stub: StubDelivery = StubDelivery()
+    delivery.client._send = stub  # type: ignore
+
+    async with model.session_factory() as session:
+        user_ids: list[int] = list(
+            await session.scalars(select(User.id).order_by(User.id))
+        )
+        drinks: int = await session.scalar(
+            select(func.count()).select_from(model.Drinks)
+        )
+
+    sampled: list[int] = random.Random(seed).sample(
+        user_ids, min(sample, len(user_ids))
+    )
+    benchmarks: list[Benchmark] = [
+        await _bench_job("notify_job", jobs.notify_job, repeat, stub),
+        await _bench_job("water_facts", jobs.water_facts, repeat, stub),
+        await _bench_user(
+            "get_today_drinks", utils.get_today_drinks, sampled
+        ),
+        await _bench_user(
+            "calculate_user_norm", _calculate_user_norm, sampled
+        ),
+        await _bench_user(
+            "aggregate_monthly_data", utils.aggregate_monthly_data, sampled
+        ),
+        await _bench_user(
+            "monthly_report_plot", _monthly_report_plot, sampled
+        ),
+    ]
+
+    return {
+        "users": len(user_ids),
+        "drinks": drinks,
+        "results": {
+            benchmark.name: benchmark.summary() for benchmark in benchmarks
+        },
+    }
+
+
+async def _bench_job(
+    name: str,
+    job: Callable[[], Awaitable[None]],
+    repeat: int,
+    stub: StubDelivery,
+) -> Benchmark:
+    benchmark: Benchmark = Benchmark(name)
+
+    for _ in range(repeat):
+        # every run starts from the same state, as if nobody has been
+        # reminded yet, so all the users are scanned
+        async with model.session_factory() as session:
+            await session.execute(update(User).values(next_due_at=None))
+            await session.execute(
+                update(model.NotificationSettings).values(notified_at=None)
+            )
+            await session.commit()
+
+        sent: int = stub.sent
+        await benchmark.measure(job)
+        benchmark.sent = stub.sent - sent
+
+    return benchmark
+
+
+async def _bench_user(
+    name: str, call: Callable[[User], Awaitable[Any]], user_ids: list[int]
+) -> Benchmark:
+    benchmark: Benchmark = Benchmark(name)
+
+    for user_id in user_ids:
+        user: Any = await User.get(user_id)
+        await benchmark.measure(lambda: call(user))
+        await model.Session.remove()
+
+    return benchmark
+
+
+async def _calculate_user_norm(user: User) -> int:
+    return utils.calculate_user_norm(user)
+
+
+async def _monthly_report_plot(user: User) -> Any:
+    # measure the rendering, not the report cache
+    cache.reports.clear()
+    return await utils.monthly_report_plot(user)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import time
+import json
+import random
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Any, Optional
+
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+BOT_ID = 1000000
+# methods that deliver something to a chat, they can be rate limited
+SEND_METHODS = {"sendmessage", "sendphoto", "editmessagereplymarkup"}
+
+
+class Reply:
+    """A call of a send method received for a chat"""
+
+    def __init__(
+        self, method: str, params: dict[str, Any], message_id: int
+    ):
+        self.method: str = method
+        self.params: dict[str, Any] = params
+        self.message_id: int = message_id
+        self.received_at: float = time.perf_counter()
+
+    @property
+    def text(self) -> Optional[str]:
+        return self.params.get("text")
+
+
+class FakeTelegramServer:
+    """A local stand-in for the Bot API methods the bot uses.
+
+    Updates are pushed by a load generator and served to the bot with
+    `getUpdates` long polling. The send methods are answered after the
+    `latency` seconds, and a `rate_limit_ratio` share of them is rejected
+    with 429 Too Many Requests. Each accepted call is put to the queue of
+    its chat, to be awaited with `wait_reply`.
+
+    Point the bot to it with `TELEGRAM_API_URL=http://host:port`"""
+
+    def __init__(
+        self,
+        latency: float = 0,
+        rate_limit_ratio: float = 0,
+        retry_after: int = 1,
+        seed: int = 0,
+    ):
+        self.latency: float = latency
+        self.rate_limit_ratio: float = rate_limit_ratio
+        self.retry_after: int = retry_after
+        self.calls: Counter[str] = Counter()
+        self.rate_limited: int = 0
+        self.ready: asyncio.Event = asyncio.Event()
+
+        self._rng: random.Random = random.Random(seed)
+        self._updates: list[dict[str, Any]] = []
+        self._update_id: int = 0
+        self._message_id: int = 0
+        self._new_updates: asyncio.Condition = asyncio.Condition()
+        self._replies: defaultdict[int, asyncio.Queue[Reply]] = defaultdict(
+            asyncio.Queue
+        )
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+
+        return app
+
+    async def start(self, host: str, port: int = 0) -> int:
+        """Start listening. Return the port, a free one is picked for 0"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        return self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def push_message(self, user_id: int, text: str) -> None:
+        """Send a text message to the bot from a private chat"""
+        message: dict[str, Any] = self._make_message(user_id, text)
+        message["from"] = _make_user(user_id)
+
+        if text.startswith("/"):
+            message["entities"] = [
+                {
+                    "type": "bot_command",
+                    "offset": 0,
+                    "length": len(text.split()[0]),
+                }
+            ]
+
+        await self._push({"message": message})
+
+    async def push_callback(
+        self, user_id: int, message_id: int, data: str
+    ) -> None:
+        """Press an inline button of a message sent by the bot"""
+        await self._push(
+            {
+                "callback_query": {
+                    "id": str(self._update_id),
+                    "from": _make_user(user_id),
+                    "chat_instance": str(user_id),
+                    "data": data,
+                    "message": {
+                        "message_id": message_id,
+                        "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"},
+                        "from": _make_user(BOT_ID, is_bot=True),
+                        "text": "",
+                    },
+                }
+            }
+        )
+
+    async def wait_reply(self, chat_id: int, timeout: float) -> Reply:
+        return await asyncio.wait_for(self._replies[chat_id].get(), timeout)
+
+    async def _push(self, update: dict[str, Any]) -> None:
+        async with self._new_updates:
+            self._update_id += 1
+            self._updates.append({"update_id": self._update_id, **update})
+            self._new_updates.notify_all()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method: str = request.match_info["method"].lower()
+        params: dict[str, Any] = await _read_params(request)
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            return _ok(await self._get_updates(params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in SEND_METHODS and (
+            self._rng.random() < self.rate_limit_ratio
+        ):
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": (
+                        "Too Many Requests: retry after"
+                        f" {self.retry_after}"
+                    ),
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        if method == "getme":
+            return _ok(_make_user(BOT_ID, is_bot=True))
+
+        if method == "setmycommands":
+            self.ready.set()
+
+        if method not in SEND_METHODS:
+            return _ok(True)
+
+        chat_id: int = int(params["chat_id"])
+
+        if method == "editmessagereplymarkup":
+            self._replies[chat_id].put_nowait(
+                Reply(method, params, int(params["message_id"]))
+            )
+            return _ok(True)
+
+        message: dict[str, Any] = self._make_message(
+            chat_id, params.get("text")
+        )
+        self._replies[chat_id].put_nowait(
+            Reply(method, params, message["message_id"])
+        )
+        message["from"] = _make_user(BOT_ID, is_bot=True)
+
+        if method == "sendphoto":
+            message["photo"] = [
+                {
+                    "file_id": f"photo{message['message_id']}",
+                    "file_unique_id": f"photo{message['message_id']}",
+                    "width": 640,
+                    "height": 480,
+                }
+            ]
+
+        return _ok(message)
+
+    async def _get_updates(
+        self, params: dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        offset: int = int(params.get("offset") or 0)
+        limit: int = int(params.get("limit") or 100)
+        timeout: float = float(params.get("timeout") or 0)
+
+        if offset < 0:
+            # the bot skips the pending updates on startup
+            self._updates = self._updates[offset:]
+        elif offset:
+            self._updates = [
+                update
+                for update in self._updates
+                if update["update_id"] >= offset
+            ]
+
+        async with self._new_updates:
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(
+                        self._new_updates.wait(), timeout
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+            return self._updates[:limit]
+
+    def _make_message(
+        self, chat_id: int, text: Optional[str]
+    ) -> dict[str, Any]:
+        self._message_id += 1
+        message: dict[str, Any] = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+
+        if text is not None:
+            message["text"] = text
+
+        return message
+
+
+async def _read_params(request: web.Request) -> dict[str, Any]:
+    params: dict[str, Any] = dict(request.query)
+
+    if request.content_type == "application/json":
+        params.update(await request.json())
+    else:
+        for key, value in (await request.post()).items():
+            # files are accepted and dropped
+            if isinstance(value, str):
+                params[key] = value
+
+    return params
+
+
+def _ok(result: Any) -> web.Response:
+    return web.json_response(
+        {"ok": True, "result": result},
+        dumps=lambda data: json.dumps(data, ensure_ascii=False),
+    )
+
+
+def _make_user(user_id: int, is_bot: bool = False) -> dict[str, Any]:
+    return {
+        "id": user_id,
+        "is_bot": is_bot,
+        "first_name": f"user{user_id}",
+        "username": f"user{user_id}",
+    }
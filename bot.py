@@ -3,15 +3,29 @@ import logging
 import inspect
 
 from aiogram import Bot, Dispatcher
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.types import BotCommand
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 import app.jobs as jobs
+import app.const as const
 import app.config as conf
+import app.webhook as webhook
 import app.model as model
-from app.middleware import RegisterMiddleware
+import app.facts as facts
+import app.geocoding as geocoding
+import app.fsm_storage as fsm_storage
+import app.delivery as delivery
+import app.writer as writer
+import app.membership as membership
+import app.worker as worker
+import app.metrics as metrics
+from app.middleware import (
+    MetricsMiddleware,
+    RegisterMiddleware,
+    SessionMiddleware,
+)
 from app.handlers import get_handlers
 
 
@@ -36,13 +50,60 @@ async def main():
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
     )
-    logger.info("Starting watermelon bot")
+    role: str = conf.get_bot_role()
+    logger.info(f"Starting watermelon bot, role: {role}")
+
+    api_url: str | None = conf.get_telegram_api_url()
+    bot = Bot(
+        token=conf.get_bot_token(),
+        server=(
+            TelegramAPIServer.from_base(api_url)
+            if api_url
+            else TELEGRAM_PRODUCTION
+        ),
+    )
 
-    bot = Bot(token=conf.get_bot_token())
-    dp = Dispatcher(bot, storage=MemoryStorage())
+    # Share the bot HTTP session with the notifications delivery client
+    delivery.client.setup(bot)
 
     # Initialize database
-    model.init_db()
+    await model.init_db()
+
+    # Load water facts catalog
+    facts.catalog.refresh()
+
+    scheduler = AsyncIOScheduler()
+
+    metrics_server = metrics.MetricsServer(metrics.registry)
+    metrics_port: int | None = conf.get_metrics_port()
+    lag_monitor: asyncio.Task = asyncio.create_task(
+        metrics.monitor_loop_lag(const.LOOP_LAG_INTERVAL)
+    )
+
+    if metrics_port:
+        await metrics_server.start(conf.get_metrics_host(), metrics_port)
+
+    try:
+        if role == const.ROLE_WORKER:
+            await run_worker(scheduler)
+        else:
+            await run_bot(bot, scheduler, with_jobs=role == const.ROLE_ALL)
+    finally:
+        lag_monitor.cancel()
+        await metrics_server.stop()
+        # don't lose the writes that are still waiting for a batch commit
+        await writer.queue.close()
+
+
+async def run_bot(bot: Bot, scheduler: AsyncIOScheduler, with_jobs: bool):
+    dp = Dispatcher(bot, storage=fsm_storage.storage)
+
+    # Load registered users for the registration check
+    membership.index.load(await model.User.all_ids())
+    await model.Session.remove()
+
+    # Load known city timezones
+    geocoding.resolver.load()
 
     # Register handlers
     for handler in get_handlers():
@@ -53,20 +114,73 @@ async def main():
 
     # Setup Middlewares
     dp.middleware.setup(RegisterMiddleware())
+    dp.middleware.setup(SessionMiddleware())
+    # after the registration check, it measures the handlers that run
+    dp.middleware.setup(MetricsMiddleware())
 
     # Setup BOT commands
     await set_commands(bot)
 
-    # Setup task scheduler
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(jobs.notify_job, "interval", minutes=5)
-    scheduler.add_job(jobs.water_facts, "interval", minutes=60)
+    # Setup task scheduler, the jobs are left to the workers if there are any
+    if with_jobs:
+        scheduler.add_job(jobs.notify_job, "interval", minutes=5)
+        scheduler.add_job(jobs.water_facts, "interval", minutes=60)
+
+    scheduler.add_job(fsm_storage.storage.evict_expired, "interval", hours=1)
 
     scheduler.start()
 
+    if conf.get_bot_mode() == const.MODE_WEBHOOK:
+        await run_webhook(dp)
+    else:
+        await run_polling(dp)
+
+
+async def run_worker(scheduler: AsyncIOScheduler):
+    """Run the jobs over the users of the shards leased by the process"""
+    shard_worker = worker.ShardWorker(
+        conf.get_worker_shards(), const.LEASE_TTL, const.LEASE_RENEW_INTERVAL
+    )
+
+    scheduler.add_job(
+        shard_worker.run_job, "interval", minutes=5, args=[jobs.notify_job]
+    )
+    scheduler.add_job(
+        shard_worker.run_job, "interval", minutes=60, args=[jobs.water_facts]
+    )
+
+    scheduler.start()
+
+    await shard_worker.run()
+
+
+async def run_polling(dp: Dispatcher):
+    # updates can't be polled while a webhook is set
+    await dp.bot.delete_webhook()
     await dp.skip_updates()
     await dp.start_polling()
 
 
+async def run_webhook(dp: Dispatcher):
+    concurrency: int = conf.get_webhook_concurrency()
+    server = webhook.WebhookServer(dp, concurrency, conf.get_webhook_secret())
+    await server.start(conf.get_webhook_host(), conf.get_webhook_port())
+
+    url: str | None = conf.get_webhook_url()
+
+    if url:
+        await dp.bot.set_webhook(
+            url.rstrip("/") + const.WEBHOOK_PATH,
+            secret_token=conf.get_webhook_secret(),
+            # Telegram allows up to 100 connections
+            max_connections=min(concurrency, 100),
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,28 @@
+"""Add user.next_due_at column
+
+Revision ID: 3b8e51c0d7a4
+Revises: c0b2a0653f1c
+Create Date: 2026-10-18 18:12:40.114375
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3b8e51c0d7a4"
+down_revision = "c0b2a0653f1c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user", sa.Column("next_due_at", sa.DateTime(), nullable=True)
+    )
+    op.create_index("ix_user_next_due_at", "user", ["next_due_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_next_due_at", table_name="user")
+    op.drop_column("user", "next_due_at")
@@ -0,0 +1,75 @@
+"""Add daily_totals table
+
+Revision ID: 5e07c9a3b2d6
+Revises: 9d2f6a4e81b3
+Create Date: 2026-10-18 19:02:51.870214
+
+"""
+import pytz
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e07c9a3b2d6"
+down_revision = "9d2f6a4e81b3"
+branch_labels = None
+depends_on = None
+
+user = sa.table(
+    "user",
+    sa.column("id", sa.Integer()),
+    sa.column("timezone", sa.String()),
+)
+drinks = sa.table(
+    "drinks",
+    sa.column("user_id", sa.Integer()),
+    sa.column("amount", sa.Integer()),
+    sa.column("timestamp", sa.DateTime()),
+)
+
+
+def upgrade() -> None:
+    daily_totals = op.create_table(
+        "daily_totals",
+        sa.Column(
+            "user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False
+        ),
+        sa.Column("local_date", sa.Date(), nullable=False),
+        sa.Column("total_ml", sa.Integer(), nullable=False, default=0),
+        sa.Column("last_drink_at", sa.DateTime(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, default=0),
+        sa.PrimaryKeyConstraint("user_id", "local_date"),
+    )
+
+    # backfill the rollup from the existing drinks history
+    conn = op.get_bind()
+    timezones = dict(conn.execute(sa.select(user.c.id, user.c.timezone)).all())
+    totals = {}
+
+    for row in conn.execute(
+        sa.select(drinks).order_by(drinks.c.timestamp)
+    ).all():
+        timezone = pytz.timezone(timezones.get(row.user_id) or "Europe/Kiev")
+        local_date = (
+            pytz.utc.localize(row.timestamp).astimezone(timezone).date()
+        )
+        total = totals.setdefault(
+            (row.user_id, local_date),
+            {
+                "user_id": row.user_id,
+                "local_date": local_date,
+                "total_ml": 0,
+                "count": 0,
+            },
+        )
+        total["total_ml"] += row.amount
+        total["count"] += 1
+        total["last_drink_at"] = row.timestamp
+
+    if totals:
+        op.bulk_insert(daily_totals, list(totals.values()))
+
+
+def downgrade() -> None:
+    op.drop_table("daily_totals")
@@ -0,0 +1,37 @@
+"""Add fsm_state table
+
+Revision ID: 6c3f0e9a1d57
+Revises: d4a91c7e5f28
+Create Date: 2026-10-18 23:05:37.218465
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6c3f0e9a1d57"
+down_revision = "d4a91c7e5f28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fsm_state",
+        sa.Column("chat", sa.BigInteger(), nullable=False),
+        sa.Column("user", sa.BigInteger(), nullable=False),
+        sa.Column("state", sa.String(), nullable=True),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("bucket", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("chat", "user"),
+    )
+    op.create_index(
+        "ix_fsm_state_updated_at", "fsm_state", ["updated_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fsm_state_updated_at", table_name="fsm_state")
+    op.drop_table("fsm_state")
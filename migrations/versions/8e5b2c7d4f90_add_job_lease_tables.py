@@ -0,0 +1,41 @@
+"""Add job_lease and job_worker tables
+
+Revision ID: 8e5b2c7d4f90
+Revises: 6c3f0e9a1d57
+Create Date: 2026-10-18 23:48:12.604317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8e5b2c7d4f90"
+down_revision = "6c3f0e9a1d57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job_lease",
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("owner", sa.String(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("shard"),
+    )
+    op.create_table(
+        "job_worker",
+        sa.Column("owner", sa.String(), nullable=False),
+        sa.Column("seen_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("owner"),
+    )
+    op.create_index(
+        "ix_job_worker_seen_at", "job_worker", ["seen_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_job_worker_seen_at", table_name="job_worker")
+    op.drop_table("job_worker")
+    op.drop_table("job_lease")
@@ -0,0 +1,64 @@
+"""Store water_facts.used_facts as a bitset
+
+Revision ID: 9d2f6a4e81b3
+Revises: 3b8e51c0d7a4
+Create Date: 2026-10-18 18:40:02.528310
+
+"""
+import pickle
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9d2f6a4e81b3"
+down_revision = "3b8e51c0d7a4"
+branch_labels = None
+depends_on = None
+
+water_facts = sa.table(
+    "water_facts",
+    sa.column("id", sa.Text()),
+    sa.column("used_facts", sa.LargeBinary()),
+)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    for row in conn.execute(sa.select(water_facts)).all():
+        if not row.used_facts:
+            continue
+
+        used = 0
+
+        for fact_id in pickle.loads(row.used_facts):
+            used |= 1 << fact_id
+
+        conn.execute(
+            water_facts.update()
+            .where(water_facts.c.id == row.id)
+            .values(
+                used_facts=used.to_bytes(
+                    (used.bit_length() + 7) // 8, "little"
+                )
+            )
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+
+    for row in conn.execute(sa.select(water_facts)).all():
+        if not row.used_facts:
+            continue
+
+        used = int.from_bytes(row.used_facts, "little")
+        used_facts = [i for i in range(used.bit_length()) if used >> i & 1]
+
+        conn.execute(
+            water_facts.update()
+            .where(water_facts.c.id == row.id)
+            .values(used_facts=pickle.dumps(used_facts))
+        )
@@ -0,0 +1,45 @@
+"""Add user_id indexes to drinks, notification_settings and water_facts
+
+Revision ID: b71d4e2f9c05
+Revises: 5e07c9a3b2d6
+Create Date: 2026-10-18 19:31:17.402669
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b71d4e2f9c05"
+down_revision = "5e07c9a3b2d6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_drinks_user_id_timestamp",
+        "drinks",
+        ["user_id", "timestamp", "amount"],
+    )
+
+    # a user must have a single row, drop duplicates before the unique index
+    # is created. Keep the most recently notified settings and the facts
+    # with the longest progress, the id only breaks the ties
+    for table, order in (
+        ("notification_settings", "k.notified_at IS NULL, k.notified_at DESC"),
+        ("water_facts", "COALESCE(LENGTH(k.used_facts), 0) DESC"),
+    ):
+        op.execute(
+            f"DELETE FROM {table} WHERE id <>"
+            f" (SELECT k.id FROM {table} k WHERE k.user_id = {table}.user_id"
+            f" ORDER BY {order}, k.id LIMIT 1)"
+        )
+        op.create_index(f"ix_{table}_user_id", table, ["user_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_water_facts_user_id", table_name="water_facts")
+    op.drop_index(
+        "ix_notification_settings_user_id", table_name="notification_settings"
+    )
+    op.drop_index("ix_drinks_user_id_timestamp", table_name="drinks")
@@ -0,0 +1,66 @@
+"""Add user.daily_norm column
+
+Revision ID: d4a91c7e5f28
+Revises: b71d4e2f9c05
+Create Date: 2026-10-18 21:40:13.502871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d4a91c7e5f28"
+down_revision = "b71d4e2f9c05"
+branch_labels = None
+depends_on = None
+
+ACTIVITY_MAP = {
+    "малорухливий": 1.0,
+    "легка активність": 1.1,
+    "помірно активний": 1.2,
+    "дуже активний": 1.3,
+    "надзвичайно активний": 1.4,
+}
+CLIMATE_MAP = {
+    "тропічний": 1.7,
+    "помірний": 1.1,
+    "холодний": 0.9,
+}
+
+user = sa.table(
+    "user",
+    sa.column("weight", sa.Integer()),
+    sa.column("climate", sa.String()),
+    sa.column("activity", sa.String()),
+    sa.column("norm", sa.Integer()),
+    sa.column("daily_norm", sa.Integer()),
+)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user", sa.Column("daily_norm", sa.Integer(), nullable=True)
+    )
+
+    op.execute(
+        user.update().values(
+            daily_norm=sa.case(
+                (
+                    sa.and_(user.c.norm.is_not(None), user.c.norm != 0),
+                    user.c.norm,
+                ),
+                else_=sa.cast(
+                    user.c.weight
+                    * 35
+                    * sa.case(CLIMATE_MAP, value=user.c.climate)
+                    * sa.case(ACTIVITY_MAP, value=user.c.activity),
+                    sa.Integer(),
+                ),
+            )
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user", "daily_norm")
@@ -0,0 +1,29 @@
+"""Add fsm_state version column
+
+Revision ID: e3a8d1f6b2c4
+Revises: 8e5b2c7d4f90
+Create Date: 2026-10-18 23:58:41.127805
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e3a8d1f6b2c4"
+down_revision = "8e5b2c7d4f90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "fsm_state",
+        sa.Column(
+            "version", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("fsm_state", "version")
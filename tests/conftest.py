@@ -0,0 +1,4 @@
+import os
+
+# every test session works with a fresh in-memory database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
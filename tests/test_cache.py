@@ -0,0 +1,48 @@
+from datetime import date
+
+from app.cache import ReportCache, ReportKey
+
+
+def _key(cache: ReportCache, user_id: int, total: int = 1500) -> ReportKey:
+    return cache.key(user_id, "2030-05", {date(2030, 5, 1): total}, 2000)
+
+
+class TestReportCache:
+    def test_changed_data_gets_new_key(self):
+        cache = ReportCache(max_entries=10, max_bytes=100)
+        cache.put(_key(cache, 1), b"first")
+
+        # the same data read again, e.g. by another process
+        assert cache.get(_key(cache, 1)) == b"first"
+        assert cache.get(_key(cache, 1, total=1750)) is None
+        assert cache.get(
+            cache.key(1, "2030-05", {date(2030, 5, 1): 1500}, 2500)
+        ) is None
+        assert cache.get(_key(cache, 2)) is None
+
+    def test_least_recent_entry_is_evicted(self):
+        cache = ReportCache(max_entries=2, max_bytes=100)
+        keys: list[ReportKey] = [_key(cache, i) for i in range(3)]
+        cache.put(keys[0], b"0")
+        cache.put(keys[1], b"1")
+
+        cache.get(keys[0])  # now the second one is the least recent
+        cache.put(keys[2], b"2")
+
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) == b"0"
+        assert cache.get(keys[2]) == b"2"
+
+    def test_entries_are_bounded_by_size(self):
+        cache = ReportCache(max_entries=10, max_bytes=10)
+        keys: list[ReportKey] = [_key(cache, i) for i in range(4)]
+        cache.put(keys[0], b"a" * 4)
+        cache.put(keys[1], b"b" * 4)
+        cache.put(keys[2], b"c" * 4)
+        cache.put(keys[3], b"d" * 11)
+
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[1]) == b"b" * 4
+        assert cache.get(keys[2]) == b"c" * 4
+        assert cache.get(keys[3]) is None
+        assert cache._size == 8
@@ -0,0 +1,26 @@
+import asyncio
+from datetime import date
+
+import app.charts as charts
+
+
+class TestCharts:
+    def test_report_is_rendered_in_worker(self):
+        data: dict[date, int] = {
+            date(2030, 5, day): amount
+            for day, amount in zip(range(1, 9), range(1500, 3100, 200))
+        }
+
+        try:
+            image: bytes = asyncio.run(
+                charts.render_monthly_report_async(data, 2500)
+            )
+        finally:
+            charts._get_executor().shutdown()
+            charts._executor = None
+
+        assert image.startswith(b"\x89PNG")
+
+    def test_date_is_formatted_without_locale(self):
+        assert charts.format_date(date(2030, 5, 5)) == " 5 травня"
+        assert charts.format_date(date(2030, 12, 31)) == "31 грудня"
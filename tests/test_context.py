@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any
+from unittest import mock
+
+import app.model as model
+import app.utils as utils
+import app.context as context
+from app.middleware import SessionMiddleware
+
+
+USER_ID = 1
+
+
+async def _create_user():
+    await model.init_db()
+
+    if not await utils.get_user(USER_ID):
+        await utils.create_user(
+            {
+                "id": USER_ID,
+                "name": "test",
+                "weight": 70,
+                "climate": "помірний",
+                "activity": "малорухливий",
+            }
+        )
+        await utils.get_or_create_user_notification_settings(USER_ID)
+
+    await model.Session.remove()
+
+
+class TestSessionMiddleware:
+    def test_update_loads_user_once(self):
+        async def process_update() -> tuple[dict[str, Any], int, bool]:
+            middleware = SessionMiddleware()
+            update: Any = mock.Mock(update_id=1)
+            message: Any = mock.Mock()
+            message.from_user.id = USER_ID
+
+            update_data: dict[str, Any] = {}
+            data: dict[str, Any] = {}
+
+            await middleware.on_pre_process_update(update, update_data)
+            await middleware.on_pre_process_message(message, data)
+            await middleware.on_pre_process_message(message, data)
+
+            utils.calculate_user_norm(data["user"])
+            queries: int = context.get().queries  # type: ignore
+            # the connection isn't held while the handler runs
+            holds_connection: bool = model.Session().in_transaction()
+
+            await middleware.on_post_process_update(update, [], update_data)
+
+            return data, queries, holds_connection
+
+        asyncio.run(_create_user())
+        data, queries, holds_connection = asyncio.run(process_update())
+
+        assert data["user"].id == USER_ID
+        assert data["settings"].user_id == USER_ID
+        assert queries == 1
+        assert not holds_connection
+        assert context.get() is None
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import date
+from typing import Any
+from unittest import mock
+
+from sqlalchemy import func, select
+
+import app.model as model
+import app.utils as utils
+import app.writer as writer
+import app.timezones as timezones
+
+
+class TestDailyTotals:
+    def test_rollup_follows_drinks(self):
+        # far from UTC, so the local date often differs from the UTC one
+        timezone: str = "Pacific/Kiritimati"
+
+        async def drink() -> tuple[Any, int, int]:
+            await model.init_db()
+
+            user = model.User(
+                id=51,
+                name="test",
+                weight=70,
+                climate="помірний",
+                activity="малорухливий",
+                timezone=timezone,
+            )
+            model.Session.add(user)
+            await model.Session.commit()
+
+            for amount in (250, 300, 150):
+                await utils.update_drink_consumption(user, amount)
+
+            # read-your-writes flushes the queued drinks
+            today_total: int = await utils.get_today_total(user)
+            total: Any = await model.DailyTotal.get(
+                user.id, utils.get_local_date(user)
+            )
+            drinks_sum: int = await model.Session.scalar(
+                select(func.sum(model.Drinks.amount)).filter(
+                    model.Drinks.user_id == user.id
+                )
+            )
+            await model.Session.remove()
+
+            return total, today_total, drinks_sum
+
+        total, today_total, drinks_sum = asyncio.run(drink())
+        local_today: date = timezones.service.now(timezone).date()
+
+        assert total.local_date == local_today
+        assert total.total_ml == today_total == drinks_sum == 700
+        assert total.count == 3
+        assert writer.queue._writes == []
+
+    def test_failed_drink_leaves_no_total(self):
+        async def drink() -> tuple[Any, int]:
+            await model.init_db()
+
+            user = model.User(
+                id=52,
+                name="test",
+                weight=70,
+                climate="помірний",
+                activity="малорухливий",
+                timezone="Europe/Kyiv",
+            )
+            model.Session.add(user)
+            await model.Session.commit()
+
+            # the reminder postponing is the last step of the write
+            with mock.patch.object(utils, "case", side_effect=ValueError):
+                await utils.update_drink_consumption(user, 250)
+                await writer.queue.flush()
+
+            total: Any = await model.DailyTotal.get(
+                user.id, utils.get_local_date(user)
+            )
+            drinks: int = await model.Session.scalar(
+                select(func.count(model.Drinks.id)).filter(
+                    model.Drinks.user_id == user.id
+                )
+            )
+            await model.Session.remove()
+
+            return total, drinks
+
+        dropped: int = len(writer.queue.dead_letters)
+
+        assert asyncio.run(drink()) == (None, 0)
+        assert len(writer.queue.dead_letters) - dropped == 1
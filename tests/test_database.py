@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any
+
+from sqlalchemy import text
+
+import app.config as conf
+import app.const as const
+import app.database as database
+
+
+class TestDatabase:
+    def test_aux_pool_is_taken_out_of_capacity(self, tmp_path, monkeypatch):
+        monkeypatch.setenv(
+            const.DATABASE_URL, f"sqlite+aiosqlite:///{tmp_path}/water.db"
+        )
+        engine: Any = database.create_engine()
+        aux_engine: Any = database.create_aux_engine(engine)
+        pools: list[Any] = [
+            engine.sync_engine.pool,
+            aux_engine.sync_engine.pool,
+        ]
+
+        try:
+            assert aux_engine is not engine
+            assert pools[1].size() == const.AUX_DB_POOL_SIZE
+            assert pools[1]._max_overflow == 0
+            assert (
+                sum(pool.size() + pool._max_overflow for pool in pools)
+                == conf.get_db_pool_capacity()
+            )
+            assert conf.get_webhook_concurrency() == (
+                pools[0].size() + pools[0]._max_overflow
+            )
+        finally:
+            asyncio.run(engine.dispose())
+            asyncio.run(aux_engine.dispose())
+
+    def test_sqlite_connections_are_tuned(self, tmp_path, monkeypatch):
+        monkeypatch.setenv(
+            const.DATABASE_URL, f"sqlite+aiosqlite:///{tmp_path}/water.db"
+        )
+        engine: Any = database.create_engine()
+
+        async def read_pragmas() -> dict[str, Any]:
+            async with engine.connect() as connection:
+                return {
+                    pragma: await connection.scalar(
+                        text(f"PRAGMA {pragma}")
+                    )
+                    for pragma in const.SQLITE_PRAGMAS
+                }
+
+        try:
+            pragmas: dict[str, Any] = asyncio.run(read_pragmas())
+        finally:
+            asyncio.run(engine.dispose())
+
+        assert pragmas == {
+            "journal_mode": "wal",
+            "synchronous": 1,  # NORMAL
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,
+            "busy_timeout": 5000,
+        }
+        assert engine.sync_engine.pool.size() == conf.get_db_pool_size()
+        assert engine.sync_engine.pool.timeout() == const.DB_POOL_TIMEOUT
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any
+from unittest import mock
+
+from aiogram.utils import exceptions
+
+import app.metrics as metrics
+from app.delivery import DeliveryClient
+
+
+class FakeBot:
+    """Fails the sends to some chats the way Telegram and the network do"""
+
+    def __init__(self):
+        self.sent: list[int] = []
+        self._rate_limited: set[int] = set()
+
+    async def send_message(self, chat_id: int, text: str):
+        if chat_id == 1 and chat_id not in self._rate_limited:
+            self._rate_limited.add(chat_id)
+            raise exceptions.RetryAfter(0)
+
+        if chat_id == 2:
+            raise exceptions.BotBlocked("Forbidden: bot was blocked")
+
+        if chat_id == 3:
+            raise asyncio.TimeoutError()
+
+        if chat_id == 4:
+            raise RuntimeError("Unexpected")
+
+        self.sent.append(chat_id)
+
+
+def _count(result: str) -> Any:
+    return metrics.notifications._values.get((result,), 0)
+
+
+class TestDeliveryClient:
+    def test_failures_dont_abort_broadcast(self):
+        bot = FakeBot()
+        client = DeliveryClient(concurrency=2)
+        client.setup(bot)  # type: ignore
+        sent, failed = _count("sent"), _count("failed")
+
+        with mock.patch("app.const.SEND_RETRY_DELAY", 0):
+            delivered: list[int] = asyncio.run(
+                client.broadcast((chat_id, "hi") for chat_id in range(1, 6))
+            )
+
+        assert delivered == [1, 5]
+        assert sorted(bot.sent) == [1, 5]
+        assert _count("sent") - sent == 2
+        assert _count("failed") - failed == 3
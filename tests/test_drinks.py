@@ -0,0 +1,21 @@
+from app.drinks import DrinkCatalog
+from app.types import DrinkTypeInfo
+
+
+class TestDrinkCatalog:
+    def test_version_changes_with_content(self):
+        catalog = DrinkCatalog()
+        water = DrinkTypeInfo(id="water", label="Вода", coefficient=100)
+        tea = DrinkTypeInfo(id="tea", label="Чай", coefficient=90)
+
+        catalog.load([water, tea])
+        loaded: int = catalog.version
+
+        catalog.load([water, tea])
+        assert catalog.version == loaded
+
+        catalog.load([water])
+        assert catalog.version == loaded + 1
+        assert catalog.labels() == ["Вода"]
+        assert catalog.get("Вода") == water
+        assert catalog.get("Чай") is None
@@ -0,0 +1,140 @@
+import os
+import json
+import asyncio
+from typing import Any
+from unittest import mock
+
+import app.const as const
+import app.delivery as delivery
+import app.facts as facts
+import app.jobs as jobs
+import app.model as model
+import app.utils as utils
+from app.facts import FactCatalog
+from app.types import NotifyCandidate
+
+
+def _write_facts(path: str, ids: list[int], mtime: float) -> None:
+    with open(path, "w") as f:
+        json.dump([{"id": i, "text": f"fact {i}"} for i in ids], f)
+
+    os.utime(path, (mtime, mtime))
+
+
+class TestFactCatalog:
+    def test_facts_dont_repeat(self, tmp_path):
+        path: str = str(tmp_path / "facts.json")
+        _write_facts(path, [3, 1, 2], 1000)
+        catalog = FactCatalog(path)
+
+        used: int = 0
+        seen: list[int] = []
+
+        while fact := catalog.next_fact(used):
+            seen.append(fact[0])
+            used |= 1 << fact[0]
+
+        assert seen == [1, 2, 3]
+        assert facts.decode_used_facts(facts.encode_used_facts(used)) == used
+
+    def test_changed_file_is_reloaded(self, tmp_path):
+        path: str = str(tmp_path / "facts.json")
+        _write_facts(path, [1], 1000)
+        catalog = FactCatalog(path)
+        first_used: int = 1 << 1
+
+        assert catalog.next_fact(0) == (1, "fact 1")
+        assert catalog.next_fact(first_used) is None
+
+        _write_facts(path, [1, 2], 2000)
+
+        assert catalog.next_fact(first_used) == (2, "fact 2")
+
+    def test_progress_starts_over_when_exhausted(self, tmp_path):
+        path: str = str(tmp_path / "facts.json")
+        _write_facts(path, [1, 2], 1000)
+        catalog = FactCatalog(path)
+
+        used: int = 0
+        texts: list[str] = []
+
+        for _ in range(3):
+            text, used = catalog.pick_fact(used)  # type: ignore
+            texts.append(text)
+
+        assert texts == ["fact 1", "fact 2", "fact 1"]
+        assert used == 1 << 1
+
+
+def _candidate(user_id: int) -> NotifyCandidate:
+    return NotifyCandidate(
+        id=user_id,
+        name=f"user{user_id}",
+        timezone="Europe/Kyiv",
+        norm=2000,
+        has_settings=True,
+        start_time=const.NOTIFY_START_TIME,
+        end_time=const.NOTIFY_END_TIME,
+        frequency=const.NOTIFY_FREQUENCY,
+        notified_at=None,
+        today_total=0,
+        last_drink_at=None,
+        local_minute=const.NOON * const.MINUTE,
+        next_due_at=None,
+    )
+
+
+class TestWaterFactsJob:
+    def _run(self, tmp_path, held: bool, delivered: list[int]) -> dict:
+        path: str = str(tmp_path / "facts.json")
+        _write_facts(path, [1, 2], 1000)
+        partition: Any = mock.Mock(
+            shards=frozenset({0}), is_held=mock.Mock(return_value=held)
+        )
+        broadcast = mock.AsyncMock(return_value=delivered)
+
+        async def run() -> dict[int, int]:
+            await model.init_db()
+            # one of the users has already seen the first fact
+            await utils.mark_facts_used({212: 1 << 1})
+
+            with mock.patch.object(
+                utils,
+                "get_notification_candidates",
+                mock.AsyncMock(
+                    return_value=[_candidate(211), _candidate(212)]
+                ),
+            ):
+                await jobs.water_facts(partition)
+
+            used_facts: dict[int, int] = await utils.get_used_facts(
+                [211, 212]
+            )
+            await model.Session.remove()
+
+            return used_facts
+
+        with mock.patch.object(facts, "catalog", FactCatalog(path)):
+            with mock.patch.object(delivery.client, "broadcast", broadcast):
+                used_facts: dict[int, int] = asyncio.run(run())
+
+        return {
+            "messages": broadcast.call_args and broadcast.call_args.args[0],
+            "used_facts": used_facts,
+        }
+
+    def test_facts_are_seen_once_delivered(self, tmp_path):
+        result: dict = self._run(tmp_path, held=True, delivered=[212])
+
+        assert result["messages"] == [
+            (211, "Цікавий факт: fact 1"),
+            (212, "Цікавий факт: fact 2"),
+        ]
+        # the message to the first user hasn't been delivered
+        assert result["used_facts"] == {212: 1 << 1 | 1 << 2}
+
+    def test_lost_lease_leaves_progress_intact(self, tmp_path):
+        result: dict = self._run(tmp_path, held=False, delivered=[])
+
+        assert result["messages"] is None
+        assert result["used_facts"] == {212: 1 << 1}
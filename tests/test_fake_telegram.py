@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils.exceptions import RetryAfter
+
+from benchmarks.telegram import FakeTelegramServer
+
+
+class TestFakeTelegramServer:
+    def test_bot_talks_to_fake_server(self):
+        async def talk() -> list:
+            server = FakeTelegramServer()
+            port: int = await server.start("127.0.0.1")
+            bot = Bot(
+                "123:abc",
+                server=TelegramAPIServer.from_base(
+                    f"http://127.0.0.1:{port}"
+                ),
+            )
+
+            try:
+                await server.push_message(42, "/today")
+                updates = await bot.get_updates(timeout=1)
+
+                await bot.send_message(42, "pong")
+                reply = await server.wait_reply(42, timeout=1)
+            finally:
+                await (await bot.get_session()).close()
+                await server.stop()
+
+            return [updates[0].message.get_command(), reply.text]
+
+        assert asyncio.run(talk()) == ["/today", "pong"]
+
+    def test_rate_limit(self):
+        async def talk() -> None:
+            server = FakeTelegramServer(rate_limit_ratio=1, retry_after=3)
+            port: int = await server.start("127.0.0.1")
+            bot = Bot(
+                "123:abc",
+                server=TelegramAPIServer.from_base(
+                    f"http://127.0.0.1:{port}"
+                ),
+            )
+
+            try:
+                await bot.send_message(42, "pong")
+            finally:
+                await (await bot.get_session()).close()
+                await server.stop()
+
+        with pytest.raises(RetryAfter):
+            asyncio.run(talk())
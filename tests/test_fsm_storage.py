@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+from unittest import mock
+
+import app.model as model
+import app.writer as writer
+import app.context as context
+from app.fsm_storage import DatabaseStorage
+
+
+class TestDatabaseStorage:
+    def test_conversation_survives_restart(self):
+        async def converse() -> list:
+            await model.init_db()
+
+            storage = DatabaseStorage(ttl=60)
+            await storage.set_state(chat=1, user=2, state="Drink:drink")
+            await storage.update_data(chat=1, user=2, amount=250)
+            await writer.queue.flush()
+
+            # a new process sees the committed changes only
+            restarted = DatabaseStorage(ttl=60)
+            results: list = [
+                await restarted.get_state(chat=1, user=2),
+                await restarted.get_data(chat=1, user=2),
+            ]
+
+            await restarted.finish(chat=1, user=2)
+            await writer.queue.flush()
+            results.append(
+                await DatabaseStorage(60).get_state(chat=1, user=2)
+            )
+
+            return results
+
+        assert asyncio.run(converse()) == [
+            "Drink:drink",
+            {"amount": 250},
+            None,
+        ]
+
+    def test_update_writes_conversation_once(self):
+        async def converse() -> list:
+            await model.init_db()
+
+            storage = DatabaseStorage(ttl=60)
+            token = context.begin()
+
+            with mock.patch.object(
+                writer.queue, "enqueue", wraps=writer.queue.enqueue
+            ) as enqueue:
+                await storage.set_state(chat=5, user=5, state="Drink:drink")
+                await storage.update_data(chat=5, user=5, amount=250)
+                await storage.commit()
+
+            context.end(token)
+            await writer.queue.flush()
+
+            return [
+                enqueue.call_count,
+                await DatabaseStorage(60).get_data(chat=5, user=5),
+            ]
+
+        assert asyncio.run(converse()) == [1, {"amount": 250}]
+
+    def test_idle_conversation_expires(self):
+        async def converse() -> list:
+            await model.init_db()
+
+            storage = DatabaseStorage(ttl=60)
+            await storage.set_state(chat=3, user=3, state="Drink:drink")
+            await writer.queue.flush()
+
+            with mock.patch("app.fsm_storage.datetime") as dt:
+                dt.utcnow.return_value = datetime(2100, 1, 1)
+                state = await storage.get_state(chat=3, user=3)
+                await storage.evict_expired()
+
+            return [state, await storage.get_state(chat=3, user=3)]
+
+        assert asyncio.run(converse()) == [None, None]
+
+    def test_racing_update_doesnt_overwrite_newer_state(self):
+        async def converse() -> list:
+            await model.init_db()
+
+            await DatabaseStorage(60).set_state(chat=7, user=7, state="Drink")
+            await writer.queue.flush()
+            both_read = asyncio.Barrier(2)
+
+            # processes of their own handle two updates of the same chat
+            async def update(amount: int, after: Optional[asyncio.Task]):
+                storage = DatabaseStorage(ttl=60)
+                token = context.begin()
+
+                await storage.get_state(chat=7, user=7)
+                await both_read.wait()
+
+                if after:
+                    await after
+
+                await storage.update_data(chat=7, user=7, amount=amount)
+                await storage.commit()
+                await writer.queue.flush()
+                context.end(token)
+
+            first = asyncio.create_task(update(250, None))
+            await update(500, first)
+
+            storage = DatabaseStorage(60)
+
+            return [
+                await storage.get_data(chat=7, user=7),
+                (await storage._read((7, 7)))["version"],
+            ]
+
+        assert asyncio.run(converse()) == [{"amount": 250}, 2]
@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+from typing import Any
+from unittest import mock
+
+import app.const as const
+import app.geocoding as geocoding
+import app.model as model
+import app.utils as utils
+import app.writer as writer
+from app.geocoding import TimezoneResolver
+
+
+GAZETTEER_PATH: str = geocoding.resolver.gazetteer_path
+
+
+class TestTimezoneResolver:
+    def test_network_lookups_are_cached(self, tmp_path):
+        cache_path: str = os.path.join(tmp_path, "cache.json")
+        resolver = TimezoneResolver(GAZETTEER_PATH, cache_path)
+
+        with mock.patch.object(
+            TimezoneResolver, "_geocode", return_value="Europe/Lisbon"
+        ) as geocode:
+            assert resolver.resolve("Coimbra") == "Europe/Lisbon"
+            assert resolver.resolve(" coimbra ") == "Europe/Lisbon"
+            assert geocode.call_count == 1
+
+        # a new process reads the cache from the disk
+        resolver = TimezoneResolver(GAZETTEER_PATH, cache_path)
+
+        with mock.patch.object(TimezoneResolver, "_geocode") as geocode:
+            assert resolver.resolve("COIMBRA") == "Europe/Lisbon"
+            assert not geocode.called
+
+
+class TestTimezoneByCity:
+    def test_slow_lookup_corrects_timezone_later(self, tmp_path):
+        resolver = TimezoneResolver(
+            GAZETTEER_PATH, os.path.join(tmp_path, "cache.json")
+        )
+
+        def slow_geocode(*args: Any) -> str:
+            time.sleep(0.2)
+            return "Europe/Lisbon"
+
+        async def register() -> tuple[str, Any]:
+            await model.init_db()
+
+            timezone: str = await utils.get_timezone_by_city_async(
+                53, "Coimbra"
+            )
+            user = model.User(
+                id=53,
+                name="test",
+                weight=70,
+                climate="помірний",
+                activity="малорухливий",
+                timezone=timezone,
+            )
+            model.Session.add(user)
+            await model.Session.commit()
+
+            # the lookup finishes in the background
+            await asyncio.sleep(0.3)
+            await asyncio.gather(*utils._corrections)
+            await writer.queue.flush()
+            await model.Session.refresh(user)
+            await model.Session.remove()
+
+            return timezone, user.timezone
+
+        with mock.patch.object(geocoding, "resolver", resolver):
+            with mock.patch.object(
+                TimezoneResolver, "_geocode", side_effect=slow_geocode
+            ):
+                with mock.patch("app.const.GEOCODING_TIMEOUT", 0.05):
+                    timezone, corrected = asyncio.run(register())
+
+        assert timezone == const.DEFAULT_TZ
+        assert corrected == "Europe/Lisbon"
+        assert not utils._corrections
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from app.membership import MembershipIndex
+
+
+class TestMembershipIndex:
+    def test_members(self):
+        index = MembershipIndex(60, 10)
+        index.load([1, 2])
+
+        assert index.lookup(1) is True
+        assert index.lookup(3) is None
+
+        index.add(3)
+        index.discard(1)
+
+        assert index.lookup(3) is True
+        assert index.lookup(1) is False
+
+    def test_misses_expire(self):
+        index = MembershipIndex(60, 10)
+        index.remember(1, False)
+
+        assert index.lookup(1) is False
+
+        with mock.patch("time.monotonic", return_value=10**9):
+            assert index.lookup(1) is None
+
+    def test_misses_are_bounded(self):
+        index = MembershipIndex(60, 2)
+
+        for user_id in range(3):
+            index.remember(user_id, False)
+
+        assert index.lookup(0) is None
+        assert index.lookup(2) is False
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, types
+
+import app.metrics as metrics
+from app.middleware import MetricsMiddleware
+
+
+class TestMetrics:
+    def test_histogram_is_rendered_with_cumulative_buckets(self):
+        registry = metrics.Registry()
+        histogram: metrics.Histogram = registry.register(
+            metrics.Histogram(
+                "test_seconds", "Test", ("handler",), buckets=(0.1, 1)
+            )
+        )
+        counter: metrics.Counter = registry.register(
+            metrics.Counter("test_total", "Test", ("result",))
+        )
+
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, handler='say "hi"')
+
+        counter.inc(result="sent")
+        counter.inc(2, result="sent")
+
+        async def scrape() -> tuple[str, str]:
+            server = metrics.MetricsServer(registry)
+
+            async with TestClient(TestServer(server.create_app())) as client:
+                response = await client.get("/metrics")
+                return response.headers["Content-Type"], await response.text()
+
+        content_type, text = asyncio.run(scrape())
+        lines: list[str] = text.splitlines()
+
+        assert content_type == "text/plain; version=0.0.4; charset=utf-8"
+
+        assert "# TYPE test_seconds histogram" in lines
+        assert (
+            'test_seconds_bucket{handler="say \\"hi\\"",le="0.1"} 1' in lines
+        )
+        assert 'test_seconds_bucket{handler="say \\"hi\\"",le="1"} 2' in lines
+        assert (
+            'test_seconds_bucket{handler="say \\"hi\\"",le="+Inf"} 3' in lines
+        )
+        assert 'test_seconds_sum{handler="say \\"hi\\""} 5.55' in lines
+        assert 'test_seconds_count{handler="say \\"hi\\""} 3' in lines
+        assert 'test_total{result="sent"} 3' in lines
+
+    def test_handler_duration_is_labeled_with_handler(self):
+        async def measured_echo(message: types.Message):
+            await asyncio.sleep(0.01)
+
+        async def process():
+            dp = Dispatcher(Bot("123:abc"))
+            dp.register_message_handler(measured_echo)
+            dp.middleware.setup(MetricsMiddleware())
+
+            await dp.process_update(
+                types.Update(
+                    **{
+                        "update_id": 1,
+                        "message": {
+                            "message_id": 1,
+                            "date": int(time.time()),
+                            "chat": {"id": 1, "type": "private"},
+                            "from": {
+                                "id": 1,
+                                "is_bot": False,
+                                "first_name": "Test",
+                            },
+                            "text": "hi",
+                        },
+                    }
+                )
+            )
+
+        asyncio.run(process())
+
+        assert (
+            'bot_handler_duration_seconds_count{handler="measured_echo"} 1'
+            in metrics.registry.render().splitlines()
+        )
+
+    def test_metric_must_render_samples(self):
+        class Untyped(metrics.Metric):
+            pass
+
+        with pytest.raises(TypeError):
+            Untyped("test", "Test", ())  # type: ignore
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import date, datetime
+from typing import Any
+from unittest import mock
+
+import pytz
+from sqlalchemy import select
+
+import app.model as model
+import app.utils as utils
+import app.timezones as timezones
+
+# drinks around the month boundary, as UTC time
+DRINKS: list[tuple[datetime, int]] = [
+    (datetime(2030, 4, 30, 20, 0), 100),
+    (datetime(2030, 4, 30, 23, 30), 200),
+    (datetime(2030, 5, 1, 2, 0), 300),
+    (datetime(2030, 5, 1, 5, 0), 400),
+    (datetime(2030, 5, 2, 12, 0), 500),
+]
+NOW: datetime = datetime(2030, 5, 2, 13, 0)
+
+
+class FrozenDatetime(datetime):
+    utcnow_value: datetime = NOW
+
+    @classmethod
+    def utcnow(cls) -> datetime:  # type: ignore
+        return cls.utcnow_value
+
+
+def _now(timezone_name: str) -> datetime:
+    return pytz.utc.localize(FrozenDatetime.utcnow_value).astimezone(
+        timezones.service.get(timezone_name)
+    )
+
+
+def _sum_drinks(drinks: list[model.Drinks], timezone: str) -> dict:
+    """Sum the drinks of the current local month the plain way"""
+    today: date = _now(timezone).date()
+    totals: dict[date, int] = {}
+
+    for drink in drinks:
+        local_date: date = (
+            pytz.utc.localize(drink.timestamp)
+            .astimezone(timezones.service.get(timezone))
+            .date()
+        )
+
+        if local_date.replace(day=1) == today.replace(day=1):
+            totals[local_date] = totals.get(local_date, 0) + drink.amount
+
+    return totals
+
+
+class TestMonthlyReport:
+    def test_month_is_aggregated_by_local_date(self):
+        users: dict[int, str] = {54: "Europe/Kyiv", 55: "America/New_York"}
+
+        async def aggregate() -> dict[int, tuple[dict, dict]]:
+            await model.init_db()
+            results: dict[int, tuple[dict, dict]] = {}
+
+            for user_id, timezone in users.items():
+                user = model.User(
+                    id=user_id,
+                    name="test",
+                    weight=70,
+                    climate="помірний",
+                    activity="малорухливий",
+                    timezone=timezone,
+                )
+                model.Session.add(user)
+                await model.Session.commit()
+
+                for drunk_at, amount in DRINKS:
+                    FrozenDatetime.utcnow_value = drunk_at
+                    await utils.update_drink_consumption(user, amount)
+
+                FrozenDatetime.utcnow_value = NOW
+                aggregated: dict[date, int] = (
+                    await utils.aggregate_monthly_data(user)
+                )
+                drinks: list[model.Drinks] = list(
+                    await model.Session.scalars(
+                        select(model.Drinks).filter(
+                            model.Drinks.user_id == user_id
+                        )
+                    )
+                )
+                results[user_id] = aggregated, _sum_drinks(drinks, timezone)
+
+            await model.Session.remove()
+
+            return results
+
+        with mock.patch.object(utils, "datetime", FrozenDatetime):
+            with mock.patch.object(timezones.service, "now", _now):
+                results = asyncio.run(aggregate())
+
+        for aggregated, summed in results.values():
+            assert aggregated == summed
+
+        # Kyiv is ahead of UTC, the night drinks belong to May there
+        assert results[54][0] == {
+            date(2030, 5, 1): 900,
+            date(2030, 5, 2): 500,
+        }
+        assert results[55][0] == {
+            date(2030, 5, 1): 400,
+            date(2030, 5, 2): 500,
+        }
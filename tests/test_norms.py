@@ -0,0 +1,41 @@
+import asyncio
+import itertools
+from typing import Optional
+
+from sqlalchemy import literal, select, types
+
+import app.const as const
+import app.model as model
+from app.norms import calculate_norm, norm_expression
+
+
+class TestNormExpression:
+    def test_expression_matches_calculation(self):
+        profiles: list[tuple[int, str, str, Optional[int]]] = list(
+            itertools.product(
+                [1, 45, 57, 70, 83, 150, 299],
+                const.CLIMATES,
+                const.ACTIVITIES,
+                [None, 0, 2500],
+            )
+        )
+
+        async def evaluate() -> list[int]:
+            async with model.engine.connect() as connection:
+                return [
+                    await connection.scalar(
+                        select(
+                            norm_expression(
+                                literal(weight, types.Integer),
+                                literal(climate, types.String),
+                                literal(activity, types.String),
+                                literal(norm, types.Integer),
+                            )
+                        )
+                    )
+                    for weight, climate, activity, norm in profiles
+                ]
+
+        assert asyncio.run(evaluate()) == [
+            calculate_norm(*profile) for profile in profiles
+        ]
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import select
+
+import app.jobs as jobs
+import app.const as const
+import app.model as model
+import app.utils as utils
+import app.timezones as timezones
+from app.types import NotifyCandidate
+
+
+NOW = datetime(2030, 1, 10, 12, 0)  # 12:00 local time in UTC
+NORM = 2000
+
+
+async def _create_user(
+    user_id: int,
+    settings: Optional[dict[str, Any]] = None,
+    total: Optional[int] = None,
+    notify: bool = True,
+):
+    model.Session.add(
+        model.User(
+            id=user_id,
+            name=f"user{user_id}",
+            weight=70,
+            climate="помірний",
+            activity="малорухливий",
+            timezone="UTC",
+            notify=notify,
+            daily_norm=NORM,
+        )
+    )
+
+    if settings is not None:
+        model.Session.add(
+            model.NotificationSettings(user_id=user_id, **settings)
+        )
+
+    if total is not None:
+        model.Session.add(
+            model.DailyTotal(
+                user_id=user_id,
+                local_date=NOW.date(),
+                total_ml=total,
+                count=1,
+                last_drink_at=NOW - timedelta(hours=3),
+            )
+        )
+
+    await model.Session.commit()
+
+
+class TestNotificationCandidates:
+    def test_reminder_rules(self):
+        long_ago: dict[str, Any] = {"notified_at": NOW - timedelta(days=1)}
+
+        async def scan() -> dict[int, NotifyCandidate]:
+            await model.init_db()
+
+            await _create_user(101)  # no settings, didn't drink
+            await _create_user(
+                102,
+                {"frequency": 60, "notified_at": NOW - timedelta(minutes=30)},
+            )
+            await _create_user(
+                103, {"start_time": 13 * 60, "end_time": 22 * 60}
+            )
+            await _create_user(104, long_ago, total=NORM)
+            await _create_user(105, long_ago, total=NORM // 2)
+            await _create_user(106, notify=False)
+
+            candidates: list[NotifyCandidate] = (
+                await utils.get_notification_candidates(
+                    clock=timezones.service.clock(NOW)
+                )
+            )
+            await model.Session.remove()
+
+            return {c["id"]: c for c in candidates if c["id"] > 100}
+
+        candidates: dict[int, NotifyCandidate] = asyncio.run(scan())
+        reminders: dict[int, Optional[str]] = {
+            user_id: jobs._check_candidate(candidate, NOW)
+            for user_id, candidate in candidates.items()
+        }
+
+        assert sorted(candidates) == [101, 102, 103, 104, 105]
+        assert not candidates[101]["has_settings"]
+        assert candidates[101]["frequency"] == const.NOTIFY_FREQUENCY
+        assert candidates[105]["today_total"] == NORM // 2
+        assert "ще не пили" in reminders[101]  # type: ignore
+        assert reminders[102] is None  # notified recently
+        assert reminders[103] is None  # quiet hours
+        assert reminders[104] is None  # the norm is reached
+        assert "не пили вже 3" in reminders[105]  # type: ignore
+
+    def test_settings_are_initialized_once(self):
+        async def notify_twice() -> list[model.NotificationSettings]:
+            await model.init_db()
+            await _create_user(111)
+
+            candidates: list[NotifyCandidate] = [
+                c
+                for c in await utils.get_notification_candidates(
+                    clock=timezones.service.clock(NOW)
+                )
+                if c["id"] == 111
+            ]
+
+            # another process hasn't seen the settings created by this one
+            await utils.mark_notified(candidates, NOW)
+            await utils.mark_notified(candidates, NOW + timedelta(hours=1))
+
+            settings: list[model.NotificationSettings] = list(
+                await model.Session.scalars(
+                    select(model.NotificationSettings).filter(
+                        model.NotificationSettings.user_id == 111
+                    )
+                )
+            )
+            await model.Session.remove()
+
+            return settings
+
+        settings: list[model.NotificationSettings] = asyncio.run(
+            notify_twice()
+        )
+
+        assert len(settings) == 1
+        assert settings[0].notified_at == NOW + timedelta(hours=1)
+        assert settings[0].frequency == const.NOTIFY_FREQUENCY
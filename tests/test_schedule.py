@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+import pytest
+
+import app.const as const
+import app.model as model
+import app.utils as utils
+import app.writer as writer
+import app.timezones as timezones
+from app.types import NotifyCandidate
+
+
+def _candidate(
+    timezone: str = "Europe/Kyiv", **values: Any
+) -> NotifyCandidate:
+    return NotifyCandidate(
+        **{  # type: ignore
+            "id": 1,
+            "name": "test",
+            "timezone": timezone,
+            "norm": 2000,
+            "has_settings": True,
+            "start_time": const.NOTIFY_START_TIME,  # 8:00
+            "end_time": const.NOTIFY_END_TIME,  # 22:00
+            "frequency": const.NOTIFY_FREQUENCY,
+            "notified_at": None,
+            "today_total": 0,
+            "last_drink_at": None,
+            "local_minute": 0,
+            "next_due_at": None,
+            **values,
+        }
+    )
+
+
+def _next_due_at(utcnow: datetime, **values: Any) -> datetime:
+    return utils.calculate_next_due_at(
+        _candidate(**values), timezones.service.clock(utcnow)
+    )
+
+
+class TestNextDueAt:
+    def test_due_in_range_is_kept(self):
+        # 12:00 in Kyiv, the frequency has passed since the last reminder
+        now: datetime = datetime(2030, 1, 10, 10, 0)
+
+        assert _next_due_at(
+            now, notified_at=now - timedelta(minutes=10)
+        ) == datetime(2030, 1, 10, 10, 6)
+
+    @pytest.mark.parametrize(
+        "now, values, due_at",
+        [
+            # 5:00 in Kyiv, before the range start
+            (datetime(2030, 1, 10, 3, 0), {}, datetime(2030, 1, 10, 6, 0)),
+            # the drink reminder would be at 23:30 in Kyiv, after the end
+            (
+                datetime(2030, 1, 10, 19, 30),
+                {
+                    "last_drink_at": datetime(2030, 1, 10, 19, 30),
+                    "today_total": 500,
+                },
+                datetime(2030, 1, 11, 6, 0),
+            ),
+        ],
+    )
+    def test_due_out_of_range_moves_to_range_start(
+        self, now: datetime, values: dict[str, Any], due_at: datetime
+    ):
+        assert _next_due_at(now, **values) == due_at
+
+    @pytest.mark.parametrize(
+        "now, due_at",
+        [
+            # 23:00 in Tokyo, 8:00 of the next day is 23:00 UTC of today
+            (datetime(2030, 1, 10, 14, 0), datetime(2030, 1, 10, 23, 0)),
+            # 8:30 in Tokyo, still 2030-01-10 in UTC
+            (datetime(2030, 1, 10, 23, 30), datetime(2030, 1, 10, 23, 30)),
+        ],
+    )
+    def test_range_past_utc_midnight(self, now: datetime, due_at: datetime):
+        assert _next_due_at(now, timezone="Asia/Tokyo") == due_at
+
+    def test_norm_reached_waits_for_next_day(self):
+        now: datetime = datetime(2030, 1, 10, 10, 0)
+
+        assert _next_due_at(
+            now, last_drink_at=now, today_total=2000
+        ) == datetime(2030, 1, 11, 6, 0)
+
+    def test_dst_transition(self):
+        # Kyiv moves from UTC+2 to UTC+3 in the night to 2030-03-31
+        now: datetime = datetime(2030, 3, 30, 10, 0)
+
+        assert _next_due_at(
+            now, last_drink_at=now, today_total=2000
+        ) == datetime(2030, 3, 31, 5, 0)
+
+    def test_notifications_off_drops_schedule(self):
+        async def toggle() -> list[Optional[datetime]]:
+            await model.init_db()
+
+            user = model.User(
+                id=301,
+                name="test",
+                weight=70,
+                climate="помірний",
+                activity="малорухливий",
+                next_due_at=datetime(2030, 1, 10, 10, 0),
+            )
+            model.Session.add(user)
+            await model.Session.commit()
+
+            due_at: list[Optional[datetime]] = []
+
+            for _ in range(2):
+                await user.toggle_notifications()
+                await writer.queue.flush()
+                await model.Session.refresh(user)
+                due_at.append(user.next_due_at)
+
+            await model.Session.remove()
+
+            return due_at
+
+        # the job evaluates the user again once they're back
+        assert asyncio.run(toggle()) == [None, None]
+
+    def test_reset_during_tick_isnt_overwritten(self):
+        seen_at: datetime = datetime(2030, 1, 10, 10, 0)
+        due_at: datetime = datetime(2030, 1, 10, 12, 0)
+
+        async def tick() -> list[Optional[datetime]]:
+            await model.init_db()
+
+            users: list[model.User] = [
+                model.User(
+                    id=user_id,
+                    name="test",
+                    weight=70,
+                    climate="помірний",
+                    activity="малорухливий",
+                    next_due_at=next_due_at,
+                )
+                for user_id, next_due_at in ((302, seen_at), (303, None))
+            ]
+            model.Session.add_all(users)
+            await model.Session.commit()
+
+            candidates: list[NotifyCandidate] = [
+                _candidate(id=user.id, next_due_at=user.next_due_at)
+                for user in users
+            ]
+
+            # the settings of the first user change while the tick runs
+            await writer.queue.enqueue(
+                302, writer.execute(model.User.reset_schedule_query(302))
+            )
+            await writer.queue.flush()
+
+            await utils.schedule_notifications(
+                candidates, {302: due_at, 303: due_at}
+            )
+
+            for user in users:
+                await model.Session.refresh(user)
+
+            await model.Session.remove()
+
+            return [user.next_due_at for user in users]
+
+        assert asyncio.run(tick()) == [None, due_at]
@@ -0,0 +1,22 @@
+from datetime import date, datetime
+
+import app.timezones as timezones
+
+
+class TestClock:
+    def test_local_time(self):
+        clock = timezones.service.clock(datetime(2023, 7, 1, 21, 30))
+
+        assert clock.local_date("Europe/Kyiv") == date(2023, 7, 2)
+        assert clock.minute_of_day("Europe/Kyiv") == 30
+        assert clock.local_date("America/New_York") == date(2023, 7, 1)
+        assert clock.minute_of_day("America/New_York") == 17 * 60 + 30
+
+    def test_day_bounds_with_dst(self):
+        # the clocks were moved forward on the 26th of March in Kyiv
+        clock = timezones.service.clock(datetime(2023, 3, 26, 12))
+
+        assert clock.day_bounds("Europe/Kyiv") == (
+            datetime(2023, 3, 25, 22),
+            datetime(2023, 3, 26, 21),
+        )
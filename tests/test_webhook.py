@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import Any
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, types
+
+import app.const as const
+from app.webhook import SECRET_HEADER, WebhookServer
+
+
+def _update(update_id: int, text: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+class TestWebhookServer:
+    def test_updates_are_processed_concurrently(self):
+        received: list[str] = []
+        running: list[int] = [0, 0]  # now, max
+
+        async def echo(message: types.Message):
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0.01)
+            received.append(message.text)
+            running[0] -= 1
+
+        async def post_updates() -> list[int]:
+            dp = Dispatcher(Bot("123:abc"))
+            dp.register_message_handler(echo)
+            server = WebhookServer(dp, concurrency=2, secret="secret")
+
+            async with TestClient(TestServer(server.create_app())) as client:
+                statuses: list[int] = []
+
+                for i in range(5):
+                    response = await client.post(
+                        const.WEBHOOK_PATH,
+                        json=_update(i, str(i)),
+                        headers={SECRET_HEADER: "secret"},
+                    )
+                    statuses.append(response.status)
+
+                response = await client.post(
+                    const.WEBHOOK_PATH, json=_update(5, "5")
+                )
+                statuses.append(response.status)
+
+                await server.join()
+
+            return statuses
+
+        statuses: list[int] = asyncio.run(post_updates())
+
+        assert statuses == [200] * 5 + [403]
+        assert sorted(received) == ["0", "1", "2", "3", "4"]
+        assert running[1] == 2
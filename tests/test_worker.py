@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import app.model as model
+from app.worker import ShardWorker
+
+
+class TestShardWorker:
+    def test_workers_split_shards(self):
+        async def run() -> list:
+            await model.init_db()
+
+            first = ShardWorker(shards=4, lease_ttl=30, renew_interval=10)
+            second = ShardWorker(shards=4, lease_ttl=30, renew_interval=10)
+            await first._create_leases()
+
+            await first.maintain()
+            alone: frozenset = first._held
+
+            # the first one gives away a half once it sees the second one
+            await second.maintain()
+            await first.maintain()
+            await second.maintain()
+
+            shards: list = [alone, first._held, second._held]
+
+            await first.release()
+            await second.release()
+
+            return shards
+
+        alone, first, second = asyncio.run(run())
+
+        assert alone == {0, 1, 2, 3}
+        assert len(first) == len(second) == 2
+        assert first | second == {0, 1, 2, 3}
+
+    def test_dead_worker_shards_are_taken_over(self):
+        async def run() -> list:
+            await model.init_db()
+
+            dead = ShardWorker(shards=2, lease_ttl=30, renew_interval=10)
+            alive = ShardWorker(shards=2, lease_ttl=30, renew_interval=10)
+            await dead._create_leases()
+
+            await dead.maintain()
+            await alive.maintain()
+            before: frozenset = alive._held
+
+            with mock.patch("app.worker.datetime") as dt:
+                dt.utcnow.return_value = datetime.utcnow() + timedelta(
+                    minutes=1
+                )
+                await alive.maintain()
+
+            after: frozenset = alive._held
+            partition = alive.partition()
+            held: bool = bool(partition and partition.is_held())
+
+            await alive.release()
+
+            return [before, after, held]
+
+        assert asyncio.run(run()) == [frozenset(), {0, 1}, True]
@@ -0,0 +1,204 @@
+import asyncio
+import sqlite3
+from typing import Any, Optional
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+import app.metrics as metrics
+from app.writer import Operation, WriteBehindQueue
+
+
+class FakeSession:
+    """Records the operations of the committed transactions"""
+
+    def __init__(self, commits: list[list[str]]):
+        self.applied: list[str] = []
+        self._commits: list[list[str]] = commits
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *args: Any):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def commit(self):
+        self._commits.append(self.applied)
+
+
+def _queue(max_batch: int = 10, max_delay: float = 60) -> tuple:
+    commits: list[list[str]] = []
+    queue = WriteBehindQueue(max_batch, max_delay)
+    queue.setup(lambda: FakeSession(commits))  # type: ignore
+
+    return queue, commits
+
+
+def _write(
+    name: str, error: Optional[Exception] = None, failures: int = 1000
+) -> Operation:
+    """Make an operation that fails with the `error` the first `failures`
+    times"""
+    attempts: list[int] = []
+
+    async def operation(session: Any):
+        attempts.append(1)
+
+        if error and len(attempts) <= failures:
+            raise error
+
+        await asyncio.sleep(0)
+        session.applied.append(name)
+
+    return operation
+
+
+class TestWriteBehindQueue:
+    def test_full_batch_is_committed_at_once(self):
+        async def write() -> list:
+            queue, commits = _queue(max_batch=3)
+
+            for i in range(4):
+                await queue.enqueue(i, _write(str(i)))
+
+            return commits
+
+        assert asyncio.run(write()) == [["0", "1", "2"]]
+
+    def test_batch_is_committed_after_delay(self):
+        async def write() -> list:
+            queue, commits = _queue(max_delay=0.01)
+
+            await queue.enqueue(1, _write("1"))
+            await queue.enqueue(2, _write("2"))
+            before: list = list(commits)
+            await asyncio.sleep(0.05)
+
+            return [before, commits]
+
+        assert asyncio.run(write()) == [[], [["1", "2"]]]
+
+    def test_read_waits_for_writes_of_user(self):
+        async def write() -> list:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, _write("1"))
+            await queue.enqueue(None, _write("anonymous"))
+
+            await queue.sync(2)
+            other_user: list = list(commits)
+            await queue.sync(1)
+
+            return [other_user, commits]
+
+        assert asyncio.run(write()) == [[], [["1", "anonymous"]]]
+
+    def test_failed_batch_is_retried_one_by_one(self):
+        async def write() -> list:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, _write("1"))
+            await queue.enqueue(2, _write("2", ValueError()))
+            await queue.enqueue(3, _write("3"))
+            await queue.flush()
+
+            return commits
+
+        assert asyncio.run(write()) == [["1"], ["3"]]
+
+    def test_locked_database_is_retried(self):
+        locked = OperationalError(
+            "INSERT", {}, sqlite3.OperationalError("database is locked")
+        )
+        attempts: list[int] = []
+
+        def write_once_unlocked() -> Operation:
+            async def operation(session: Any):
+                attempts.append(1)
+
+                if len(attempts) == 1:
+                    raise locked
+
+                session.applied.append("1")
+
+            return operation
+
+        async def write() -> list:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, write_once_unlocked())
+            await queue.flush()
+
+            return commits
+
+        with mock.patch("app.const.WRITE_RETRY_DELAY", 0):
+            assert asyncio.run(write()) == [["1"]]
+
+        assert len(attempts) == 2
+
+    def test_shutdown_flush_commits_pending_writes(self):
+        async def write() -> list:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, _write("1"))
+            # the bot flushes the queue on the way out
+            await queue.flush()
+            await queue.flush()
+
+            return [commits, queue._timer]
+
+        assert asyncio.run(write()) == [[["1"]], None]
+
+    def test_passing_failure_is_requeued(self):
+        async def write() -> list:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, _write("1", ConnectionError(), 2))
+            await queue.enqueue(2, _write("2"))
+            await queue.flush()
+            # the failed write is kept for the reads of the user
+            requeued: bool = 1 in queue._queued
+            await queue.sync(1)
+
+            return [requeued, commits]
+
+        # the batch fails, then the write fails alone
+        assert asyncio.run(write()) == [True, [["2"], ["1"]]]
+
+    def test_broken_write_is_dropped(self):
+        dropped: float = metrics.writes_dropped._values.get((), 0)
+
+        async def write() -> tuple:
+            queue, commits = _queue()
+
+            await queue.enqueue(1, _write("1", ValueError()))
+            await queue.enqueue(1, _write("2", ConnectionError()))
+            await queue.close()
+
+            return queue, commits
+
+        queue, commits = asyncio.run(write())
+
+        assert commits == []
+        assert [(u, f) for _, u, f in queue.dead_letters] == [(1, 1), (1, 4)]
+        assert metrics.writes_dropped._values[()] - dropped == 2
+
+    def test_delayed_flush_is_awaited_on_close(self):
+        async def slow_write(session: Any):
+            await asyncio.sleep(0.05)
+            session.applied.append("1")
+
+        async def write() -> list:
+            queue, commits = _queue(max_delay=0.01)
+
+            await queue.enqueue(1, slow_write)
+            await asyncio.sleep(0.015)
+            started: bool = queue._flush_task is not None
+            await queue.close()
+
+            return [started, commits, queue._flush_task]
+
+        assert asyncio.run(write()) == [True, [["1"]], None]